@@ -2,15 +2,30 @@ name = "abacat"
 
 from abacat.genome import Genome, from_fasta, from_json
 from abacat.abacat_helper import get_records, is_fasta, is_fasta_wrapper, timer_wrapper
-from abacat.prodigal import Prodigal, run
+from abacat.prodigal import Prodigal, run, parse_cds, parse_scores, training_stats
 from abacat.config import CONFIG, pathways
 from abacat.deprecated import (
     prokka,
     ffn_parser,
     ls_and_decompress,
+    ls_and_decompress_dirs,
     parse_assembly_report,
     rename_assembly,
     dict_from_report,
+    aggregate_reports,
+    write_reports,
 )
 from abacat.data import data_dir, genomes_dir, local_db_dir
 from abacat.dendrogram import ANIDendrogram
+from abacat.collection import GenomeCollection, from_directory
+from abacat.pangenome import ProteinClusters, cluster_proteins
+from abacat.kmers import KmerIndex, load_index
+from abacat.megares import resistance_summary, resistance_matrix
+from abacat.shared import SharedSeqSet, shared
+from abacat.database import BlastDatabase, update_databases
+from abacat.memory import SeqSet, memory_stats
+from abacat.ani import SparseANI, ANIMatrix, read_fastani, cluster_fastani
+from abacat.sketch import SketchIndex, genome_sketch
+from abacat.duplicates import find_duplicates
+from abacat.phenotypes import pathway_completeness
+from abacat.aligners import get_aligner, read_alignments
@@ -1,7 +1,14 @@
 from Bio import SeqIO
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+import os
+import json
+import socket
+import hashlib
 import datetime
 import time
 import logging
+import threading
+from contextlib import contextmanager
 
 
 def is_fasta(file):
@@ -53,12 +60,14 @@ def timer_wrapper(func):
     def wrapper(*args, **kwargs):
         start = time.time()
 
-        func(*args, **kwargs)
+        result = func(*args, **kwargs)
 
         end = time.time()
         delta = str(datetime.timedelta(seconds=end - start))
         logging.info(f"Took {delta}")
 
+        return result
+
     return wrapper
 
 
@@ -75,3 +84,238 @@ def get_records(fasta_file, kind="gen"):
             logging.info(f"Specified {kind} kind. Please specify a valid kind.")
 
     return records
+
+
+def read_hits(hits_file):
+    """
+    :param hits_file: A .hits file written by Genome.blast_seqs.
+    :return: Dict of gene ids as keys and hit descriptions as values.
+    """
+    hits = dict()
+    with open(hits_file) as f:
+        for line in f:
+            id_, _, hit = line.rstrip("\n").partition(" ")
+            hits[id_] = hit
+
+    return hits
+
+
+def dedup_fasta(fasta_files, out, prefixes=None):
+    """
+    Writes each distinct sequence of FASTA files once, under the header of its first occurrence,
+    so a search only has to look at it once. Sequences are compared by a 16 byte hash.
+
+    :param fasta_files: List of FASTA files.
+    :param out: Output FASTA file.
+    :param prefixes: Prefixes of the ids of each file, e.g. genome names. Joined to the header as given.
+    :return: List of (id, representative id) tuples for every input sequence, in input order.
+    """
+    prefixes = prefixes or [""] * len(fasta_files)
+    # Sequence hashes as keys, id of the first occurrence as values.
+    representatives = dict()
+    members = []
+    try:
+        with open(out, "w", buffering=2 ** 20) as f:
+            for fasta_file, prefix in zip(fasta_files, prefixes):
+                with open(fasta_file) as handle:
+                    for header, seq in SimpleFastaParser(handle):
+                        header = prefix + header
+                        id_ = header.split(None, 1)[0]
+                        digest = hashlib.blake2b(
+                            seq.upper().encode(), digest_size=16
+                        ).digest()
+                        if digest not in representatives:
+                            representatives[digest] = id_
+                            f.write(f">{header}\n{seq}\n")
+                        members.append((id_, representatives[digest]))
+    except Exception:
+        os.remove(out)
+        raise
+
+    stats = dedup_stats(members)
+    logging.info(
+        f"{stats['unique']} unique of {stats['queries']} sequences "
+        f"(dedup ratio {stats['dedup_ratio']:.2f})."
+    )
+
+    return members
+
+
+def fan_out(hits, members):
+    """
+    Gives the hits of each representative sequence to every sequence it stands for.
+
+    :param hits: Iterable of (representative id, hit) tuples.
+    :param members: List from dedup_fasta.
+    :return: Generator of (id, hit) tuples, in the order of members.
+    """
+    hits = dict(hits)
+    for id_, representative in members:
+        if representative in hits:
+            yield id_, hits[representative]
+
+
+def dedup_stats(members):
+    """
+    :param members: List from dedup_fasta.
+    :return: Dict with the number of queries, unique queries and their ratio.
+    """
+    unique = len(set(i for _, i in members))
+    return {
+        "queries": len(members),
+        "unique": unique,
+        "dedup_ratio": len(members) / unique if unique else 1.0,
+    }
+
+
+class UnionFind:
+    """
+    Disjoint sets over the integers 0..n-1, with path halving and union by size.
+    Grows as needed when find() or union() is given a larger integer.
+    """
+
+    def __init__(self, n=0):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def __len__(self):
+        return len(self.parent)
+
+    def grow(self, n):
+        if n > len(self.parent):
+            self.size += [1] * (n - len(self.parent))
+            self.parent += range(len(self.parent), n)
+
+    def find(self, i):
+        if i >= len(self.parent):
+            self.grow(i + 1)
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return i
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        return i
+
+    def labels(self):
+        """
+        :return: List with the root of each element.
+        """
+        return [self.find(i) for i in range(len(self.parent))]
+
+
+def acquire_lock(lock_file, stale_after=None):
+    """
+    Creates lock_file if no other process holds it. Works across hosts on a shared directory.
+    A lock is stale, and taken over, if its process is gone from this host, or if it is
+    older than stale_after seconds.
+
+    :return: True if the lock was acquired.
+    """
+    owner = {"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}
+    for _ in range(2):
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(lock_file) as f:
+                    holder = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue  # Released, or still being written
+            gone = holder["host"] == owner["host"] and not pid_alive(holder["pid"])
+            old = stale_after is not None and time.time() - holder["time"] > stale_after
+            if not (gone or old):
+                return False
+            logging.warning(f"Taking over stale lock {lock_file} of {holder}.")
+            release_lock(lock_file)
+            continue
+        with os.fdopen(fd, "w") as f:
+            json.dump(owner, f)
+        return True
+
+    return False
+
+
+def refresh_lock(lock_file):
+    """
+    Updates the time of a lock held by this process, so other hosts do not take it over as stale.
+
+    :return: True if the lock is still held by this process.
+    """
+    owner = {"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}
+    try:
+        with open(lock_file) as f:
+            holder = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    if (holder["host"], holder["pid"]) != (owner["host"], owner["pid"]):
+        return False
+    tmp = f"{lock_file}.{owner['host']}.{owner['pid']}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(owner, f)
+    os.replace(tmp, lock_file)
+
+    return True
+
+
+@contextmanager
+def heartbeat(lock_file, interval=60):
+    """
+    Refreshes a held lock every interval seconds for the duration of a with block. Pair it with
+    acquire_lock(lock_file, stale_after=a few intervals), so locks of crashed hosts are taken over.
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            refresh_lock(lock_file)
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield lock_file
+    finally:
+        stop.set()
+        thread.join()
+
+
+def release_lock(lock_file):
+    try:
+        os.remove(lock_file)
+    except FileNotFoundError:
+        pass
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Alive, owned by another user
+
+    return True
+
+
+@contextmanager
+def file_lock(lock_file, timeout=600, poll=0.1):
+    """
+    Holds lock_file for the duration of a with block, waiting for other holders.
+    """
+    start = time.time()
+    while not acquire_lock(lock_file, stale_after=timeout):
+        if time.time() - start > timeout:
+            raise TimeoutError(f"Could not lock {lock_file} in {timeout} s.")
+        time.sleep(poll)
+    try:
+        yield lock_file
+    finally:
+        release_lock(lock_file)
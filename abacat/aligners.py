@@ -0,0 +1,348 @@
+"""
+Aligner backends of Genome.blast_seqs and GenomeCollection.blast_seqs.
+
+BLAST searches large protein databases like COG slowly, and DIAMOND or MMseqs2 find
+the same best hits in a fraction of the time. Every backend writes the same tabular
+hits, one row per alignment with the columns of HIT_COLUMNS, i.e. BLAST's -outfmt 6
+columns and the title of the subject. Hits of each query come together, best first,
+and best_hits() streams the best one of each query into the annotation files.
+
+The backend of each database is picked in CONFIG["aligner"]:
+
+    CONFIG["aligner"]["backend"] = "blast"  # Default of all databases
+    CONFIG["aligner"]["by_db"]["COG"] = "diamond"
+
+Example:
+    aligner = get_aligner("COG", blast="p")
+    aligner.search("genes.faa", "genes_COG_diamond.tsv")
+    read_alignments("genes_COG_diamond.tsv")  # Dataframe of HIT_COLUMNS
+"""
+
+import os
+import csv
+import shutil
+import logging
+import itertools
+import subprocess
+import pandas as pd
+from abacat.config import CONFIG
+from abacat.database import BlastDatabase
+
+logger = logging.getLogger(__name__)
+
+# Search modes by the names blast_seqs takes: nucleotide, protein and translated queries.
+NUCLEOTIDE_QUERIES = ("n", "nucl", "nucleotide", "blastn")
+PROTEIN_QUERIES = ("p", "prot", "protein", "blastp")
+TRANSLATED_QUERIES = ("x", "blastx")
+
+# Columns of the tabular hits of every backend.
+HIT_COLUMNS = (
+    "query",
+    "subject",
+    "pident",
+    "length",
+    "mismatch",
+    "gapopen",
+    "qstart",
+    "qend",
+    "sstart",
+    "send",
+    "evalue",
+    "bitscore",
+    "title",
+)
+
+# Output fields of BLAST and DIAMOND for HIT_COLUMNS.
+BLAST_FIELDS = (
+    "qseqid",
+    "sseqid",
+    "pident",
+    "length",
+    "mismatch",
+    "gapopen",
+    "qstart",
+    "qend",
+    "sstart",
+    "send",
+    "evalue",
+    "bitscore",
+    "stitle",
+)
+
+
+def search_mode(blast):
+    """
+    :param blast: 'blastn', 'blastp' or 'blastx', or their short names.
+    :return: 'n', 'p' or 'x'.
+    """
+    for mode, names in zip(
+        "npx", (NUCLEOTIDE_QUERIES, PROTEIN_QUERIES, TRANSLATED_QUERIES)
+    ):
+        if blast in names:
+            return mode
+
+    raise Exception("Choose a valid option from 'blastn', 'blastp' or 'blastx'.")
+
+
+def is_stale(source, index_file):
+    """
+    :param source: FASTA of a database.
+    :param index_file: A file written when indexing it.
+    :return: True if the index is missing or older than the FASTA.
+    """
+    if not os.path.isfile(source):
+        if not os.path.isfile(index_file):
+            raise FileNotFoundError(
+                f"Database has neither a FASTA nor an index at {source}."
+            )
+        return False  # Prebuilt index, there is nothing to build it from.
+
+    return (
+        not os.path.isfile(index_file)
+        or os.stat(source).st_mtime > os.stat(index_file).st_mtime
+    )
+
+
+class Aligner:
+    """
+    Aligner, a search of queries against a database of CONFIG["db"] that writes tabular hits.
+    Backends set name and modes, and build their index and command line in prepare() and command().
+    """
+
+    name = None
+    modes = "npx"  # Search modes of the backend, see search_mode()
+
+    def __init__(
+        self,
+        db,
+        blast="n",
+        evalue=CONFIG["blast"]["evalue"],
+        threads=CONFIG["threads"],
+        max_hits=CONFIG["aligner"]["max_hits"],
+    ):
+        """
+        :param db: From config.py db
+        :param blast: 'blastn', 'blastp' or 'blastx'.
+        :param evalue: evalue to use in the search.
+        :param threads: Number of threads of the search.
+        :param max_hits: Number of hits kept for each query.
+        """
+        super(Aligner, self).__init__()
+        self.db = db
+        self.path = CONFIG["db"][db]
+        self.mode = search_mode(blast)
+        if self.mode not in self.modes:
+            raise ValueError(f"{self.name} does not run {blast} searches.")
+        self.evalue = evalue
+        self.threads = threads
+        self.max_hits = max_hits
+        self.options = list(CONFIG["aligner"]["options"].get(self.name, []))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.db!r}, {self.mode!r})"
+
+    def prepare(self):
+        """
+        Indexes the database if its index is missing or stale.
+        :return: Database path as given to the search.
+        """
+        raise NotImplementedError
+
+    def command(self, query, target, out):
+        """
+        :param query: FASTA file of the queries.
+        :param target: Database path from prepare().
+        :param out: Output file of the tabular hits.
+        :return: Command line as a list of arguments.
+        """
+        raise NotImplementedError
+
+    def search(self, query, out):
+        """
+        :param query: FASTA file of the queries.
+        :param out: Output file of the tabular hits.
+        :return: out.
+        """
+        cmd = self.command(query, self.prepare(), out)
+        logger.info(f"Searching {query} against {self.db} with {self.name}.")
+        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+        return out
+
+
+class BlastAligner(Aligner):
+    """
+    NCBI BLAST+, with the database indexed by makeblastdb through BlastDatabase.
+    """
+
+    name = "blast"
+    programs = {"n": "blastn", "p": "blastp", "x": "blastx"}
+
+    def prepare(self):
+        # Index the database if its FASTA is new, so Blast does not search stale data.
+        BlastDatabase(self.db).update()
+        return self.path
+
+    def command(self, query, target, out):
+        cmd = [
+            self.programs[self.mode],
+            "-query",
+            query,
+            "-db",
+            target,
+            "-out",
+            out,
+            "-outfmt",
+            " ".join(("6",) + BLAST_FIELDS),
+            "-evalue",
+            str(self.evalue),
+            "-max_target_seqs",
+            str(self.max_hits),
+            "-num_threads",
+            str(self.threads),
+        ]
+        if CONFIG["blast"]["dbsize"]:
+            cmd += ["-dbsize", str(CONFIG["blast"]["dbsize"])]
+
+        return cmd + self.options
+
+
+class DiamondAligner(Aligner):
+    """
+    DIAMOND, for protein databases. Its index is <db>.dmnd, next to the FASTA.
+    """
+
+    name = "diamond"
+    modes = "px"
+    programs = {"p": "blastp", "x": "blastx"}
+
+    def prepare(self):
+        index = self.path + ".dmnd"
+        if is_stale(self.path, index):
+            logger.info(f"Building DIAMOND database {self.db} from {self.path}.")
+            subprocess.run(
+                ["diamond", "makedb", "--in", self.path, "--db", index],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=True,
+            )
+
+        return index
+
+    def command(self, query, target, out):
+        return [
+            "diamond",
+            self.programs[self.mode],
+            "--query",
+            query,
+            "--db",
+            target,
+            "--out",
+            out,
+            "--outfmt",
+            "6",
+            *BLAST_FIELDS,
+            "--evalue",
+            str(self.evalue),
+            "--max-target-seqs",
+            str(self.max_hits),
+            "--threads",
+            str(self.threads),
+        ] + self.options
+
+
+class MMseqsAligner(Aligner):
+    """
+    MMseqs2 easy-search. Its database is <db>.mmseqs, next to the FASTA.
+    """
+
+    name = "mmseqs"
+    search_types = {"n": "3", "p": "1", "x": "2"}
+
+    def prepare(self):
+        index = self.path + ".mmseqs"
+        if is_stale(self.path, index + ".dbtype"):
+            logger.info(f"Building MMseqs2 database {self.db} from {self.path}.")
+            subprocess.run(
+                ["mmseqs", "createdb", self.path, index],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=True,
+            )
+
+        return index
+
+    def command(self, query, target, out):
+        return [
+            "mmseqs",
+            "easy-search",
+            query,
+            target,
+            out,
+            out + ".tmp",
+            "--format-output",
+            "query,target,pident,alnlen,mismatch,gapopen,qstart,qend,tstart,tend,"
+            "evalue,bits,theader",
+            "--search-type",
+            self.search_types[self.mode],
+            "-e",
+            str(self.evalue),
+            "--max-accept",
+            str(self.max_hits),
+            "--threads",
+            str(self.threads),
+        ] + self.options
+
+    def search(self, query, out):
+        try:
+            return super(MMseqsAligner, self).search(query, out)
+        finally:
+            shutil.rmtree(out + ".tmp", ignore_errors=True)
+
+
+BACKENDS = dict((i.name, i) for i in (BlastAligner, DiamondAligner, MMseqsAligner))
+
+
+def get_aligner(db, blast="n", backend=None, **kwargs):
+    """
+    :param db: From config.py db
+    :param blast: 'blastn', 'blastp' or 'blastx'.
+    :param backend: 'blast', 'diamond' or 'mmseqs'. Default is the one of db in CONFIG["aligner"].
+    :param kwargs: evalue, threads and max_hits of the Aligner.
+    :return: Aligner instance.
+    """
+    backend = backend or CONFIG["aligner"]["by_db"].get(
+        db, CONFIG["aligner"]["backend"]
+    )
+    if backend not in BACKENDS:
+        raise Exception(f"Choose a valid aligner from {', '.join(BACKENDS)}.")
+
+    return BACKENDS[backend](db, blast=blast, **kwargs)
+
+
+def read_alignments(hits_file):
+    """
+    :param hits_file: Tabular hits of an Aligner.
+    :return: Dataframe with the columns of HIT_COLUMNS.
+    """
+    return pd.read_csv(
+        hits_file,
+        sep="\t",
+        header=None,
+        names=list(HIT_COLUMNS),
+        dtype={"query": str, "subject": str, "title": str},
+        quoting=csv.QUOTE_NONE,
+    )
+
+
+def best_hits(hits_file):
+    """
+    :param hits_file: Tabular hits of an Aligner.
+    :return: Generator of (query id, title of the best hit) tuples, for queries with hits, in the
+             order of the file. The best hit has the highest bit score, the first one on ties.
+    """
+    with open(hits_file) as f:
+        rows = (line.rstrip("\n").split("\t") for line in f if line.strip())
+        for query, hits in itertools.groupby(rows, key=lambda row: row[0]):
+            best = max(hits, key=lambda row: float(row[11]))
+            yield query, best[12] if len(best) > 12 else best[1]
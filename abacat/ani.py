@@ -0,0 +1,462 @@
+"""
+Sparse ANI matrices read from fastANI outputs.
+
+fastANI writes one line per query and reference pair, and leaves out pairs under ~80%
+ANI. For thousands of genomes the output has millions of lines, but most pairs are
+missing. read_fastani streams the output in chunks into a sparse symmetric matrix with
+a label index, so memory grows with the pairs found rather than with the lines, and
+clustering runs on the sparse matrix without a dense copy.
+
+Example:
+    ani = read_fastani("ani_output/fastani_out_3000")
+    ani.matrix  # CSR matrix of mean ANI of both directions, 0 for missing pairs
+    ani.clusters(min_ani=95)  # Series of species clusters, by genome name
+
+Both clusters() and cluster_fastani join two genomes if fastANI reported at least min_ani
+in either direction, so the streamed clusters match the ones of the sparse matrix. The
+mean of both directions would need the first direction of every pair kept until the
+other one is read, i.e. memory for the pairs rather than for the genomes.
+
+cluster_fastani streams the output into single linkage clusters, e.g. species, with
+memory for each genome only.
+
+ANIMatrix keeps a dense ANI table between sessions as a memory-mapped float32 array
+with a label index, so pairs and subsets are read without loading the whole table.
+"""
+
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+from abacat.config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Columns of the fastANI output.
+FASTANI_COLUMNS = ("query", "reference", "ani", "fragments", "total_fragments")
+
+
+def genome_name(label):
+    """
+    :param label: Genes or contigs file in the fastANI output.
+    :return: Genome name, as in GenomeCollection.
+    """
+    return os.path.splitext(os.path.basename(label))[0].replace("_prodigal_genes", "")
+
+
+class SparseANI:
+    """
+    SparseANI, a symmetric sparse matrix of ANI between genomes.
+
+    The value of a pair is the mean ANI of both directions, or the ANI of the one
+    direction fastANI reported. Pairs fastANI left out are implicit zeros.
+    """
+
+    def __init__(self, matrix, labels, directed=None):
+        """
+        :param matrix: Square scipy sparse matrix of ANI, in percent.
+        :param labels: Label of each row, e.g. the genes files given to fastANI.
+        :param directed: Square scipy sparse matrix of ANI by direction, query by reference, as
+                         fastANI reported it. Default is matrix.
+        """
+        super(SparseANI, self).__init__()
+        self.matrix = sparse.csr_matrix(matrix)
+        self.directed = self.matrix if directed is None else sparse.csr_matrix(directed)
+        self.labels = list(labels)
+        self.index = dict((label, ix) for ix, label in enumerate(self.labels))
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def names(self):
+        return [genome_name(i) for i in self.labels]
+
+    @property
+    def pairs(self):
+        """
+        :return: Number of pairs with an ANI, not counting genomes with themselves.
+        """
+        return (self.matrix.nnz - np.count_nonzero(self.matrix.diagonal())) // 2
+
+    def ani(self, a, b):
+        """
+        :return: ANI of labels a and b, 0 if fastANI left the pair out.
+        """
+        return self.matrix[self.index[a], self.index[b]]
+
+    def to_frame(self):
+        """
+        :return: Dense dataframe of ANI with labels as index and columns, NaN for missing pairs.
+                 Uses n by n floats, so only for collections small enough to plot.
+        """
+        dense = np.full(self.matrix.shape, np.nan, dtype=np.float64)
+        coo = self.matrix.tocoo()
+        dense[coo.row, coo.col] = coo.data
+
+        return pd.DataFrame(dense, index=self.labels, columns=self.labels)
+
+    def clusters(self, min_ani=CONFIG["ani"]["species"]):
+        """
+        Single linkage clusters: genomes joined by pairs of at least min_ani, directly or
+        through other genomes. A pair joins two genomes if fastANI reported at least min_ani
+        in either direction, as in cluster_fastani. Runs on the sparse graph of those pairs.
+
+        :param min_ani: ANI, in percent, joining two genomes.
+        :return: Series of cluster numbers, indexed by genome name.
+        """
+        graph = self.directed >= min_ani
+        n_clusters, clusters = csgraph.connected_components(graph, directed=False)
+        logger.info(
+            f"Found {n_clusters} clusters of {len(self)} genomes at {min_ani}% ANI."
+        )
+
+        return pd.Series(clusters, index=pd.Index(self.names, name="genome"))
+
+
+def read_fastani(fastani_output, chunk_size=2 ** 18, fold_size=2 ** 24):
+    """
+    Streams a fastANI output into a SparseANI.
+
+    :param fastani_output: fastANI output file.
+    :param chunk_size: Number of lines parsed at once.
+    :param fold_size: Number of pairs kept as arrays before they are added to the sparse matrix.
+    :return: A SparseANI instance.
+    """
+    index = dict()
+    directed = sparse.csr_matrix((0, 0), dtype=np.float32)
+    rows, cols, values = [], [], []
+
+    def fold(directed):
+        n = len(index)
+        chunk = sparse.coo_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n, n),
+        )
+        directed.resize((n, n))
+        for pending_arrays in (rows, cols, values):
+            pending_arrays.clear()
+
+        return directed + chunk.tocsr()
+
+    n_lines, pending = 0, 0
+    for chunk in pd.read_csv(
+        fastani_output,
+        sep="\t",
+        header=None,
+        names=list(FASTANI_COLUMNS),
+        usecols=["query", "reference", "ani"],
+        dtype={"query": str, "reference": str, "ani": np.float32},
+        chunksize=chunk_size,
+    ):
+        # Labels of the chunk to global indexes, looking up each distinct label once.
+        codes, uniques = pd.factorize(
+            pd.concat([chunk["query"], chunk["reference"]], ignore_index=True)
+        )
+        lookup = np.array(
+            [index.setdefault(i, len(index)) for i in uniques], dtype=np.int32
+        )
+        codes = lookup[codes]
+        rows.append(codes[: len(chunk)])
+        cols.append(codes[len(chunk) :])
+        values.append(chunk["ani"].to_numpy())
+        n_lines += len(chunk)
+        pending += len(chunk)
+        if pending >= fold_size:
+            directed = fold(directed)
+            pending = 0
+    if pending:
+        directed = fold(directed)
+
+    # Mean of both directions: sum of the values over the number of directions reported.
+    # Both matrices come from the same coordinates, so their data arrays line up.
+    directed = directed.tocoo()
+    coordinates = (
+        np.concatenate([directed.row, directed.col]),
+        np.concatenate([directed.col, directed.row]),
+    )
+    matrix = sparse.csr_matrix(
+        (np.concatenate([directed.data, directed.data]), coordinates),
+        shape=directed.shape,
+    )
+    reported = sparse.csr_matrix(
+        (np.ones(len(coordinates[0]), dtype=np.float32), coordinates),
+        shape=directed.shape,
+    )
+    matrix.data /= reported.data
+    ani = SparseANI(matrix, sorted(index, key=index.get), directed=directed)
+    logger.info(f"Read {n_lines} fastANI lines: {len(ani)} genomes, {ani.pairs} pairs.")
+
+    return ani
+
+
+def cluster_fastani(
+    fastani_output, min_ani=CONFIG["ani"]["species"], chunk_size=2 ** 18
+):
+    """
+    Single linkage clusters of genomes, e.g. species at 95% ANI, streamed from a fastANI
+    output. Only the cluster of each genome is kept between chunks, so memory grows with
+    the number of genomes, not with the number of pairs.
+
+    A pair joins two genomes if fastANI reported at least min_ani in either direction,
+    as in SparseANI.clusters. Within a chunk, the pairs are unioned at once, as connected components of the
+    clusters they join.
+
+    :param fastani_output: fastANI output file.
+    :param min_ani: ANI, in percent, joining two genomes.
+    :param chunk_size: Number of lines parsed at once.
+    :return: Dataframe indexed by genome name with the label, cluster, representative and size
+             of each genome. Clusters are numbered by size, largest first. The representative
+             is the member joined to the most genomes, so it is close to the rest of its cluster.
+    """
+    index = dict()
+    root = np.zeros(0, dtype=np.int64)  # Genome with the lowest index of each cluster
+    degree = np.zeros(0, dtype=np.int64)
+    n_lines = 0
+    for chunk in pd.read_csv(
+        fastani_output,
+        sep="\t",
+        header=None,
+        names=list(FASTANI_COLUMNS),
+        usecols=["query", "reference", "ani"],
+        dtype={"query": str, "reference": str, "ani": np.float32},
+        chunksize=chunk_size,
+    ):
+        codes, uniques = pd.factorize(
+            pd.concat([chunk["query"], chunk["reference"]], ignore_index=True)
+        )
+        lookup = np.array(
+            [index.setdefault(i, len(index)) for i in uniques], dtype=np.int64
+        )
+        codes = lookup[codes]
+        n_lines += len(chunk)
+        if len(index) > len(root):
+            root = np.concatenate([root, np.arange(len(root), len(index))])
+            degree = np.concatenate(
+                [degree, np.zeros(len(index) - len(degree), np.int64)]
+            )
+
+        keep = (chunk["ani"].to_numpy() >= min_ani) & (
+            codes[: len(chunk)] != codes[len(chunk) :]
+        )
+        rows, cols = codes[: len(chunk)][keep], codes[len(chunk) :][keep]
+        if not len(rows):
+            continue
+        degree += np.bincount(np.concatenate([rows, cols]), minlength=len(index))
+
+        # Union of the clusters joined by the chunk: components of a graph on their roots.
+        roots, local = np.unique(
+            np.concatenate([root[rows], root[cols]]), return_inverse=True
+        )
+        graph = sparse.coo_matrix(
+            (
+                np.ones(len(rows), dtype=np.int8),
+                (local[: len(rows)], local[len(rows) :]),
+            ),
+            shape=(len(roots), len(roots)),
+        )
+        _, component = csgraph.connected_components(graph, directed=False)
+        new_root = np.full(component.max() + 1, len(index), dtype=np.int64)
+        np.minimum.at(new_root, component, roots)
+        remap = np.arange(len(index))
+        remap[roots] = new_root[component]
+        root = remap[root]
+
+    # Clusters by size, largest first, and the most joined genome of each as representative.
+    _, inverse, sizes = np.unique(root, return_inverse=True, return_counts=True)
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+    cluster = rank[inverse]
+    order = np.lexsort((np.arange(len(root)), -degree, cluster))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = cluster[order][1:] != cluster[order][:-1]
+    representative = np.empty(len(sizes), dtype=np.int64)
+    representative[cluster[order][first]] = order[first]
+
+    labels = sorted(index, key=index.get)
+    names = np.array([genome_name(i) for i in labels], dtype=object)
+    clusters = pd.DataFrame(
+        {
+            "label": labels,
+            "cluster": cluster,
+            "representative": names[representative[cluster]],
+            "size": sizes[inverse],
+        },
+        index=pd.Index(names, name="genome"),
+    )
+    logger.info(
+        f"Read {n_lines} fastANI lines: {len(sizes)} clusters of {len(labels)} genomes at {min_ani}% ANI."
+    )
+
+    return clusters
+
+
+class ANIMatrix:
+    """
+    ANIMatrix, a persistent square matrix of ANI, memory-mapped from disk.
+
+    Values are float32, row by row, in prefix.f32, with room for more genomes than
+    there are labels, and the labels are in prefix.labels.json. Missing pairs are NaN.
+    The operating system pages in the rows that are read, so looking up a pair or a
+    subset does not read the whole file.
+
+    Example:
+        matrix = ANIMatrix.create("ani_output/ani_matrix")
+        matrix.update(df)  # Dataframe of ANI with labels as index and columns
+        ANIMatrix("ani_output/ani_matrix", mode="r").ani("genome_1", "genome_2")
+    """
+
+    def __init__(self, prefix, mode="r+"):
+        """
+        Opens an existing matrix.
+
+        :param prefix: Path of the matrix files, without their suffixes.
+        :param mode: numpy.memmap mode, "r" to read only or "r+" to update.
+        """
+        super(ANIMatrix, self).__init__()
+        self.prefix = prefix
+        self.mode = mode
+        with open(self.labels_file) as f:
+            self.labels = json.load(f)["labels"]
+        self.index = dict((label, ix) for ix, label in enumerate(self.labels))
+        self.array = None
+        self.map()
+
+    @property
+    def data_file(self):
+        return self.prefix + ".f32"
+
+    @property
+    def labels_file(self):
+        return self.prefix + ".labels.json"
+
+    @property
+    def capacity(self):
+        return self.array.shape[0]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return label in self.index
+
+    @classmethod
+    def create(cls, prefix, labels=(), capacity=1024):
+        """
+        :param prefix: Path of the matrix files, without their suffixes. Overwrites existing files.
+        :param labels: Labels of the first genomes.
+        :param capacity: Number of genomes that fit before the file is grown.
+        :return: An empty ANIMatrix instance.
+        """
+        labels = list(labels)
+        new_matrix_file(prefix + ".f32", max(capacity, len(labels), 1))
+        write_labels(prefix + ".labels.json", labels)
+
+        return cls(prefix)
+
+    def map(self):
+        """
+        Maps the data file. Its capacity follows from the file size, so it is always
+        consistent with the data, even if a grow was interrupted before the labels were written.
+        """
+        capacity = int(np.sqrt(os.path.getsize(self.data_file) // 4))
+        self.array = np.memmap(
+            self.data_file, dtype=np.float32, mode=self.mode, shape=(capacity, capacity)
+        )
+
+    def grow(self, capacity):
+        """
+        Rewrites the matrix with room for capacity genomes, copying it in blocks of rows.
+        """
+        tmp = f"{self.data_file}.{os.getpid()}.tmp"
+        new = new_matrix_file(tmp, capacity)
+        for start in range(0, len(self), BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, len(self))
+            new[start:end, : len(self)] = self.array[start:end, : len(self)]
+        new.flush()
+        del new
+        self.array = None
+        os.replace(tmp, self.data_file)
+        self.map()
+        logger.info(f"Grew {self.data_file} to {capacity} genomes.")
+
+    def append(self, labels):
+        """
+        Adds the labels that are new, growing the matrix by doubling if they do not fit.
+
+        :param labels: Iterable of labels.
+        :return: Array with the index of each label.
+        """
+        labels = list(labels)
+        new = [i for i in dict.fromkeys(labels) if i not in self.index]
+        if new:
+            if len(self) + len(new) > self.capacity:
+                self.grow(max(2 * self.capacity, len(self) + len(new)))
+            for label in new:
+                self.index[label] = len(self.labels)
+                self.labels.append(label)
+            write_labels(self.labels_file, self.labels)
+
+        return np.array([self.index[i] for i in labels], dtype=np.int64)
+
+    def update(self, table):
+        """
+        Writes a block of ANI values, adding its labels if they are new.
+
+        :param table: Dataframe of ANI with labels as index and columns, e.g. ANIDendrogram.df.
+        """
+        rows = self.append(table.index)
+        cols = self.append(table.columns)
+        self.array[np.ix_(rows, cols)] = table.to_numpy(dtype=np.float32)
+        self.array.flush()
+
+    def ani(self, a, b):
+        """
+        :return: ANI of labels a and b, NaN if the pair is missing.
+        """
+        return float(self.array[self.index[a], self.index[b]])
+
+    def subset(self, labels=None):
+        """
+        :param labels: Labels to read, in order. Default is all labels.
+        :return: Dataframe of ANI between labels, reading only their rows and columns.
+        """
+        labels = self.labels if labels is None else list(labels)
+        rows = np.array([self.index[i] for i in labels], dtype=np.int64)
+        values = np.empty((len(rows), len(rows)), dtype=np.float32)
+        for i, row in enumerate(rows):
+            # A view of the row, so only its columns are read, not the full reserved width.
+            values[i] = self.array[row][rows]
+
+        return pd.DataFrame(values, index=labels, columns=labels)
+
+    def to_frame(self):
+        return self.subset()
+
+
+# Rows copied or read at a time, to bound the memory of large matrices.
+BLOCK_ROWS = 1024
+
+
+def new_matrix_file(data_file, capacity):
+    """
+    :return: Memory map of a new capacity by capacity matrix of NaN.
+    """
+    array = np.memmap(
+        data_file, dtype=np.float32, mode="w+", shape=(capacity, capacity)
+    )
+    for start in range(0, capacity, BLOCK_ROWS):
+        array[start : start + BLOCK_ROWS] = np.nan
+    array.flush()
+
+    return array
+
+
+def write_labels(labels_file, labels):
+    tmp = f"{labels_file}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"labels": list(labels)}, f)
+    os.replace(tmp, labels_file)
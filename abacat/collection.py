@@ -0,0 +1,600 @@
+"""
+A class to work with sets of genomes at once.
+
+Every Genome keeps its own records, so questions about many genomes mean looping over
+Python objects. GenomeCollection keeps a single gene table shared by all of its genomes,
+built from the Prodigal output files, and only loads a Genome when it is accessed.
+"""
+
+import os
+import json
+import logging
+import pandas as pd
+from abacat.genome import Genome, from_json
+from abacat.aligners import get_aligner, best_hits, PROTEIN_QUERIES
+from abacat.abacat_helper import (
+    read_hits,
+    timer_wrapper,
+    dedup_fasta,
+    dedup_stats,
+    fan_out,
+)
+from abacat.prodigal import training_stats
+from abacat.duplicates import find_duplicates, copy_results, output_suffixes
+from abacat.phenotypes import pathway_completeness
+from abacat.translate import translate_fasta
+from abacat.config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Separates the genome name from the gene id in the queries of GenomeCollection.blast_seqs.
+QUERY_SEPARATOR = "::"
+
+# Columns of GenomeCollection.genes. Annotation columns are added for each database with hits.
+GENE_TABLE_COLUMNS = (
+    "genome",
+    "contig",
+    "id",
+    "start",
+    "stop",
+    "strand",
+    "partial_left",
+    "partial_right",
+    "start_type",
+    "rbs_motif",
+    "rbs_spacer",
+    "gc_cont",
+)
+
+
+def parse_prodigal_header(header):
+    """
+    Parses a Prodigal gene or protein header, e.g.
+    >NC_002745.2_1 # 517 # 1878 # 1 # ID=1_1;partial=00;start_type=ATG;rbs_motif=AGGAG;rbs_spacer=5-10bp;gc_cont=0.331
+
+    :param header: FASTA header, with or without the leading '>'.
+    :return: Tuple of (contig, id, start, stop, strand, partial_left, partial_right,
+             start_type, rbs_motif, rbs_spacer, gc_cont).
+    """
+    id_, start, stop, strand, fields = header.lstrip(">").rstrip().split(" # ")
+    fields = dict(i.split("=") for i in fields.split(";") if "=" in i)
+    partial = fields.get("partial", "00")
+
+    return (
+        id_.rsplit("_", 1)[0],
+        id_,
+        int(start),
+        int(stop),
+        int(strand),
+        partial[0] == "1",
+        partial[1] == "1",
+        fields.get("start_type"),
+        fields.get("rbs_motif"),
+        fields.get("rbs_spacer"),
+        float(fields.get("gc_cont", "nan")),
+    )
+
+
+def read_prodigal_headers(fasta_file):
+    """
+    Reads only the header lines of a Prodigal FASTA file, skipping the sequences.
+
+    :param fasta_file: Prodigal genes or proteins file.
+    :return: List of tuples from parse_prodigal_header.
+    """
+    with open(fasta_file) as f:
+        return [parse_prodigal_header(line) for line in f if line.startswith(">")]
+
+
+class GenomeCollection:
+    """
+    GenomeCollection, a class holding many genomes and a shared table of their genes.
+
+    Genomes may be passed as Genome instances, contigs files or json files exported
+    with Genome.to_json(). Genome instances are only created when accessed, e.g.
+    collection["GCF_000007645.1_ASM764v1_genomic"].
+    """
+
+    def __init__(self, genomes=None, name=None, directory=None):
+        super(GenomeCollection, self).__init__()
+        self.name = name
+        self.directory = directory
+        self.sources = dict()  # Genome names as keys, contigs or json files as values.
+        self.genomes = dict()  # Loaded Genome instances.
+        self.genes = None  # The shared gene table. See load_gene_table().
+        self.stats = dict()  # Run reports, e.g. of blast_seqs.
+        self.duplicates = None  # Table of duplicate genomes. See find_duplicates().
+        self.pathways = None  # Genomes by pathways. See pathway_completeness().
+
+        if genomes:
+            self.add(genomes)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __contains__(self, name):
+        return name in self.sources
+
+    def __getitem__(self, name):
+        if name not in self.genomes:
+            self.genomes[name] = self.load_genome(name)
+
+        return self.genomes[name]
+
+    def add(self, genomes):
+        """
+        :param genomes: List of Genome instances, contigs files or json files.
+        """
+        for genome in genomes:
+            if isinstance(genome, Genome):
+                self.sources[genome.name] = genome.files.get("contigs")
+                self.genomes[genome.name] = genome
+            else:
+                genome = os.path.abspath(genome)
+                self.sources[os.path.splitext(os.path.basename(genome))[0]] = genome
+
+        logger.info(f"Collection has {len(self)} genomes.")
+
+    def load_genome(self, name, load_sets=True):
+        """
+        :param name: Name of a genome in the collection.
+        :param load_sets: Load the Prodigal gene and protein sets, if present.
+        :return: A Genome instance.
+        """
+        source = self.sources[name]
+        if source.endswith(".json"):
+            return from_json(source, load_sets=load_sets)
+
+        genome = Genome(source)
+        prodigal = self.genome_files(name)["prodigal"]
+        if os.path.isfile(prodigal["genes"]):
+            genome.load_prodigal(
+                load_geneset=load_sets,
+                load_protset=load_sets and os.path.isfile(prodigal["proteins"]),
+            )
+
+        return genome
+
+    def genome_files(self, name):
+        """
+        Gets a genome's files without loading it.
+
+        :param name: Name of a genome in the collection.
+        :return: A dict like Genome.files.
+        """
+        if name in self.genomes:
+            return self.genomes[name].files
+
+        source = self.sources[name]
+        if source.endswith(".json"):
+            with open(source) as f:
+                return json.load(f)["files"]
+
+        # These are the default output paths of Prodigal and Genome.blast_seqs.
+        prefix = os.path.join(os.path.dirname(source), name)
+        files = {
+            "contigs": source,
+            "prodigal": {
+                "genes": prefix + "_prodigal_genes.fna",
+                "proteins": prefix + "_prodigal_proteins.faa",
+                "cds": prefix + "_prodigal_cds.gbk",
+            },
+        }
+        for db in CONFIG["db"]:
+            if os.path.isfile(prefix + f"_{db}.hits"):
+                files[db] = {
+                    "annotation": prefix + f"_{db}.fasta",
+                    "hits": prefix + f"_{db}.hits",
+                }
+
+        return files
+
+    def load_gene_table(self, annotations=None):
+        """
+        Builds the gene table from the headers of each genome's Prodigal genes file.
+        Genomes without a genes file are skipped.
+
+        :param annotations: Databases whose hits are added as annotation columns.
+                            Default is every database in CONFIG["db"] with hits.
+        :return: The gene table, also set as self.genes.
+        """
+        if annotations is None:
+            annotations = list(CONFIG["db"])
+
+        rows, genome_col = [], []
+        annotation_cols = dict((db, []) for db in annotations)
+        for name in self:
+            files = self.genome_files(name)
+            genes = files.get("prodigal", dict()).get("genes")
+            if not genes or not os.path.isfile(genes):
+                logger.info(f"No Prodigal genes file for {name}. Skipping it.")
+                continue
+            headers = read_prodigal_headers(genes)
+            rows += headers
+            genome_col += [name] * len(headers)
+            for db, column in annotation_cols.items():
+                hits = files.get(db, dict()).get("hits")
+                hits = read_hits(hits) if hits and os.path.isfile(hits) else dict()
+                column += [hits.get(header[1]) for header in headers]
+
+        df = pd.DataFrame(rows, columns=GENE_TABLE_COLUMNS[1:])
+        df.insert(0, "genome", genome_col)
+        for column in ("genome", "contig", "start_type", "rbs_motif", "rbs_spacer"):
+            df[column] = df[column].astype("category")
+        df["strand"] = df["strand"].astype("int8")
+        df["gc_cont"] = df["gc_cont"].astype("float32")
+        for db, column in annotation_cols.items():
+            if any(i is not None for i in column):
+                df[db] = column
+
+        self.genes = df
+        logger.info(
+            f"Loaded gene table with {len(df)} genes from {df['genome'].nunique()} genomes."
+        )
+
+        return self.genes
+
+    def find_duplicates(self, min_jaccard=CONFIG["duplicates"]["min_jaccard"]):
+        """
+        Flags genomes with the same contigs as an earlier genome, or nearly the same.
+
+        :param min_jaccard: Sketch Jaccard similarity of near duplicates. None only finds exact duplicates.
+        :return: Dataframe from abacat.duplicates.find_duplicates, also set as self.duplicates.
+        """
+        names = list(self)
+        self.duplicates = find_duplicates(
+            [self.genome_files(name)["contigs"] for name in names],
+            names=names,
+            min_jaccard=min_jaccard,
+        )
+        kinds = self.duplicates["kind"].value_counts()
+        self.stats["duplicates"] = {
+            "genomes": len(names),
+            "exact": int(kinds.get("exact", 0)),
+            "near": int(kinds.get("near", 0)),
+        }
+
+        return self.duplicates
+
+    def representatives(self, skip_duplicates=False):
+        """
+        :param skip_duplicates: Leave out the duplicates of other genomes, finding them first if needed.
+        :return: List of genome names.
+        """
+        if not skip_duplicates:
+            return list(self)
+        if self.duplicates is None:
+            self.find_duplicates()
+
+        return [i for i in self if self.duplicates.loc[i, "kind"] == "unique"]
+
+    def copy_from_representatives(self, suffixes):
+        """
+        Copies the output files of each representative to the names of its duplicates,
+        and drops the loaded duplicates so they are read again with the copies.
+
+        :param suffixes: Suffixes of the files to copy. See abacat.duplicates.output_suffixes.
+        :return: List of the genome names with copied files.
+        """
+        copied = []
+        duplicates = self.duplicates[self.duplicates["kind"] != "unique"]
+        for name, representative in duplicates["representative"].items():
+            if copy_results(
+                self.genome_files(representative)["contigs"],
+                self.genome_files(name)["contigs"],
+                suffixes,
+            ):
+                self.genomes.pop(name, None)
+                copied.append(name)
+
+        return copied
+
+    @timer_wrapper
+    def run_prodigal(
+        self, training=None, quiet=True, scores=False, skip_duplicates=False
+    ):
+        """
+        Runs Prodigal on the contigs of all genomes, reusing cached training files.
+
+        :param training: Training cache key of all genomes, e.g. the species, or a dict with
+                         genome names as keys and keys as values, e.g. ANI cluster labels.
+                         The first genome of each key trains it. None trains on each genome.
+        :param scores: Also write the start scores files.
+        :param skip_duplicates: Only run the representatives of duplicate genomes, and copy their
+                                outputs to the duplicates. See find_duplicates().
+        :return: Dict with genome names as keys and Prodigal output files as values.
+                 A report with the training cache hits and misses is set in self.stats.
+        """
+        names = self.representatives(skip_duplicates)
+        if not isinstance(training, dict):
+            training = dict((name, training) for name in self)
+        representatives = dict()
+        for name in names:
+            if training.get(name) is not None:
+                representatives.setdefault(
+                    training[name], self.genome_files(name)["contigs"]
+                )
+
+        before = training_stats()
+        files = dict()
+        for name in names:
+            genome = self[name]
+            genome.run_prodigal(
+                quiet=quiet,
+                load_sets=[],
+                scores=scores,
+                training=training.get(name),
+                train_on=representatives.get(training.get(name)),
+            )
+            files[name] = genome.files["prodigal"]
+        after = training_stats()
+        copied = []
+        if skip_duplicates:
+            copied = self.copy_from_representatives(output_suffixes(dbs=()))
+            for name in copied:
+                files[name] = self.genome_files(name)["prodigal"]
+
+        self.stats["prodigal"] = {
+            "genomes": len(files),
+            "training_keys": len(representatives),
+            "training_hits": after["hits"] - before["hits"],
+            "training_misses": after["misses"] - before["misses"],
+            "copied": len(copied),
+        }
+        logger.info(
+            f"Ran Prodigal on {len(files)} genomes with {len(representatives)} training keys "
+            f"({self.stats['prodigal']['training_hits']} cache hits, "
+            f"{self.stats['prodigal']['training_misses']} misses)."
+        )
+
+        return files
+
+    @timer_wrapper
+    def blast_seqs(
+        self,
+        db,
+        blast="n",
+        evalue=CONFIG["blast"]["evalue"],
+        batch_size=None,
+        skip_duplicates=False,
+        aligner=None,
+    ):
+        """
+        Blasts the Prodigal genes of all genomes with a single Blast run per batch, instead of one per genome.
+        Gene ids are prefixed with their genome name (genome::gene) in the query, and the hits are split back
+        into each genome's geneset[db], .fasta and .hits files, as Genome.blast_seqs would write them.
+        Blast searches each query on its own, so hits and e-values are the same as in separate runs.
+        Genes with the same sequence, in one genome or across genomes, are searched once.
+
+        :param db: From config.py db
+        :param blast: 'blastn', 'blastp' or 'blastx'.
+        :param evalue: evalue to use in Blast
+        :param batch_size: Number of genomes per Blast run. Default is all genomes in one run.
+        :param skip_duplicates: Only Blast the representatives of duplicate genomes, and copy their
+                                hits to the duplicates. See find_duplicates().
+        :param aligner: 'blast', 'diamond' or 'mmseqs'. Default is the one of db in CONFIG["aligner"].
+        :return: Dict with genome names as keys and number of hits as values.
+                 A report with the dedup ratio of the queries is set in self.stats.
+        """
+        aligner = get_aligner(db, blast=blast, backend=aligner, evalue=evalue)
+        names = [
+            i
+            for i in self.representatives(skip_duplicates)
+            if os.path.isfile(self.genome_files(i)["prodigal"].get("genes", ""))
+        ]
+        if not names:
+            logger.info("No genomes with Prodigal genes to Blast.")
+            return dict()
+        batch_size = batch_size or len(names)
+        directory = self.directory or os.path.dirname(self.sources[names[0]])
+        prefix = os.path.join(directory, f"{self.name or 'collection'}_{db}")
+
+        n_hits, queries, unique = dict(), 0, 0
+        for ix in range(0, len(names), batch_size):
+            batch = names[ix : ix + batch_size]
+            batch_prefix = prefix + f"_batch{ix // batch_size}"
+            query, out = batch_prefix + ".fna", batch_prefix + f"_{aligner.name}.tsv"
+            members = self.write_query(batch, query, proteins=blast in PROTEIN_QUERIES)
+            queries += len(members)
+            unique += dedup_stats(members)["unique"]
+            logger.info(f"Searching {len(batch)} genomes with {aligner.name} to {out}.")
+            try:
+                aligner.search(query, out)
+            finally:
+                os.remove(query)
+
+            hits = self.split_hits(out, members)
+            for name in batch:
+                genome = self.genomes.get(name) or self.load_genome(
+                    name, load_sets=False
+                )
+                self.genomes[name] = genome
+                genome.files[db] = {"alignments": out}
+                genome.set_annotation(
+                    db,
+                    hits.get(name, []),
+                    f"Search of {genome.files['prodigal']['genes']} to {CONFIG['db'][db]}.",
+                )
+                n_hits[name] = len(hits.get(name, []))
+
+        copied = []
+        if skip_duplicates:
+            copied = self.copy_from_representatives(output_suffixes(dbs=[db]))
+            for name in copied:
+                n_hits[name] = n_hits.get(
+                    self.duplicates.loc[name, "representative"], 0
+                )
+
+        self.stats[f"blast_{db}"] = {
+            "genomes": len(names),
+            "batches": -(-len(names) // batch_size),
+            "queries": queries,
+            "unique": unique,
+            "dedup_ratio": queries / unique if unique else 1.0,
+            "hits": sum(n_hits.values()),
+            "copied": len(copied),
+        }
+        logger.info(
+            f"Blasted {unique} unique of {queries} genes "
+            f"(dedup ratio {self.stats[f'blast_{db}']['dedup_ratio']:.2f}), "
+            f"found {sum(n_hits.values())} hits in {len(n_hits)} genomes."
+        )
+
+        return n_hits
+
+    def write_query(self, names, query, proteins=False):
+        """
+        Writes the distinct Prodigal genes of genomes to one FASTA file, prefixing each header with
+        its genome name. Genes identical to an earlier one, in any genome, are left out.
+
+        :param names: Names of genomes in the collection.
+        :param query: Output FASTA file.
+        :param proteins: Write the Prodigal proteins instead, translating the genes of genomes without
+                         a proteins file.
+        :return: List of (genome::gene, representative) tuples from abacat_helper.dedup_fasta.
+        """
+        files, translated = [], []
+        for name in names:
+            prodigal = self.genome_files(name)["prodigal"]
+            if not proteins:
+                files.append(prodigal["genes"])
+            elif os.path.isfile(prodigal.get("proteins", "")):
+                files.append(prodigal["proteins"])
+            else:
+                translated.append(query + f".{len(translated)}.faa")
+                translate_fasta(prodigal["genes"], translated[-1])
+                files.append(translated[-1])
+        try:
+            return dedup_fasta(
+                files, query, prefixes=[name + QUERY_SEPARATOR for name in names]
+            )
+        finally:
+            for translated_file in translated:
+                os.remove(translated_file)
+
+    @staticmethod
+    def split_hits(hits_file, members):
+        """
+        :param hits_file: Tabular hits of a query written by write_query, see abacat/aligners.py.
+        :param members: List returned by write_query.
+        :return: Dict with genome names as keys and lists of (gene id, hit description) tuples as values.
+        """
+        hits = dict()
+        for query, hit in fan_out(best_hits(hits_file), members):
+            name, _, id_ = query.partition(QUERY_SEPARATOR)
+            hits.setdefault(name, []).append((id_, hit))
+
+        return hits
+
+    def pathway_completeness(self, fraction=True):
+        """
+        Completeness of the phenotyping pathways of all genomes, from their phenotyping hits.
+        Run Genome.run_pathways or blast_seqs(db="phenotyping") first.
+
+        Example:
+            table = collection.pathway_completeness()
+            table[(table["L-arabinose"] >= 0.8) & (table["Sucrose_utilization"] == 0)]
+
+        :param fraction: Fraction of the genes of each pathway found. False for the number of genes.
+        :return: Dataframe with genomes as index and pathways as columns, also set as self.pathways.
+        """
+        if self.genes is None or "phenotyping" not in self.genes:
+            self.load_gene_table()
+        if "phenotyping" in self.genes:
+            hits = self.genes.dropna(subset=["phenotyping"])
+        else:
+            hits = pd.DataFrame({"genome": [], "phenotyping": []})
+        self.pathways = pathway_completeness(
+            hits["genome"].astype(str),
+            hits["phenotyping"],
+            all_genomes=list(self),
+            fraction=fraction,
+        )
+
+        return self.pathways
+
+    def filter(self, expr=None, **conditions):
+        """
+        Vectorized filter of the gene table.
+
+        Example:
+            collection.filter("gc_cont > 0.4 and not partial_left", strand=-1)
+            collection.filter(genome=["genome_a", "genome_b"])
+
+        :param expr: A query string, passed to pandas.DataFrame.query.
+        :param conditions: Column names as keys. Lists are matched with isin, other values with ==.
+        :return: Filtered gene table.
+        """
+        if self.genes is None:
+            self.load_gene_table()
+
+        mask = pd.Series(True, index=self.genes.index)
+        for column, value in conditions.items():
+            if isinstance(value, (list, tuple, set)):
+                mask &= self.genes[column].isin(value)
+            else:
+                mask &= self.genes[column] == value
+
+        df = self.genes[mask]
+        if expr:
+            df = df.query(expr)
+
+        return df
+
+    def groupby(self, by="genome", **kwargs):
+        """
+        :param by: Column or list of columns of the gene table.
+        :return: pandas GroupBy object over the gene table.
+        """
+        if self.genes is None:
+            self.load_gene_table()
+
+        return self.genes.groupby(by, observed=True, **kwargs)
+
+    def summary(self):
+        """
+        :return: Dataframe with number of genes, partial genes and mean GC content per genome.
+        """
+        genes = self.genes if self.genes is not None else self.load_gene_table()
+        partial = genes["partial_left"] | genes["partial_right"]
+
+        return (
+            genes.assign(partial=partial)
+            .groupby("genome", observed=True)
+            .agg(
+                genes=("id", "size"),
+                partial=("partial", "sum"),
+                gc_cont=("gc_cont", "mean"),
+            )
+        )
+
+
+def from_directory(directory, kind="contigs"):
+    """
+    :param directory: Directory with contigs files or json files exported with Genome.to_json().
+    :param kind: 'contigs' or 'json'.
+    :return: A GenomeCollection instance.
+    """
+    directory = os.path.abspath(directory)
+    files = sorted(os.path.join(directory, i) for i in os.listdir(directory))
+
+    if kind == "json":
+        files = [i for i in files if i.endswith(".json")]
+    elif kind == "contigs":
+        outputs = tuple(f"_{db}.fasta" for db in CONFIG["db"])
+        files = [
+            i
+            for i in files
+            if i.endswith((".fna", ".fasta", ".fa"))
+            and "prodigal" not in i  # Skip previous Prodigal files
+            and not i.endswith(outputs)  # And annotation outputs
+        ]
+    else:
+        raise Exception("Choose a valid kind, either 'contigs' or 'json'.")
+
+    return GenomeCollection(
+        files, name=os.path.basename(directory), directory=directory
+    )
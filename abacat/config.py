@@ -56,9 +56,29 @@ CONFIG = {
         "phenotyping": db("phenotyping", "phenotyping.fasta"),
         "pathways": db("phenotyping", "pathways.json"),
     },
+    "megares": {
+        "annotations": db("megares", "megares_annotations_v1.01.csv"),
+        "mappings": db("megares", "megares_to_external_header_mappings_v1.01.tsv"),
+    },
     "third_party": get_third_party_bins(),  # Docker config
     "threads": int(os.cpu_count() / 2),
-    "blast": {"evalue": 10 ** -20},
+    # dbsize fixes the effective database size, e.g. to BlastDatabase(db).stats()["letters"],
+    # so e-values stay comparable when a database is updated. None uses the real size.
+    "blast": {"evalue": 10 ** -20, "dbsize": None},
+    # Search program of blast_seqs, 'blast', 'diamond' or 'mmseqs', see abacat/aligners.py.
+    # Databases in by_db use their own, e.g. {"COG": "diamond"}. options are extra arguments
+    # of each program, e.g. {"diamond": ["--sensitive"]}.
+    "aligner": {"backend": "blast", "by_db": {}, "max_hits": 5, "options": {}},
+    "kmer": {"k": 21, "min_shared": 10},  # Prescreen of genes before BLAST
+    "prodigal": {"min_conf": 90.0},  # Genes under this confidence (%) are low confidence
+    "ani": {"species": 95.0},  # ANI (%) of genomes of the same species
+    "sketch": {"k": 21, "size": 1000},  # MinHash sketches of genomes, see abacat/sketch.py
+    # Genomes with sketches this similar are near duplicates, see abacat/duplicates.py
+    "duplicates": {"min_jaccard": 0.95, "sketch_size": 500},
+    "cache_dir": os.path.join(Path.home(), ".cache", "abacat"),
+    # Bytes of gene and protein sets kept loaded in a process, e.g. 2 * 2 ** 30. Least recently
+    # used sets are dropped past it, and read again from their files. None keeps all of them.
+    "memory": {"budget": None},
     "test_genomes": {
         "Staphylococcus aureus CA15": os.path.join(
             genomes_dir, "GCF_001021895.1_ASM102189v1_genomic.fna"
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+"""
+A script to keep the BLAST databases of CONFIG["db"] up to date.
+
+Each database is indexed with makeblastdb when it has no index, or when its FASTA
+changed since it was indexed. The SHA-256 checksum of the FASTA used for the index is
+recorded in a manifest next to it (<db>.abacat.json). Prebuilt databases without a
+FASTA, like the packaged MEGARes, are used as they are.
+
+Example usage:
+
+    python database.py
+    python database.py -db COG phenotyping -t 2
+    python database.py --info
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import logging
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from abacat.abacat_helper import timer_wrapper
+from abacat.config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+INDEX_EXTENSIONS = {
+    "nucl": (".nhr", ".nin", ".nsq"),
+    "prot": (".phr", ".pin", ".psq"),
+}
+
+NUCLEOTIDES = set("ACGTUNRYKMSWBDHV-")
+
+
+def sha256(file, buffer_size=2 ** 20):
+    """
+    :return: Hex digest of file, read in chunks of buffer_size.
+    """
+    checksum = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(buffer_size), b""):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
+
+
+class BlastDatabase:
+    """
+    BlastDatabase, a BLAST database from CONFIG["db"] and the FASTA it is built from.
+
+    Example:
+        db = BlastDatabase("COG")
+        db.update()  # Runs makeblastdb if the index is missing or stale
+        db.stats()  # {'sequences': 1785722, 'letters': 476451213}
+    """
+
+    def __init__(self, name, path=None, dbtype=None):
+        """
+        :param name: Database name, from CONFIG["db"].
+        :param path: Path of the FASTA, or of the database without extension. Default is CONFIG["db"][name].
+        :param dbtype: 'nucl' or 'prot'. Guessed from the index or from the FASTA if not given.
+        """
+        super(BlastDatabase, self).__init__()
+        self.name = name
+        self.path = path or CONFIG["db"][name]
+        self.manifest_file = self.path + ".abacat.json"
+        self.dbtype = dbtype or self.guess_dbtype()
+        self._stats = None
+
+    def __repr__(self):
+        return f"BlastDatabase({self.name!r}, {self.path!r}, {self.dbtype!r})"
+
+    @property
+    def has_fasta(self):
+        return os.path.isfile(self.path)
+
+    def index_files(self, dbtype=None):
+        """
+        :return: Existing index files of the database, including multi-volume ones (db.00.nhr...).
+        """
+        directory, name = os.path.split(self.path)
+        if not os.path.isdir(directory):
+            return []
+        extensions = INDEX_EXTENSIONS[dbtype or self.dbtype]
+        return sorted(
+            os.path.join(directory, i)
+            for i in os.listdir(directory)
+            if i.startswith(name) and i.endswith(extensions)
+        )
+
+    def guess_dbtype(self):
+        for dbtype in INDEX_EXTENSIONS:
+            if self.index_files(dbtype):
+                return dbtype
+        if self.has_fasta:
+            with open(self.path) as f:
+                seq = "".join(
+                    line.strip().upper()
+                    for _, line in zip(range(100), f)
+                    if not line.startswith(">")
+                )
+            return "nucl" if set(seq) <= NUCLEOTIDES else "prot"
+
+        return "nucl"
+
+    @property
+    def is_indexed(self):
+        extensions = INDEX_EXTENSIONS[self.dbtype]
+        return {os.path.splitext(i)[1] for i in self.index_files()} >= set(extensions)
+
+    def manifest(self):
+        """
+        :return: Dict written by build(), or None if the database was not built by Abacat.
+        """
+        try:
+            with open(self.manifest_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def is_stale(self):
+        """
+        :return: True if the database has to be indexed again.
+        """
+        if not self.has_fasta:
+            if not self.is_indexed:
+                raise FileNotFoundError(
+                    f"Database {self.name} has neither a FASTA nor an index at {self.path}."
+                )
+            return False  # Prebuilt database, there is nothing to build it from.
+
+        if not self.is_indexed:
+            return True
+
+        manifest = self.manifest()
+        stat = os.stat(self.path)
+        if manifest is None:
+            # Indexed outside Abacat: stale if the FASTA is newer than the index.
+            return stat.st_mtime > min(os.stat(i).st_mtime for i in self.index_files())
+        if manifest.get("dbtype") != self.dbtype:
+            return True
+        if manifest.get("size") == stat.st_size and manifest.get("mtime") == stat.st_mtime:
+            return False
+
+        # The file was touched or rewritten. Only rebuild if its contents changed.
+        return manifest.get("sha256") != sha256(self.path)
+
+    def build(self):
+        """
+        Runs makeblastdb on the FASTA and writes the manifest.
+        """
+        if not self.has_fasta:
+            raise FileNotFoundError(
+                f"No FASTA to build {self.name} from at {self.path}."
+            )
+
+        logger.info(f"Building {self.dbtype} database {self.name} from {self.path}.")
+        checksum = sha256(self.path)
+        subprocess.run(
+            [
+                "makeblastdb",
+                "-in",
+                self.path,
+                "-dbtype",
+                self.dbtype,
+                "-out",
+                self.path,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        stat = os.stat(self.path)
+        manifest = {
+            "name": self.name,
+            "source": self.path,
+            "dbtype": self.dbtype,
+            "sha256": checksum,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "built": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(self.manifest_file, "w") as f:
+            json.dump(manifest, f, indent=3)
+        self._stats = None
+
+    def update(self, force=False):
+        """
+        :param force: Build the database even if it is up to date.
+        :return: True if the database was built.
+        """
+        if force or self.is_stale():
+            self.build()
+            return True
+
+        logger.info(f"Database {self.name} is up to date.")
+        return False
+
+    def stats(self):
+        """
+        :return: Dict with the number of 'sequences' and 'letters' of the database, from blastdbcmd -info.
+        """
+        if self._stats is None:
+            out = subprocess.run(
+                ["blastdbcmd", "-db", self.path, "-dbtype", self.dbtype, "-info"],
+                stdout=subprocess.PIPE,
+                check=True,
+            )
+            self._stats = parse_info(out.stdout.decode())
+
+        return self._stats
+
+
+def parse_info(info):
+    """
+    Parses blastdbcmd -info output, e.g.
+        Database: megares_database_v1.01.fasta
+            7,868 sequences; 8,554,090 total bases
+
+    :return: Dict with 'sequences' and 'letters'.
+    """
+    for line in info.splitlines():
+        if "sequences;" in line:
+            sequences, letters = line.split(";")
+            return {
+                "sequences": int(sequences.split()[0].replace(",", "")),
+                "letters": int(letters.split()[0].replace(",", "")),
+            }
+
+    raise ValueError(f"Could not find database stats in blastdbcmd output:\n{info}")
+
+
+def blast_databases(names=None):
+    """
+    :param names: Database names from CONFIG["db"]. Default is all of them.
+    :return: List of BlastDatabase instances. Entries that are not databases, like pathways.json, are skipped.
+    """
+    names = names or list(CONFIG["db"])
+    return [BlastDatabase(i) for i in names if not CONFIG["db"][i].endswith(".json")]
+
+
+def update_databases(names=None, threads=CONFIG["threads"], force=False):
+    """
+    Builds the stale databases, running makeblastdb for several of them at once.
+
+    :param names: Database names from CONFIG["db"]. Default is all of them.
+    :param threads: Number of makeblastdb processes to run at once.
+    :param force: Build all databases even if they are up to date.
+    :return: Dict with database names as keys and True for the ones that were built.
+    """
+    databases = blast_databases(names)
+    stale = [i for i in databases if force or i.is_stale()]
+    logger.info(f"{len(stale)} of {len(databases)} databases need to be built.")
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        list(executor.map(lambda db: db.build(), stale))
+
+    return dict((i.name, i in stale) for i in databases)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="""
+    A script to build the BLAST databases of abacat/config.py that are missing or out of date.
+    """)
+    parser.add_argument(
+        "-db",
+        "--databases",
+        nargs="*",
+        help="Database names. Default is all databases in abacat/config.py.",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=CONFIG["threads"],
+        help="Number of databases to build at once.",
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Build databases even if up to date."
+    )
+    parser.add_argument(
+        "--info", action="store_true", help="Print database stats and exit."
+    )
+    args = parser.parse_args()
+
+    if args.info:
+        for db in blast_databases(args.databases):
+            try:
+                stats = db.stats()
+            except (subprocess.CalledProcessError, FileNotFoundError) as error:
+                stats = error
+            print(f"{db.name}\t{db.dbtype}\t{db.path}\t{stats}")
+        sys.exit(0)
+
+    @timer_wrapper
+    def main():
+        built = update_databases(args.databases, args.threads, args.force)
+        for name, rebuilt in built.items():
+            print(f"{name}\t{'built' if rebuilt else 'up to date'}")
+
+    main()
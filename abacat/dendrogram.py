@@ -10,15 +10,26 @@ python abacat/dendrogram.py -i my_genomes/
 
 """
 
+import json
+import time
+import shutil
+import socket
+import hashlib
 import argparse
 import subprocess
+import numpy as np
 import pandas as pd
-from os import path, listdir, mkdir
+from os import path, listdir, mkdir, makedirs, replace, remove, getpid
 from matplotlib import pyplot as plt
 from abacat import prodigal, CONFIG, timer_wrapper
+from abacat.abacat_helper import acquire_lock, release_lock, file_lock, heartbeat
+from abacat.ani import ANIMatrix, read_fastani, cluster_fastani
 from scipy.spatial.distance import squareform
 from scipy.cluster.hierarchy import dendrogram, linkage
 
+# Seconds after which a shard lock that is no longer refreshed belongs to a crashed run.
+SHARD_LOCK_STALE = 300
+
 
 class ANIDendrogram:
     def __init__(
@@ -30,6 +41,7 @@ class ANIDendrogram:
         fastani_output=None,
         output_dir="ani_output/",
         ani_table=None,
+        ani_matrix=None,
         fig_output=None,
         key_df=None,
     ):
@@ -43,6 +55,7 @@ class ANIDendrogram:
         :param fastani_output: FastANI file name
         :param output_dir: Output directory name
         :param ani_table: Table with FastANI results
+        :param ani_matrix: Prefix of the memory-mapped ANI matrix, kept across runs. See abacat.ani.ANIMatrix.
         :param fig_output: Dendrogram figure file name
         :param color_threshold: Parameter for color threshold in Dendrogram. Default is 5 for species level.
         :param key_df: Dataframe with two columns: old name and new name, to filter or rename samples in dendrogram.
@@ -55,9 +68,12 @@ class ANIDendrogram:
         self.fastani_output = fastani_output
         self.output_dir = output_dir
         self.ani_table = ani_table
+        self.ani_matrix = ani_matrix
         self.fig_output = fig_output
         self.fastani_bin = CONFIG["third_party"]["fastANI"]
         self.df = None  # Pandas dataframe which will be saved to ani_table.
+        self.ani = None  # SparseANI of the FastANI output. See abacat.ani.
+        self.clusters = None  # Dataframe of single linkage clusters. See cluster_species().
         self.key_df = key_df
 
     def import_key_file(self, key_file):
@@ -106,12 +122,27 @@ class ANIDendrogram:
         else:
             return f"Could write to {self.fastani_input}."
 
-    def run(self):
+    def run(self, shards=None, shard_dir=None):
+        """
+        Runs FastANI of the genes files in self.fastani_input against each other.
+
+        :param shards: Split the queries into this many FastANI runs, each against all
+                       references. Finished shards are recorded in a manifest, and reruns
+                       only run the missing ones. Hosts sharing shard_dir split the shards.
+        :param shard_dir: Directory of the shards. Default is output_dir/shards.
+        :return: True if the FastANI output is complete. With shards, False while other hosts still run some.
+        """
         if not self.fastani_output:
             self.fastani_output = path.join(
                 self.output_dir, f"fastani_out_{self.fraglen}"
             )
 
+        if shards:
+            manifest = self.plan_shards(shards, shard_dir)
+            for ix in range(len(manifest["shards"])):
+                self.run_shard(manifest, ix)
+            return self.merge_shards(manifest)
+
         if not self.cmd:
             self.cmd = f"{self.fastani_bin} --ql {self.fastani_input} --rl {self.fastani_input} -t {self.threads} -o {self.fastani_output} --minFraction 0"
 
@@ -127,34 +158,153 @@ class ANIDendrogram:
         if path.isfile(self.fastani_output):
             print(f"FastANI ran successfully!")
 
+        return path.isfile(self.fastani_output)
+
+    def plan_shards(self, shards, shard_dir=None):
+        """
+        Splits the queries of self.fastani_input into contiguous shards, and writes their
+        query lists and the manifest, unless another run already planned them.
+
+        :return: The manifest, a dict with the input, its checksum and the shards.
+        """
+        shard_dir = path.abspath(shard_dir or path.join(self.output_dir, "shards"))
+        makedirs(shard_dir, exist_ok=True)
+        manifest_file = path.join(shard_dir, "manifest.json")
+        with open(self.fastani_input) as f:
+            queries = [i.strip() for i in f if i.strip()]
+        checksum = hashlib.md5("\n".join(queries).encode()).hexdigest()
+
+        with file_lock(manifest_file + ".lock"):
+            if path.isfile(manifest_file):
+                with open(manifest_file) as f:
+                    manifest = json.load(f)
+                planned = (
+                    manifest["checksum"],
+                    manifest["fraglen"],
+                    manifest["shards"],
+                )
+                if planned[:2] != (checksum, self.fraglen) or len(planned[2]) != min(
+                    shards, len(queries)
+                ):
+                    raise Exception(
+                        f"{manifest_file} was planned for another input, fragment length or number of shards. "
+                        "Use another shard_dir, or remove it to start over."
+                    )
+                return manifest
+
+            # Contiguous shards, so their outputs concatenate in the order of a single run.
+            manifest = {
+                "dir": shard_dir,
+                "input": path.abspath(self.fastani_input),
+                "checksum": checksum,
+                "fraglen": self.fraglen,
+                "queries": len(queries),
+                "shards": [],
+            }
+            bounds = np.linspace(0, len(queries), min(shards, len(queries)) + 1)
+            bounds = bounds.round().astype(int)
+            for ix, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+                query_list = path.join(shard_dir, f"shard_{ix:05d}.txt")
+                with open(query_list, "w") as f:
+                    f.write("\n".join(queries[start:end]) + "\n")
+                manifest["shards"].append(
+                    {
+                        "queries": query_list,
+                        "output": path.join(shard_dir, f"shard_{ix:05d}.out"),
+                        "done": False,
+                    }
+                )
+            write_manifest(manifest, manifest_file)
+        print(f"Planned {len(manifest['shards'])} FastANI shards in {shard_dir}.")
+
+        return manifest
+
+    def run_shard(self, manifest, ix):
+        """
+        Runs FastANI on shard ix of manifest, unless it is done or another process holds it.
+
+        :return: True if the shard is done.
+        """
+        manifest_file = path.join(manifest["dir"], "manifest.json")
+        shard = read_manifest(manifest_file)["shards"][ix]
+        if shard["done"]:
+            return True
+        lock = shard["output"] + ".lock"
+        # Refreshed while FastANI runs, and taken over once a crashed run stops refreshing it.
+        if not acquire_lock(lock, stale_after=SHARD_LOCK_STALE):
+            print(f"Shard {ix} is run by another process. Skipping it.")
+            return False
+
+        try:
+            start = time.time()
+            tmp = f"{shard['output']}.{socket.gethostname()}.{getpid()}.tmp"
+            cmd = (
+                f"{self.fastani_bin} --ql {shard['queries']} --rl {manifest['input']} "
+                f"-t {self.threads} -o {tmp} --minFraction 0"
+            )
+            if self.fraglen:
+                cmd += f" --fragLen {self.fraglen}"
+            print(f"Running FastANI shard {ix + 1}/{len(manifest['shards'])}.")
+            with heartbeat(lock, interval=SHARD_LOCK_STALE / 5):
+                returncode = subprocess.call(cmd, shell=True)
+            if returncode != 0 or not path.isfile(tmp):
+                if path.isfile(tmp):
+                    remove(tmp)
+                print(f"FastANI shard {ix} failed ({returncode}). Rerun to retry it.")
+                return False
+            replace(tmp, shard["output"])
+
+            with file_lock(manifest_file + ".lock"):
+                current = read_manifest(manifest_file)
+                current["shards"][ix].update(
+                    {
+                        "done": True,
+                        "host": socket.gethostname(),
+                        "seconds": round(time.time() - start, 3),
+                    }
+                )
+                write_manifest(current, manifest_file)
+        finally:
+            release_lock(lock)
+
+        return True
+
+    def merge_shards(self, manifest):
+        """
+        Concatenates the shard outputs, in order, into self.fastani_output once all shards are done.
+
+        :return: True if merged, False if shards are missing.
+        """
+        manifest = read_manifest(path.join(manifest["dir"], "manifest.json"))
+        missing = [ix for ix, i in enumerate(manifest["shards"]) if not i["done"]]
+        if missing:
+            print(
+                f"{len(missing)} of {len(manifest['shards'])} FastANI shards are not done. "
+                "Rerun when other hosts finish, or to retry failed shards."
+            )
+            return False
+
+        tmp = f"{self.fastani_output}.{socket.gethostname()}.{getpid()}.tmp"
+        with open(tmp, "wb") as out:
+            for shard in manifest["shards"]:
+                with open(shard["output"], "rb") as f:
+                    shutil.copyfileobj(f, out)
+        replace(tmp, self.fastani_output)
+        print(
+            f"Merged {len(manifest['shards'])} FastANI shards into {self.fastani_output}."
+        )
+
+        return True
+
     def make_ani_table(self):
         """
         :return: ANI distance table from FastANI output.
+                 The sparse matrix of all pairs is kept in self.ani, e.g. for self.ani.clusters().
         """
 
-        # Setting the columns and reading the dataframe
-        columns = [
-            "Genome_A",
-            "Genome_B",
-            "ANI",
-            "orthologous_fraction",
-            "total_fragments",
-        ]
-        df = pd.read_csv(self.fastani_output, sep="\t", header=None)
-        df.columns = columns
-
-        # Creating the concatenated data frame
-        df_ = df.copy()
-        df_.rename(columns={"Genome_A": "Genome_B", "Genome_B": "Genome_A"}, inplace=True)
-        df_t = pd.concat([df, df_], sort=True)
-        df_t.ANI = round(df_t.ANI, 2)
-
-        # Switching from 'long' form to a distance matrix
-        df = pd.pivot_table(
-            df_t, values="ANI", index=("Genome_B"), columns=("Genome_A")
-        )
-        del df_
-        del df_t  # Don't need them anymore
+        # Streams the output into a sparse matrix, then only densifies it for the plot.
+        self.ani = read_fastani(self.fastani_output)
+        df = self.ani.to_frame().round(2).sort_index().sort_index(axis=1)
 
         # Make sure the horizontal diagonal is symmetrical
         for i, j in zip(range(len(df)), range(len(df))):
@@ -182,20 +332,79 @@ class ANIDendrogram:
         )
         df.to_csv(self.ani_table, header=False, index=False)
 
-    def make_dendrogram(self, color_threshold=5, filter_rename=False):
+        # The labelled matrix persists: genomes of later runs are added to it.
+        if not self.ani_matrix:
+            self.ani_matrix = path.join(self.output_dir, "ani_matrix")
+        if path.isfile(self.ani_matrix + ".labels.json"):
+            matrix = ANIMatrix(self.ani_matrix)
+        else:
+            matrix = ANIMatrix.create(self.ani_matrix, capacity=len(df))
+        matrix.update(df)
+        print(
+            f"Updated ANI matrix {path.abspath(self.ani_matrix)}. It has {len(matrix)} genomes."
+        )
+
+    def cluster_species(self, min_ani=CONFIG["ani"]["species"], output=None):
+        """
+        Streams the FastANI output into single linkage clusters, without an ANI table,
+        so it scales to collections too large for a dendrogram.
+
+        :param min_ani: ANI, in percent, joining two genomes. Default is the species threshold.
+        :param output: Clusters file. Default is output_dir/species_clusters_<min_ani>.tsv.
+        :return: Dataframe of clusters, also set as self.clusters. See abacat.ani.cluster_fastani.
+        """
+        if not output:
+            output = path.join(self.output_dir, f"species_clusters_{min_ani:g}.tsv")
+        self.clusters = cluster_fastani(self.fastani_output, min_ani=min_ani)
+        self.clusters.to_csv(output, sep="\t")
+        print(
+            f"Wrote {self.clusters['cluster'].nunique()} clusters of {len(self.clusters)} genomes to {path.abspath(output)}."
+        )
+
+        return self.clusters
+
+    def make_dendrogram(self, color_threshold=5, filter_rename=False, matrix=None):
         """
         :param filter_rename: Will filter and rename using self.key_file. If there is not a key_file, will attempt to import from passed key_file.
         :param color_threshold: Color threshold to paint dendrogram branches.
+        :param matrix: ANIMatrix instance or prefix to plot instead of self.df, e.g. from an earlier run.
+                       With filter_rename, only the rows of the genomes in the key file are read.
         :return: Build dendrogram.
         """
         print(f"Plotting dendrogram with color threshold of {color_threshold}.")
-        if not any(self.df):
+        if matrix is not None:
+            if not isinstance(matrix, ANIMatrix):
+                matrix = ANIMatrix(matrix, mode="r")
+            if filter_rename:
+                if isinstance(filter_rename, str) and path.isfile(filter_rename):
+                    self.import_key_file(filter_rename)
+                table = matrix.subset(self.key_df["old_name"]).astype(float).round(2)
+                table.index = table.columns = list(self.key_df["new_name"])
+            else:
+                table = matrix.to_frame().astype(float).round(2)
+
+            # As in make_ani_table, the diagonal is 99.99 and genomes with missing pairs are dropped,
+            # those missing the most pairs first.
+            table = table.mask(np.eye(len(table), dtype=bool), 99.99)
+            missing = table.isna().to_numpy()
+            missing |= missing.T
+            keep = np.ones(len(table), dtype=bool)
+            while missing[np.ix_(keep, keep)].any():
+                keep[np.where(keep, (missing & keep).sum(axis=1), -1).argmax()] = False
+            if not keep.all():
+                print(
+                    f"Dropping {(~keep).sum()} genome(s) with missing ANI pairs: "
+                    f"{', '.join(table.index[~keep])}."
+                )
+            table = table.iloc[keep, keep]
+        elif not any(self.df):
             raise Exception(
                 "You don't have an ANI table to make a dendrogram. Run make_ani_table() first."
             )
+        else:
+            table = self.df
 
-        table = self.df
-        if filter_rename:
+        if filter_rename and matrix is None:
             if not path.isfile(filter_rename):
                 self.import_key_file(filter_rename)
 
@@ -231,6 +440,18 @@ class ANIDendrogram:
             print(f"Generated dendrogram at {path.abspath(self.fig_output)}.")
 
 
+def read_manifest(manifest_file):
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, manifest_file):
+    tmp = f"{manifest_file}.{getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=3)
+    replace(tmp, manifest_file)
+
+
 def augmented_dendrogram(*args, **kwargs):
 
     ddata = dendrogram(*args, **kwargs)
@@ -335,6 +556,31 @@ if __name__ == "__main__":
             type=int,
             default=CONFIG["threads"],
         )
+        parser.add_argument(
+            "--species",
+            help="Write single linkage clusters of genomes joined by this ANI, e.g. 95 for species. "
+            "Runs on the FastANI output, and stops there without the ANI table and dendrogram, "
+            "which do not fit in memory for large collections. Use --plot to make them too.",
+            type=float,
+            default=None,
+        )
+        parser.add_argument(
+            "--plot",
+            help="With --species, also make the ANI table and dendrogram.",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--shards",
+            help="Split the FastANI run into this many shards. Reruns only run unfinished shards, "
+            "and hosts sharing --shard-dir split them. Default is a single run.",
+            type=int,
+            default=None,
+        )
+        parser.add_argument(
+            "--shard-dir",
+            help="Directory of the shards and their manifest. Default is <output>/shards.",
+            default=None,
+        )
         parser.add_argument(
             "-s",
             "--skip",
@@ -404,7 +650,12 @@ if __name__ == "__main__":
             threads=args.threads,
         )
         if not args.skip:
-            ani.run()
+            if not ani.run(shards=args.shards, shard_dir=args.shard_dir):
+                return
+        if args.species:
+            ani.cluster_species(min_ani=args.species)
+            if not args.plot:
+                return
         ani.make_ani_table()
         if args.keys:
             print(f"Key file set as {path.abspath(args.keys)}.")
@@ -1,4 +1,9 @@
 from .prokka import prokka
 from .prokka_parser import ffn_parser
-from .renamer import ls_and_decompress, parse_assembly_report, rename_assembly
-from .reports import dict_from_report
+from .renamer import (
+    ls_and_decompress,
+    ls_and_decompress_dirs,
+    parse_assembly_report,
+    rename_assembly,
+)
+from .reports import dict_from_report, aggregate_reports, write_reports
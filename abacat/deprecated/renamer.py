@@ -3,7 +3,9 @@ import gzip
 import os
 import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from abacat.abacat_helper import timer_wrapper
+from abacat.config import CONFIG
 
 """
 A script to rename files in assembly directory structure.
@@ -15,7 +17,59 @@ One or more assembly directories with the directory and all files renamed.
 """
 
 
-def ls_and_decompress(assembly_dir, unzip=True):
+# Read and write in 1 MiB blocks instead of shutil's 64 kB default.
+BUFFER_SIZE = 2 ** 20
+
+
+def decompress(file, buffer_size=BUFFER_SIZE):
+    """
+    Decompresses a single .gz file next to the original and removes the original.
+
+    The output is first written to a '.part' file which is renamed once complete,
+    so an interrupted run never leaves a truncated file next to a deleted .gz.
+
+    :param file: Path to a .gz file.
+    :param buffer_size: Size in bytes of the read and write buffers.
+    :return: Path to the decompressed file.
+    """
+    out = file[:-3]
+    tmp = out + ".part"
+    try:
+        with gzip.open(file, "rb") as f_in, open(
+            tmp, "wb", buffering=buffer_size
+        ) as f_out:
+            shutil.copyfileobj(f_in, f_out, buffer_size)
+        os.replace(tmp, out)
+    except BaseException:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+        raise
+    os.remove(file)
+
+    return out
+
+
+def decompress_files(files, threads=CONFIG["threads"], buffer_size=BUFFER_SIZE):
+    """
+    Decompresses many .gz files concurrently. zlib releases the GIL while inflating,
+    so a thread pool uses several cores without pickling anything between processes.
+
+    :param files: Iterable of paths. Files not ending in .gz are skipped.
+    :param threads: Number of worker threads.
+    :param buffer_size: Size in bytes of the read and write buffers.
+    :return: List of decompressed file paths.
+    """
+    files = [file for file in files if file.endswith(".gz")]
+    if not files:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        return list(
+            executor.map(lambda file: decompress(file, buffer_size=buffer_size), files)
+        )
+
+
+def ls_and_decompress(assembly_dir, unzip=True, threads=CONFIG["threads"]):
     """
     This function lists and decompresses the files in the assembly directory.
     Must be in NCBI ftp file hierarchy. e.g.
@@ -37,18 +91,54 @@ def ls_and_decompress(assembly_dir, unzip=True):
 
     if unzip:
         print(f"Decompressing files in {assembly_dir}.")
-        for file in files:
-            if file.endswith(".gz"):
-                with gzip.open(file, "r") as f_in, open(file[:-3], "wb") as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-                os.remove(file)
+        decompress_files(files, threads=threads)
 
         # Refresh the 'files' var with unzipped names
         files = [os.path.join(assembly_dir, file) for file in os.listdir(assembly_dir)]
 
+    # Leftovers from interrupted runs are not assembly files.
+    files = [file for file in files if not file.endswith(".part")]
+
     return files
 
 
+def ls_and_decompress_dirs(assembly_dirs, threads=CONFIG["threads"]):
+    """
+    Decompresses the files of many assembly directories with a single pool of workers,
+    so small directories don't leave workers idle. A file that fails to decompress, e.g. a
+    corrupt .gz, only fails its own directory.
+
+    :param assembly_dirs: List of genome directories.
+    :param threads: Number of worker threads.
+    :return: Dict with the directories as keys and lists of decompressed files as values, or the
+             exception raised while decompressing the directory if it failed.
+    """
+    assembly_dirs = [os.path.abspath(i) for i in assembly_dirs]
+    files = []
+    for assembly_dir in assembly_dirs:
+        files += ls_and_decompress(assembly_dir, unzip=False)
+
+    print(f"Decompressing files in {len(assembly_dirs)} directories.")
+    decompressed = dict((assembly_dir, []) for assembly_dir in assembly_dirs)
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        futures = [
+            (executor.submit(decompress, file), file)
+            for file in files
+            if file.endswith(".gz")
+        ]
+        for future, file in futures:
+            assembly_dir = os.path.dirname(file)
+            try:
+                out = future.result()
+            except Exception as error:
+                decompressed[assembly_dir] = error
+                continue
+            if isinstance(decompressed[assembly_dir], list):
+                decompressed[assembly_dir].append(out)
+
+    return decompressed
+
+
 def parse_assembly_report(assembly_dir):
     """
     Parses information from assembly_report. Uses information to rename.
@@ -150,6 +240,13 @@ if __name__ == "__main__":
         "--input",
         help="Genome directory or directory containing multiple assembly directories.",
     )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        help="Number of files to decompress at the same time. Default is set in Abacat config file.",
+        type=int,
+        default=CONFIG["threads"],
+    )
     args = parser.parse_args()
 
     if not args.input:
@@ -160,16 +257,24 @@ if __name__ == "__main__":
     def main():
         # Check if it is a single assembly directory or multiple:
         if "annotation_hashes.txt" in os.listdir(args.input):
-            ls_and_decompress(args.input)
+            ls_and_decompress(args.input, threads=args.threads)
             rename_assembly(args.input)
 
         else:
-            directories = os.listdir(args.input)
+            directories = [
+                os.path.join(args.input, directory)
+                for directory in os.listdir(args.input)
+            ]
+            directories = [i for i in directories if os.path.isdir(i)]
+            decompressed = ls_and_decompress_dirs(directories, threads=args.threads)
             success, failure = 0, 0
             for directory in directories:
+                error = decompressed[os.path.abspath(directory)]
+                if isinstance(error, Exception):
+                    print(f"Could not decompress the files of {directory}: {error}")
+                    failure += 1
+                    continue
                 try:
-                    directory = os.path.join(args.input, directory)
-                    ls_and_decompress(directory)
                     new_dir = rename_assembly(directory)
                     if os.path.isdir(new_dir):
                         success += 1
@@ -2,12 +2,11 @@
 Put all assembly report information into a single table.
 Usage:
 
-python assembly_report_extractor.py <PATH TO REPORTS> <PATH OF OUTPUT DATAFRAME>
+python assembly_report_extractor.py <PATH TO REPORTS> <PATH OF OUTPUT TABLE>
 
 Where <PATH TO REPORTS> is a directory containing assembly reports, and
-And <PATH OF OUTPUT DATAFRAME> is your output file name (.csv extension).
-
-# TODO: Fix append method to df.
+And <PATH OF OUTPUT TABLE> is your output file prefix. A .tsv table, a columnar
+(.parquet or .feather) table and a _failures.tsv table are written with it.
 
 'Premature optimization is the root of all evil.' Donald Knuth.
 
@@ -17,7 +16,10 @@ import os
 import sys
 import argparse
 import pandas as pd
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from abacat.abacat_helper import timer_wrapper
+from abacat.config import CONFIG
 
 
 def dict_from_report(report):
@@ -25,8 +27,8 @@ def dict_from_report(report):
     Makes a dictionary from the report, which will then be converted into a dataframe.
     """
     with open(report) as f:
-        r = f.readlines()
-        r = r[:15]
+        # Only the header is needed, don't read the whole report.
+        r = list(islice(f, 15))
         r = [line.strip() for line in r]
         r = [line.replace("# ", "") for line in r]
         r = [line.split(":") for line in r]
@@ -37,9 +39,97 @@ def dict_from_report(report):
         return dict_
 
 
+def parse_report(report):
+    """
+    Wraps dict_from_report so that a worker never raises.
+
+    :param report: Path to an assembly report.
+    :return: Tuple of (dict_, error). One of them is always None.
+    """
+    try:
+        dict_ = dict_from_report(report)
+        if len(dict_) < 2:
+            raise ValueError("No report fields found.")
+        return dict_, None
+    except Exception as error:
+        return None, f"{type(error).__name__}: {error}"
+
+
+def aggregate_reports(reports, threads=CONFIG["threads"], chunksize=256):
+    """
+    Parses many assembly reports in parallel and collects them into column lists.
+
+    :param reports: List of paths to assembly reports.
+    :param threads: Number of worker processes.
+    :param chunksize: Number of reports sent to a worker at a time.
+    :return: Tuple of (reports dataframe, failures dataframe).
+    """
+    columns, n = dict(), 0
+    failures = {"report": [], "error": []}
+
+    if threads > 1:
+        executor = ProcessPoolExecutor(max_workers=threads)
+        parsed = executor.map(parse_report, reports, chunksize=chunksize)
+    else:
+        executor = None
+        parsed = map(parse_report, reports)
+
+    try:
+        for report, (dict_, error) in zip(reports, parsed):
+            if error:
+                failures["report"].append(report)
+                failures["error"].append(error)
+                continue
+            for key in dict_:
+                if key not in columns:
+                    columns[key] = [None] * n
+            for key, values in columns.items():
+                values.append(dict_.get(key))
+            n += 1
+    finally:
+        if executor:
+            executor.shutdown()
+
+    return pd.DataFrame(columns), pd.DataFrame(failures)
+
+
+def write_reports(df, failures, output, fmt="parquet"):
+    """
+    Writes the aggregated reports as TSV and as a columnar file, and the failures as TSV.
+
+    :param df: Reports dataframe from aggregate_reports.
+    :param failures: Failures dataframe from aggregate_reports.
+    :param output: Output prefix.
+    :param fmt: Columnar format. Either 'parquet', 'feather' or None to only write TSV.
+    :return: Dict with the written files.
+    """
+    if fmt and fmt not in ("parquet", "feather"):
+        raise ValueError(f"Invalid format {fmt}. Choose 'parquet' or 'feather'.")
+
+    output_files = {
+        "tsv": output + ".tsv",
+        "failures": output + "_failures.tsv",
+    }
+    df.to_csv(output_files["tsv"], sep="\t", index=False)
+    failures.to_csv(output_files["failures"], sep="\t", index=False)
+
+    if fmt:
+        output_files[fmt] = f"{output}.{fmt}"
+        try:
+            if fmt == "parquet":
+                df.to_parquet(output_files[fmt], index=False)
+            else:
+                df.to_feather(output_files[fmt])
+        except ImportError:
+            print(f"Could not write {fmt} file, please install pyarrow. Wrote TSV only.")
+            del output_files[fmt]
+
+    return output_files
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="A script to put NCBI Genome reports into a csv file."
+        description="A script to put NCBI Genome reports into a single table."
     )
     parser.add_argument(
         "-i", "--input", help="Genome report or path with assembly_reports."
@@ -47,8 +137,21 @@ if __name__ == "__main__":
     parser.add_argument(
         "-o",
         "--output",
-        help="Path to output .csv file.",
-        default="assembly_reports.csv",
+        help="Output prefix. Extensions are added for each written table.",
+        default="assembly_reports",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        help="Columnar output format, 'parquet' or 'feather'. Use 'none' to only write TSV.",
+        default="parquet",
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        help="Number of worker processes. Default is set in Abacat config file.",
+        type=int,
+        default=CONFIG["threads"],
     )
     args = parser.parse_args()
 
@@ -58,36 +161,29 @@ if __name__ == "__main__":
 
     @timer_wrapper
     def main():
-        if os.path.isfile(args.input):
-            output = os.path.splitext(args.input)[0] + ".csv"
-            dict_ = dict_from_report(args.input)
-            df = pd.DataFrame(dict_, index=[0])
-            if df.shape[1] < 2:
-                raise Exception("Invalid input. Please check your input file.")
-
-            df.to_csv(args.output, sep="\t", index=False)
-            print(f"Converted {args.input} into {output}")
+        output = os.path.splitext(args.output)[0]
+        fmt = None if args.format.lower() == "none" else args.format.lower()
 
+        if os.path.isfile(args.input):
+            reports = [args.input]
         elif os.path.isdir(args.input):
-            ix = 0
             reports = [
-                i for i in os.listdir(args.input) if i.endswith("assembly_report.txt")
+                os.path.join(os.path.abspath(args.input), i)
+                for i in os.listdir(args.input)
+                if i.endswith("assembly_report.txt")
             ]
-            print(f"You have {len(reports)} reports.")
-            for report in reports:
-                try:
-                    report = os.path.join(os.path.abspath(args.input), report)
-                    dict_ = dict_from_report(report)
-                    df = pd.DataFrame(dict_, index=[0])
-                    if ix == 0:
-                        df.to_csv(args.output, sep="\t", index=False)
-                    else:
-                        with open(args.output, "a") as f:
-                            df.to_csv(f, sep="\t", header=False, index=False)
-                    ix += 1
-                except:
-                    pass
-
-            print(f"Done. Reports written to {args.output}.")
+        else:
+            raise FileNotFoundError(args.input)
+
+        print(f"You have {len(reports)} reports.")
+        df, failures = aggregate_reports(reports, threads=args.threads)
+        if os.path.isfile(args.input) and len(failures):
+            raise Exception("Invalid input. Please check your input file.")
+
+        output_files = write_reports(df, failures, output, fmt=fmt)
+        print(
+            f"Done. {len(df)} reports written to {', '.join(output_files.values())}. "
+            f"{len(failures)} reports failed."
+        )
 
     main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Find duplicate genomes before running Prodigal, BLAST and fastANI on them.
+
+Public downloads often have the same assembly under several accessions, or assemblies
+that only differ by a contig. Each genome is fingerprinted once:
+
+    - A digest of its contigs, normalized to upper case and to the smaller of each
+      contig and its reverse complement, and sorted, so contig names, order and
+      orientation do not matter. Genomes with equal digests are exact duplicates.
+    - A small MinHash sketch. Genomes whose sketches have a Jaccard similarity of at
+      least min_jaccard are near duplicates.
+
+The first genome of each group is its representative. Pipelines run the representative
+only, and copy its outputs to the names of its duplicates. See copy_results().
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+from abacat.config import CONFIG
+from abacat.ani import genome_name
+from abacat.sketch import bottom_hashes
+from abacat.abacat_helper import timer_wrapper
+
+logger = logging.getLogger(__name__)
+
+_complement = str.maketrans("ACGT", "TGCA")
+
+
+def output_suffixes(dbs=None):
+    """
+    :param dbs: Databases whose annotation files are included. Default is all of CONFIG["db"].
+    :return: List of the suffixes of the output files of a genome, after its name.
+    """
+    suffixes = [
+        "_prodigal_genes.fna",
+        "_prodigal_proteins.faa",
+        "_prodigal_cds.gbk",
+        "_prodigal_scores.txt",
+    ]
+    for db in CONFIG["db"] if dbs is None else dbs:
+        suffixes += [f"_{db}.fasta", f"_{db}.hits"]
+        if db == "megares":
+            suffixes.append("_megares_summary.tsv")  # See megares.resistance_summary
+
+    return suffixes
+
+
+def fingerprint(contigs_file, size=CONFIG["duplicates"]["sketch_size"]):
+    """
+    :param contigs_file: FASTA file of a genome.
+    :param size: Number of hashes in the sketch.
+    :return: Tuple of (digest of the normalized contigs, sketch).
+    """
+    digests, seqs = [], []
+    with open(contigs_file) as handle:
+        for _, seq in SimpleFastaParser(handle):
+            seq = seq.upper()
+            seq = min(seq, seq[::-1].translate(_complement))
+            digests.append(hashlib.blake2b(seq.encode(), digest_size=16).digest())
+            seqs.append(seq)
+    digest = hashlib.blake2b(b"".join(sorted(digests)), digest_size=16).hexdigest()
+
+    return digest, bottom_hashes("N".join(seqs), size=size)
+
+
+def find_duplicates(
+    files,
+    names=None,
+    min_jaccard=CONFIG["duplicates"]["min_jaccard"],
+    size=CONFIG["duplicates"]["sketch_size"],
+):
+    """
+    :param files: Contigs files. The first genome of each group of duplicates is its representative.
+    :param names: Genome names. Default is the name of each file.
+    :param min_jaccard: Sketch Jaccard similarity of near duplicates. None only finds exact duplicates.
+    :param size: Number of hashes in the sketches.
+    :return: Dataframe indexed by genome name with file, fingerprint, representative, kind and jaccard
+             columns. kind is 'unique', 'exact' or 'near'. Representatives are 'unique' and their own
+             representative. jaccard is the sketch similarity to the representative.
+    """
+    names = list(names) if names is not None else [genome_name(i) for i in files]
+    digests, sketches = (
+        zip(*(fingerprint(i, size) for i in files)) if files else ((), ())
+    )
+    df = pd.DataFrame(
+        {"file": list(files), "fingerprint": list(digests)},
+        index=pd.Index(names, name="genome"),
+    )
+
+    # Exact duplicates: the first genome of each fingerprint.
+    first = (
+        df.reset_index().groupby("fingerprint", sort=False)["genome"].transform("first")
+    )
+    df["representative"] = first.to_numpy()
+    df["kind"] = np.where(df["representative"] == df.index, "unique", "exact")
+
+    # Near duplicates: connected components of the distinct genomes with similar sketches.
+    distinct = np.flatnonzero(df["kind"].to_numpy() == "unique")
+    if min_jaccard is not None and len(distinct) > 1:
+        vocabulary, columns = np.unique(
+            np.concatenate([sketches[i] for i in distinct]), return_inverse=True
+        )
+        lengths = np.array([len(sketches[i]) for i in distinct])
+        incidence = sparse.csr_matrix(
+            (
+                np.ones(len(columns), dtype=np.int32),
+                (np.repeat(np.arange(len(distinct)), lengths), columns),
+            ),
+            shape=(len(distinct), len(vocabulary)),
+        )
+        shared = (incidence @ incidence.T).tocoo()
+        union = lengths[shared.row] + lengths[shared.col] - shared.data
+        similar = (shared.row < shared.col) & (
+            shared.data >= min_jaccard * np.maximum(union, 1)
+        )
+        graph = sparse.coo_matrix(
+            (np.ones(similar.sum()), (shared.row[similar], shared.col[similar])),
+            shape=(len(distinct), len(distinct)),
+        )
+        _, component = csgraph.connected_components(graph, directed=False)
+        # Components are numbered in order of their first genome, which is the representative.
+        _, first = np.unique(component, return_index=True)
+        remap = dict(zip(df.index[distinct], df.index[distinct[first[component]]]))
+        df["representative"] = df["representative"].map(remap)
+        representative_fingerprint = df["fingerprint"][df["representative"]].to_numpy()
+        df.loc[df["fingerprint"] != representative_fingerprint, "kind"] = "near"
+
+    jaccard = []
+    position = dict((name, ix) for ix, name in enumerate(df.index))
+    for ix, representative in enumerate(df["representative"]):
+        a, b = sketches[ix], sketches[position[representative]]
+        shared = len(np.intersect1d(a, b, assume_unique=True))
+        jaccard.append(shared / max(len(a) + len(b) - shared, 1))
+    df["jaccard"] = jaccard
+
+    counts = df["kind"].value_counts()
+    logger.info(
+        f"Fingerprinted {len(df)} genomes: {counts.get('exact', 0)} exact and "
+        f"{counts.get('near', 0)} near duplicates."
+    )
+
+    return df
+
+
+def read_duplicates(duplicates_file):
+    """
+    :param duplicates_file: Table written from find_duplicates, e.g. by this script.
+    :return: Dataframe as returned by find_duplicates.
+    """
+    return pd.read_csv(duplicates_file, sep="\t", index_col="genome")
+
+
+def copy_results(representative, duplicate, suffixes=None):
+    """
+    Copies the output files of a representative genome to the names of a duplicate, next to its contigs.
+    Gene ids in the copies are the representative's, as Prodigal names genes after their contigs.
+
+    :param representative: Contigs file of the representative.
+    :param duplicate: Contigs file of the duplicate.
+    :param suffixes: Suffixes of the files to copy. Default is output_suffixes().
+    :return: List of the files written.
+    """
+    source = os.path.join(os.path.dirname(representative), genome_name(representative))
+    target = os.path.join(os.path.dirname(duplicate), genome_name(duplicate))
+    copied = []
+    for suffix in output_suffixes() if suffixes is None else suffixes:
+        if os.path.isfile(source + suffix):
+            shutil.copyfile(source + suffix, target + suffix)
+            copied.append(target + suffix)
+    if copied:
+        logger.info(f"Copied {len(copied)} files of {source} to {target}.")
+
+    return copied
+
+
+if __name__ == "__main__":
+    from abacat.collection import from_directory
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="""
+    Flags exact and near duplicate genomes of a directory, and writes a table of their representatives.
+    Pass the table to the pipelines to skip the duplicates.
+    """)
+    parser.add_argument(
+        "-i", "--input", required=True, help="Directory of contigs files."
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Output table. Default is duplicates.tsv in the input directory.",
+    )
+    parser.add_argument(
+        "-j",
+        "--min-jaccard",
+        type=float,
+        default=CONFIG["duplicates"]["min_jaccard"],
+        help="Sketch Jaccard similarity of near duplicates.",
+    )
+    args = parser.parse_args()
+
+    @timer_wrapper
+    def main():
+        collection = from_directory(args.input)
+        duplicates = collection.find_duplicates(min_jaccard=args.min_jaccard)
+        output = args.output or os.path.join(args.input, "duplicates.tsv")
+        duplicates.to_csv(output, sep="\t")
+        for genome, row in duplicates[duplicates["kind"] != "unique"].iterrows():
+            print(f"{genome}\t{row['kind']} duplicate of\t{row['representative']}")
+        print(f"Wrote {output}.")
+
+    main()
@@ -4,21 +4,33 @@ A file containing our main classes and functions.
 """
 
 import os
+import copy
 import json
 import logging
 import subprocess
+from collections.abc import Mapping
 import pandas as pd
 from Bio import SeqIO
-from Bio.Blast import NCBIXML
-from Bio.Blast.Applications import (
-    NcbiblastnCommandline,
-    NcbiblastpCommandline,
-    NcbiblastxCommandline,
+from Bio.SeqRecord import SeqRecord
+from abacat.abacat_helper import (
+    get_records,
+    is_fasta,
+    is_fasta_wrapper,
+    timer_wrapper,
+    dedup_fasta,
+    dedup_stats,
+    fan_out,
 )
-from abacat.abacat_helper import get_records, is_fasta, is_fasta_wrapper, timer_wrapper
-from abacat.prodigal import Prodigal
+from abacat.prodigal import Prodigal, parse_cds, parse_scores, low_confidence
+from abacat.translate import translate_fasta
 from abacat.deprecated import prokka
 from abacat.config import CONFIG, pathways
+from abacat.kmers import load_index
+from abacat.database import BlastDatabase
+from abacat import megares
+from abacat.shared import SharedSeqSet
+from abacat.memory import SeqSet
+from abacat.aligners import get_aligner, best_hits, PROTEIN_QUERIES
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
@@ -50,6 +62,96 @@ class Genome:
         if prodigal:
             self.load_prodigal()
 
+    def __getstate__(self):
+        """
+        Pickles gene and protein sets as shared memory handles, or as their origin files.
+        Sets whose origin is not a file, e.g. from set_annotation(write_hits=False), keep their records.
+        Share them first with Genome.share() to send a Genome to worker processes.
+        """
+        state = self.__dict__.copy()
+        for set_ in ("geneset", "protset"):
+            state[set_] = dict()
+            for kind, value in getattr(self, set_).items():
+                evicted = getattr(value, "evicted", False)
+                value = dict.copy(value)
+                records = value.pop("records", None)
+                if isinstance(records, SharedSeqSet):
+                    value["shared"] = records.handle
+                elif records is not None and not os.path.isfile(
+                    value.get("origin") or ""
+                ):
+                    value["records"] = records
+                elif records is not None:
+                    value["records_kind"] = (
+                        "dict" if isinstance(records, dict) else "list"
+                    )
+                elif evicted:
+                    value["records_kind"] = getattr(self, set_)[kind].records_kind
+                for table in ("df", "cds", "scores"):
+                    value.pop(table, None)
+                state[set_][kind] = value
+
+        return state
+
+    def __deepcopy__(self, memo):
+        """
+        Deep copies keep the loaded records, instead of reading them again from their origin
+        files as unpickled copies do. Shared sets are not copied.
+        """
+        for set_ in (self.geneset, self.protset):
+            for value in set_.values():
+                records = dict.get(value, "records")
+                if isinstance(records, SharedSeqSet):
+                    memo[id(records)] = records
+        genome = Genome.__new__(Genome)
+        memo[id(self)] = genome
+        genome.__dict__.update(copy.deepcopy(self.__dict__, memo))
+
+        return genome
+
+    def __setstate__(self, state):
+        """
+        Attaches to shared sets. The other sets are read again from their origin files when
+        their records are first accessed.
+        """
+        self.__dict__.update(state)
+        for set_ in ("geneset", "protset"):
+            sets = getattr(self, set_)
+            for kind, value in sets.items():
+                if "shared" in value:
+                    value["records"] = SharedSeqSet.attach(value.pop("shared"))
+                    sets[kind] = SeqSet(value)
+                elif "records_kind" in value and os.path.isfile(value["origin"]):
+                    sets[kind] = SeqSet(
+                        value, records_kind=value.pop("records_kind"), evicted=True
+                    )
+                else:
+                    sets[kind] = SeqSet(value)
+
+    def share(self):
+        """
+        Moves the Prodigal gene and protein sets to shared memory. See abacat.shared.
+        """
+        for set_ in (self.geneset, self.protset):
+            records = set_.get("prodigal", dict()).get("records")
+            if isinstance(records, dict):
+                set_["prodigal"]["records"] = SharedSeqSet.from_records(
+                    records.values()
+                )
+
+        return self
+
+    def release_shared(self):
+        """
+        Copies shared sets back to regular dicts of SeqRecords and frees their shared memory.
+        """
+        for set_ in (self.geneset, self.protset):
+            for value in set_.values():
+                records = value.get("records")
+                if isinstance(records, SharedSeqSet) and not records.closed:
+                    value["records"] = dict(records.items())
+                    records.close()
+
     """
     Sequence stats methods.
     """
@@ -212,18 +314,18 @@ class Genome:
             # Origin is the file from which the set came from
             origin = self.files["prodigal"]["genes"]
             try:
-                self.geneset["prodigal"] = dict()
-                self.geneset["prodigal"]["records"] = get_records(origin, kind=records)
-                self.geneset["prodigal"]["origin"] = origin
+                self.geneset["prodigal"] = SeqSet(
+                    origin=origin, records=get_records(origin, kind=records)
+                )
 
             except Exception:
                 raise
         elif kind in CONFIG["db"].keys():
             origin = self.files[kind]["annotation"]
             try:
-                self.geneset[kind] = dict()
-                self.geneset[kind]["records"] = get_records(origin, kind=records)
-                self.geneset[kind]["origin"] = origin
+                self.geneset[kind] = SeqSet(
+                    origin=origin, records=get_records(origin, kind=records)
+                )
             except Exception:
                 raise
         else:
@@ -251,19 +353,19 @@ class Genome:
         if kind == "prodigal":
             origin = self.files["prodigal"]["proteins"]
             try:
-                self.protset["prodigal"] = dict()
-                self.protset["prodigal"]["records"] = get_records(origin, kind=records)
                 # TODO: attach origin to a variable (stated by 'kind')
-                self.protset["prodigal"]["origin"] = origin
+                self.protset["prodigal"] = SeqSet(
+                    origin=origin, records=get_records(origin, kind=records)
+                )
 
             except Exception:
                 raise
         elif kind == "prokka":
             origin = self.files["prokka"]["proteins"]
             try:
-                self.protset["prokka"] = dict()
-                self.protset["prokka"]["records"] = get_records(origin, kind=records)
-                self.protset["prokka"]["origin"] = origin
+                self.protset["prokka"] = SeqSet(
+                    origin=origin, records=get_records(origin, kind=records)
+                )
             except Exception:
                 raise
 
@@ -316,17 +418,67 @@ class Genome:
                 len(self.geneset["prodigal"]["df"])
             ] = extract_row(record)
 
+    def load_prodigal_tables(self, tables=("cds", "scores")):
+        """
+        Loads the Prodigal GenBank features and start scores unto Genome.geneset["prodigal"],
+        as the 'cds' and 'scores' tables. See prodigal.parse_cds and prodigal.parse_scores.
+
+        :param tables: Tables to load. Tables without a file are skipped.
+        """
+        parsers = {"cds": parse_cds, "scores": parse_scores}
+        if "prodigal" not in self.geneset:
+            self.geneset["prodigal"] = SeqSet(origin=self.files["prodigal"]["genes"])
+        for table in tables:
+            if table in self.files["prodigal"]:
+                self.geneset["prodigal"][table] = parsers[table](
+                    self.files["prodigal"][table]
+                )
+                logger.info(
+                    f"Loaded Prodigal {table} table. It has {len(self.geneset['prodigal'][table])} rows."
+                )
+            else:
+                logger.warning(f"No Prodigal {table} file for {self.name}.")
+
+    def low_confidence(self, min_conf=CONFIG["prodigal"]["min_conf"], partial=False):
+        """
+        :param min_conf: Confidence, in percent, under which a gene is low confidence.
+        :param partial: Genes running off a contig edge are also low confidence.
+        :return: Ids of the low confidence Prodigal genes.
+        """
+        if "cds" not in self.geneset.get("prodigal", dict()):
+            self.load_prodigal_tables(tables=("cds",))
+        cds = self.geneset["prodigal"]["cds"]
+
+        return cds.index[low_confidence(cds, min_conf, partial)]
+
     @timer_wrapper
-    def run_prodigal(self, quiet=True, load_sets=["gene", "prot"]):
+    def run_prodigal(
+        self,
+        quiet=True,
+        load_sets=["gene", "prot"],
+        scores=False,
+        training=None,
+        train_on=None,
+    ):
         """
         Check for contigs file, run Prodigal on file.
+        Writes the start scores file too if scores is True.
+        With a training key, e.g. the species, reuses its cached Prodigal training file.
+        The first genome of a key trains it, on train_on contigs if given. See prodigal.train.
         """
         self.valid_contigs(quiet)
         input = self.files["contigs"]
         logger.info(
             f"Starting Prodigal. Your input file is {input}. Quiet setting is {quiet}."
         )
-        p = Prodigal(input, output=self.directory, quiet=quiet)
+        p = Prodigal(
+            input,
+            output=self.directory,
+            quiet=quiet,
+            scores=scores,
+            training=training,
+            train_on=train_on,
+        )
         self.files["prodigal"] = p.run()
         if "gene" in load_sets:
             self.load_geneset()
@@ -351,92 +503,228 @@ class Genome:
             self.load_protset("prokka")
 
     @timer_wrapper
-    def blast_seqs(self, db, blast="n", evalue=CONFIG["blast"]["evalue"]):
+    def blast_seqs(
+        self,
+        db,
+        blast="n",
+        evalue=CONFIG["blast"]["evalue"],
+        prescreen=False,
+        aligner=None,
+    ):
         """
         Blasts geneset.
         :param db: From config.py db
+        :param blast: 'blastn', 'blastp' or 'blastx'. blastp searches the Prodigal proteins, or the genes
+                      translated in-process if there is no proteins file. Hits are kept under the gene ids.
         :param evalue: evalue to use in Blast
+        :param prescreen: Only blast genes sharing k-mers with db (see Genome.prescreen).
+                          Use 'only' to report those genes without running Blast. Ignored, with a
+                          warning, for protein databases.
+        :param aligner: 'blast', 'diamond' or 'mmseqs'. Default is the one of db in CONFIG["aligner"].
+        :return: Dict with the number of queries, unique queries, their dedup ratio and hits. With a
+                 prescreen, also the number of genes screened and of candidates among them.
         """
         try:
-            db_path = CONFIG["db"][db]
+            aligner = get_aligner(db, blast=blast, backend=aligner, evalue=evalue)
         except KeyError:
             logger.error(
-                f"Choose a valid database from {CONFIG['db'][db]}.", exc_info=True
+                f"Choose a valid database from {list(CONFIG['db'])}.", exc_info=True
             )
+            raise
         query = self.files["prodigal"]["genes"]
-        out = os.path.join(self.directory, self.name + f"_{db}_blast.xml")
+        out = os.path.join(self.directory, self.name + f"_{db}_{aligner.name}.tsv")
         self.files[db] = dict()
-        self.files[db]["xml"] = out
-        logger.info(f"Blasting {self.name} to {out}.")
-
-        def blast_method(*args, **kwargs):
-            if blast in ("n", "nucl", "nucleotide", "blastn"):
-                blast_cmd = NcbiblastnCommandline(*args, **kwargs)
-            elif blast in ("p", "prot", "protein", "blastp"):
-                blast_cmd = NcbiblastpCommandline(*args, **kwargs)
-            elif blast in ("x", "blastx"):
-                blast_cmd = NcbiblastxCommandline(*args, **kwargs)
-            else:
-                raise Exception(
-                    "Choose a valid option from 'blastn', 'blastp' or 'blastx'."
-                )
 
-            return blast_cmd
+        if prescreen and BlastDatabase(db).dbtype != "nucl":
+            # K-mer indexes are nucleotide only, and would screen out every gene.
+            logger.warning(
+                f"{db} is not a nucleotide database, so genes cannot be prescreened. Searching all of them."
+            )
+            prescreen = False
+        screened = dict()
+        if prescreen:
+            candidates = self.prescreen(db)
+            # Genes screened and passed, as queries are the candidates only.
+            screened = {
+                "screened": len(self.geneset["prodigal"]["records"]),
+                "candidates": len(candidates),
+            }
+            if prescreen == "only" or not candidates:
+                self.annotate_candidates(db, candidates)
+                report = dedup_stats([(i, i) for i in candidates])
+                report.update(screened, hits=len(candidates))
+                return report
+            query = self.files[db]["candidates"]
+        elif blast in PROTEIN_QUERIES and os.path.isfile(
+            self.files["prodigal"].get("proteins", "")
+        ):
+            query = self.files["prodigal"]["proteins"]
+
+        translated = None
+        if blast in PROTEIN_QUERIES and query != self.files["prodigal"].get("proteins"):
+            translated = os.path.join(
+                self.directory, self.name + f"_{db}_translated.faa"
+            )
+            translate_fasta(query, translated)
+            query = translated
+
+        # Identical genes (e.g. transposases) are searched once and share their hits.
+        unique = os.path.join(self.directory, self.name + f"_{db}_unique.fna")
+        try:
+            members = dedup_fasta([query], unique)
+        finally:
+            if translated:
+                os.remove(translated)
+        report = dedup_stats(members)
+        report.update(screened)
+
+        self.files[db]["alignments"] = out
+        logger.info(f"Searching {self.name} with {aligner.name} to {out}.")
+
+        try:
+            aligner.search(unique, out)
+        finally:
+            os.remove(unique)
+        report["hits"] = self.parse_alignments(db, members=members)
+        logger.info(
+            f"Blasted {report['unique']} unique of {report['queries']} genes "
+            f"(dedup ratio {report['dedup_ratio']:.2f}), {report['hits']} hits."
+        )
+
+        return report
+
+    def prescreen(self, db, min_shared=CONFIG["kmer"]["min_shared"]):
+        """
+        Screens the Prodigal genes against the k-mer index of a database, and writes
+        the genes sharing at least min_shared k-mers with a reference to a FASTA file.
+        :param db: From config.py db
+        :param min_shared: Minimum number of shared k-mers.
+        :return: Dict from KmerIndex.screen.
+        """
+        index = load_index(db)
+        if "prodigal" not in self.geneset:
+            self.load_geneset()
+        records = self.geneset["prodigal"]["records"]
+        candidates = index.screen(records.values(), min_shared=min_shared)
+        logger.info(
+            f"{len(candidates)} of {len(records)} genes share {min_shared} or more k-mers with {db}."
+        )
+
+        # Read from the genes file, so candidates keep their Prodigal headers.
+        out = os.path.join(self.directory, self.name + f"_{db}_candidates.fna")
+        self.files.setdefault(db, dict())["candidates"] = out
+        with open(out, "w") as f:
+            genes = SeqIO.parse(self.files["prodigal"]["genes"], "fasta")
+            SeqIO.write((i for i in genes if i.id in candidates), f, "fasta")
+
+        return candidates
 
-        blast_cmd = blast_method(
-            query=query,
-            db=db_path,
-            evalue=evalue,
-            out=out,
-            outfmt=5,
-            num_alignments=5,
-            num_threads=CONFIG["threads"],
+    def annotate_candidates(self, db, candidates, write_hits=True):
+        """
+        Uses the best reference of each prescreen candidate as its annotation, without Blast.
+        :param db: From config.py db
+        :param candidates: Dict from Genome.prescreen.
+        """
+        self.set_annotation(
+            db,
+            [(id_, reference) for id_, (reference, _, _) in candidates.items()],
+            f"K-mer screen of {self.files['prodigal']['genes']} to {CONFIG['db'][db]}.",
+            write_hits=write_hits,
         )
-        stdout, stderr = blast_cmd()
-        self.parse_xml_blast(db)
-
-    def parse_xml_blast(self, db, write_hits=True):
-        """
-        Blasts XML out
-        :return:
-        """
-        hits = []
-        with open(self.files[db]["xml"]) as f:
-            blast_records = NCBIXML.parse(f)
-            for i in blast_records:
-                if i.alignments:
-                    i.id = i.query.split(" #")[0]
-                    i.query = " ".join((i.id, i.alignments[0].hit_def))
-                    hits.append(i)
-        logger.info(f"Found {len(hits)} hits.\n")
-
-        self.geneset[db] = dict()
-        self.geneset[db][
-            "origin"
-        ] = f"Blast of {self.files['prodigal']['genes']} to {CONFIG['db'][db]}."
-        self.geneset[db]["records"] = list()
-
-        for i in hits:
-            annotation = self.geneset["prodigal"]["records"][i.id]
-            annotation.description = i.query
-            self.geneset[db]["records"].append(annotation)
-            print(i.query)
+
+    def gene_lookup(self):
+        """
+        :return: Function returning the Prodigal gene of an id. Uses the loaded gene set, or
+                 streams the genes file, in which case ids must come in the order of the file,
+                 as they do in Blast output.
+        """
+        if "prodigal" in self.geneset and isinstance(
+            self.geneset["prodigal"]["records"], Mapping
+        ):
+            return self.geneset["prodigal"]["records"].__getitem__
+
+        genes = SeqIO.parse(self.files["prodigal"]["genes"], "fasta")
+
+        def lookup(id_):
+            for gene in genes:
+                if gene.id == id_:
+                    return gene
+            raise KeyError(
+                f"{id_} not found in {self.files['prodigal']['genes']}, or not in its order."
+            )
+
+        return lookup
+
+    def set_annotation(self, db, hits, origin, write_hits=True, keep_records=True):
+        """
+        Sets geneset[db] to the Prodigal genes with a hit, as new records described as 'id hit'.
+        Hits are streamed to the .fasta and .hits files as they come, so only the kept records use memory.
+        :param db: From config.py db
+        :param hits: Iterable of (gene id, hit description) tuples.
+        :param origin: Description of where the hits came from. Replaced by the annotation file if written.
+        :param write_hits: Write the .fasta and .hits files.
+        :param keep_records: Keep the annotated records in geneset[db]. Forced if write_hits is False.
+        """
+        keep_records = keep_records or not write_hits
+        self.geneset[db] = SeqSet(origin=origin)
+        records = list()
+        self.files.setdefault(db, dict())
+        lookup = self.gene_lookup()
 
         if write_hits:
             out_f = os.path.join(self.directory, self.name + f"_{db}.fasta")
             out_h = os.path.join(self.directory, self.name + f"_{db}.hits")
+            fasta = open(out_f, "w", buffering=2 ** 20)
+            hits_file = open(out_h, "w", buffering=2 ** 20)
+
+        n_hits = 0
+        try:
+            for id_, hit in hits:
+                gene = lookup(id_)
+                description = " ".join((id_, hit))
+                if write_hits:
+                    fasta.write(f">{description}\n{gene.seq}\n")
+                    hits_file.write(description + "\n")
+                if keep_records:
+                    records.append(
+                        SeqRecord(gene.seq, id=id_, name=id_, description=description)
+                    )
+                n_hits += 1
+        finally:
+            if write_hits:
+                fasta.close()
+                hits_file.close()
+        logger.info(f"Found {n_hits} hits.\n")
+
+        if write_hits:
             self.files[db]["annotation"] = out_f
             self.files[db]["hits"] = out_h
-            with open(out_f, "w") as f:
-                SeqIO.write(self.geneset[db]["records"], f, "fasta")
+            self.geneset[db]["origin"] = out_f
+            logger.info(f"Wrote {n_hits} annotated sequences to {out_f}.")
+        # Set once complete, so the memory budget counts all of them.
+        if keep_records:
+            self.geneset[db]["records"] = records
 
-            with open(out_h, "w") as f:
-                for i in [j.description for j in self.geneset[db]["records"]]:
-                    f.write(i + "\n")
+        return n_hits
 
-            logger.info(
-                f"Wrote {len(self.geneset[db]['records'])} annotated sequences to {out_f}."
-            )
+    def parse_alignments(self, db, write_hits=True, keep_records=True, members=None):
+        """
+        Streams the tabular hits of an aligner into geneset[db], keeping the best hit of each query.
+        See abacat/aligners.py and Genome.set_annotation.
+        :param members: List from abacat_helper.dedup_fasta, if the query was deduplicated.
+        :return: Number of hits.
+        """
+        hits = best_hits(self.files[db]["alignments"])
+        if members is not None:
+            hits = fan_out(hits, members)
+
+        return self.set_annotation(
+            db,
+            hits,
+            f"Search of {self.files['prodigal']['genes']} to {CONFIG['db'][db]}.",
+            write_hits=write_hits,
+            keep_records=keep_records,
+        )
 
     def to_json(self, out_path=None):
         """
@@ -455,15 +743,17 @@ class Genome:
             json.dump(json_out, f, indent=3)
         logger.info(f"Wrote json file of {self.name} to {out_path}.")
 
-    def run_pathways(self, info=True, evalue=10 ** -3):
+    def run_pathways(self, info=True, evalue=10 ** -3, blast="blastp"):
         """
         Takes the phenotyping geneset records and checks them against the pathways object
         from the CONFIG module.
+        :param blast: 'blastp' searches the Prodigal proteins against the phenotyping database,
+                      'blastx' the genes in all six frames.
         :return: pathway genes, a dict containing pathways as keys and identified records as values.
         """
         if "phenotyping" not in self.files.keys():
             logger.info("Phenotyping files not found. Running BLAST now.")
-            self.blast_seqs(db="phenotyping", blast="blastx", evalue=evalue)
+            self.blast_seqs(db="phenotyping", blast=blast, evalue=evalue)
         elif "phenotyping" not in self.geneset.keys():
             logger.info("Phenotyping records not found. Loading from BLAST out.")
             self.load_geneset(kind="phenotyping")
@@ -483,6 +773,14 @@ class Genome:
             if info:
                 logger.info(f"Found {len(self.pathways[k])} genes for {k}.")
 
+    def resistance_summary(self, write=True):
+        """
+        Joins the MEGARes hits to their class, mechanism and group. Run blast_seqs(db="megares") first.
+        :param write: Write the summary to <name>_megares_summary.tsv, next to the genome files.
+        :return: Dataframe with a row per annotated gene and its class, mechanism and group.
+        """
+        return megares.resistance_summary(self, write=write)
+
 
 @is_fasta_wrapper
 def from_fasta(fasta_file, run_prodigal=False, load_prodigal=False):
@@ -509,9 +807,10 @@ def from_fasta(fasta_file, run_prodigal=False, load_prodigal=False):
     return genome
 
 
-def from_json(json_file):
+def from_json(json_file, load_sets=True):
     """
     :param json_file: A json file like the one exported from Genome.to_json()
+    :param load_sets: Load the Prodigal gene and protein sets. Set to False for a lighter instance.
     :return: A genome instance.
     """
     logger.info(f"Loading genome from {json_file}.")
@@ -525,8 +824,9 @@ def from_json(json_file):
             setattr(g, attribute, j[attribute])
             logger.info(f"Loaded {attribute} to {g.name}.")
 
-    g.load_geneset()
-    g.load_protset()
+    if load_sets:
+        g.load_geneset()
+        g.load_protset()
 
     del j
     return g
@@ -0,0 +1,257 @@
+"""
+Exact nucleotide k-mer index of a reference database, to screen genes in-process.
+
+Only a handful of the ~3k genes of a genome have a hit against MEGARes, but BLAST has
+to search all of them. A gene that shares no 21-mer with any reference will not have a
+significant BLAST hit either, so the index is used to only BLAST the genes that do.
+
+The index is built once per database and stored as .npy arrays, loaded with mmap.
+"""
+
+import os
+import json
+import logging
+import subprocess
+import numpy as np
+from Bio import SeqIO
+from abacat.config import CONFIG
+from abacat.database import BlastDatabase
+
+logger = logging.getLogger(__name__)
+
+# A, C, G, T are encoded from 0 to 3, anything else as 4.
+_encoding = np.full(256, 4, dtype=np.uint8)
+for _ix, _nt in enumerate("ACGT"):
+    _encoding[ord(_nt)] = _encoding[ord(_nt.lower())] = _ix
+
+
+def encode_nucleotides(seq):
+    """
+    :param seq: Nucleotide sequence as a string or bytes.
+    :return: uint8 array with A, C, G, T as 0 to 3 and other characters as 4.
+    """
+    if isinstance(seq, str):
+        seq = seq.encode()
+    return _encoding[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def canonical_kmers(seq, k=CONFIG["kmer"]["k"], positions=False):
+    """
+    Each k-mer and its reverse complement are packed in 2 bits per base, and the
+    smallest of the two is kept, so a gene matches its reference on either strand.
+
+    :param seq: Nucleotide sequence as a string or bytes.
+    :param k: k-mer length, at most 32.
+    :param positions: Also return the start position of each k-mer.
+    :return: uint64 array with the canonical k-mer of each position. k-mers with N are skipped.
+    """
+    codes = encode_nucleotides(seq)
+    n = len(codes) - k + 1
+    if n < 1:
+        empty = np.empty(0, dtype=np.uint64)
+        return (empty, np.empty(0, dtype=np.int64)) if positions else empty
+
+    bases = (codes & 3).astype(np.uint64)
+    complement = np.uint64(3) - bases
+    fwd = np.zeros(n, dtype=np.uint64)
+    rev = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        fwd <<= np.uint64(2)
+        fwd |= bases[j : j + n]
+        rev |= complement[j : j + n] << np.uint64(2 * j)
+
+    # Skip k-mers containing anything other than A, C, G, T.
+    invalid = np.concatenate(([0], np.cumsum(codes > 3)))
+    valid = (invalid[k:] - invalid[:-k]) == 0
+
+    kmers = np.minimum(fwd, rev)[valid]
+    if positions:
+        return kmers, np.flatnonzero(valid)
+
+    return kmers
+
+
+def reference_records(db):
+    """
+    Reads the sequences of a database from its FASTA file. If only the BLAST database
+    files are present, as with the packaged MEGARes, they are extracted with blastdbcmd.
+
+    :param db: Database name, from CONFIG["db"].
+    :return: Iterable of (title, sequence) tuples.
+    """
+    db_path = CONFIG["db"][db]
+    if os.path.isfile(db_path):
+        for record in SeqIO.parse(db_path, "fasta"):
+            yield record.description, str(record.seq)
+    else:
+        out = subprocess.run(
+            ["blastdbcmd", "-db", db_path, "-entry", "all", "-outfmt", "%s %t"],
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        for line in out.stdout.decode().splitlines():
+            seq, _, title = line.partition(" ")
+            yield title, seq
+
+
+def db_signature(db):
+    """
+    :return: Size and modification time of the files of a database, to tell if an index is stale.
+    """
+    db_path = CONFIG["db"][db]
+    directory, name = os.path.split(db_path)
+    signature = []
+    for file in sorted(i for i in os.listdir(directory) if i.startswith(name)):
+        stat = os.stat(os.path.join(directory, file))
+        signature.append([file, stat.st_size, stat.st_mtime])
+
+    return signature
+
+
+class KmerIndex:
+    """
+    KmerIndex, a sorted array of the unique canonical k-mers of a database,
+    with the reference each k-mer was first seen in.
+    """
+
+    def __init__(self, k=CONFIG["kmer"]["k"]):
+        super(KmerIndex, self).__init__()
+        self.k = k
+        self.kmers = np.empty(0, dtype=np.uint64)
+        self.refs = np.empty(0, dtype=np.int32)
+        self.names = []  # Reference titles, as in BLAST's hit_def
+        self.signature = None
+
+    def __len__(self):
+        return len(self.kmers)
+
+    def build(self, records):
+        """
+        :param records: Iterable of (title, sequence) tuples.
+        """
+        kmers, refs = [], []
+        for ix, (title, seq) in enumerate(records):
+            self.names.append(title)
+            k = np.unique(canonical_kmers(seq, self.k))
+            kmers.append(k)
+            refs.append(np.full(len(k), ix, dtype=np.int32))
+        if not kmers:
+            return
+
+        kmers, refs = np.concatenate(kmers), np.concatenate(refs)
+        self.kmers, first = np.unique(kmers, return_index=True)
+        self.refs = refs[first]
+        logger.info(
+            f"Built index with {len(self)} {self.k}-mers from {len(self.names)} references."
+        )
+
+    def save(self, prefix):
+        """
+        Writes prefix.kmers.npy, prefix.refs.npy and prefix.json.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        np.save(prefix + ".kmers.npy", self.kmers)
+        np.save(prefix + ".refs.npy", self.refs)
+        with open(prefix + ".json", "w") as f:
+            json.dump(
+                {"k": self.k, "names": self.names, "signature": self.signature}, f
+            )
+
+    def load(self, prefix, mmap=True):
+        """
+        Loads an index written with save(). The arrays are memory mapped by default.
+        """
+        with open(prefix + ".json") as f:
+            j = json.load(f)
+        self.k, self.names, self.signature = j["k"], j["names"], j["signature"]
+        mmap_mode = "r" if mmap else None
+        self.kmers = np.load(prefix + ".kmers.npy", mmap_mode=mmap_mode)
+        self.refs = np.load(prefix + ".refs.npy", mmap_mode=mmap_mode)
+
+    def screen(self, records, min_shared=CONFIG["kmer"]["min_shared"]):
+        """
+        :param records: Iterable of SeqRecords, e.g. a Prodigal gene set.
+        :param min_shared: Minimum number of k-mers shared with a reference to report a gene.
+        :return: Dict with ids of candidate genes as keys and tuples of
+                 (reference title, shared k-mers, fraction of the gene's k-mers) as values.
+        """
+        candidates = dict()
+        if not len(self):
+            return candidates
+
+        # Genes are joined with N, which no k-mer can span, and screened all at once.
+        ids, seqs = [], []
+        for record in records:
+            ids.append(record.id)
+            seqs.append(str(record.seq))
+        if not ids:
+            return candidates
+        offsets = np.cumsum([0] + [len(i) + 1 for i in seqs])
+        kmers, starts = canonical_kmers("N".join(seqs), self.k, positions=True)
+        genes = np.searchsorted(offsets, starts, side="right") - 1
+        totals = np.bincount(genes, minlength=len(ids))
+
+        ix = np.searchsorted(self.kmers, kmers)
+        ix[ix == len(self.kmers)] = 0
+        found = self.kmers[ix] == kmers
+        shared = np.bincount(genes[found], minlength=len(ids))
+
+        # The best reference of each gene is the one it shares the most k-mers with.
+        pairs, counts = np.unique(
+            np.stack((genes[found], self.refs[ix[found]]), axis=1),
+            axis=0,
+            return_counts=True,
+        )
+        order = np.lexsort((-counts, pairs[:, 0]))
+        pairs = pairs[order]
+        first = np.ones(len(pairs), dtype=bool)
+        first[1:] = pairs[1:, 0] != pairs[:-1, 0]
+
+        for gene, ref in pairs[first]:
+            if shared[gene] >= min_shared:
+                candidates[ids[gene]] = (
+                    self.names[ref],
+                    int(shared[gene]),
+                    shared[gene] / totals[gene],
+                )
+
+        return candidates
+
+
+def index_prefix(db, k=CONFIG["kmer"]["k"]):
+    """
+    :return: Path prefix of the cached index of a database.
+    """
+    return os.path.join(CONFIG["cache_dir"], "kmer_index", f"{db}_k{k}")
+
+
+def load_index(db, k=CONFIG["kmer"]["k"], rebuild=False):
+    """
+    Loads the cached k-mer index of a database, building it first if it is missing
+    or if the database files changed since it was built.
+
+    :param db: Database name, from CONFIG["db"].
+    :param k: k-mer length.
+    :param rebuild: Build the index even if a valid one is cached.
+    :return: A KmerIndex instance.
+    """
+    if BlastDatabase(db).dbtype != "nucl":
+        raise ValueError(
+            f"{db} is not a nucleotide database. K-mer indexes are nucleotide only."
+        )
+    prefix = index_prefix(db, k)
+    index = KmerIndex(k)
+    signature = db_signature(db)
+    if not rebuild and os.path.isfile(prefix + ".json"):
+        index.load(prefix)
+        if index.signature == signature:
+            return index
+        logger.info(f"{db} changed since its k-mer index was built. Rebuilding it.")
+
+    index = KmerIndex(k)
+    index.build(reference_records(db))
+    index.signature = signature
+    index.save(prefix)
+    logger.info(f"Wrote {db} k-mer index to {prefix}.")
+
+    return index
@@ -0,0 +1,191 @@
+"""
+Resistance class, mechanism and group of MEGARes hits.
+
+BLAST hits against MEGARes only carry the reference header. The packaged annotation
+and header mapping tables are read once into a header-keyed index, cached as a pickle
+under CONFIG["cache_dir"], and hits are joined to it with vectorized lookups.
+"""
+
+import os
+import logging
+import pandas as pd
+from abacat.config import CONFIG
+from abacat.abacat_helper import read_hits
+
+logger = logging.getLogger(__name__)
+
+ANNOTATION_COLUMNS = ("class", "mechanism", "group")
+
+# Version of the index layout. Cached indexes of other versions are built again.
+INDEX_VERSION = 2
+
+# Separator of the NCBI source headers listed in one field of the mappings table.
+NCBI_HEADERS = r" (?=gi\|)"
+
+_index = None  # Loaded index, shared by every genome in the process.
+
+
+def files_signature():
+    """
+    :return: Size and modification time of the annotation files, to tell if the cache is stale.
+    """
+    return [
+        (os.stat(CONFIG["megares"][i]).st_size, os.stat(CONFIG["megares"][i]).st_mtime)
+        for i in ("annotations", "mappings")
+    ]
+
+
+def build_index():
+    """
+    Reads the MEGARes annotation and header mapping tables.
+
+    :return: Dict with 'annotations', a dataframe indexed by MEGARes header, and 'aliases',
+             a Series with MEGARes headers indexed by both MEGARes and external headers.
+    """
+    annotations = pd.read_csv(CONFIG["megares"]["annotations"], index_col="header")
+    annotations = annotations[list(ANNOTATION_COLUMNS)].astype("category")
+
+    mappings = pd.read_csv(CONFIG["megares"]["mappings"], sep="\t")
+    source, header = mappings.columns[2], mappings.columns[1]
+    # Only NCBI lists several source headers, each starting with 'gi|'. Headers of the other
+    # sources have spaces of their own, e.g. CARD descriptions, and are kept whole.
+    aliases = mappings[source].astype(str).str.split(NCBI_HEADERS, regex=True)
+    mappings = mappings.assign(alias=aliases).explode("alias")
+    aliases = pd.concat(
+        (
+            pd.Series(annotations.index, index=annotations.index),
+            pd.Series(mappings[header].values, index=mappings["alias"].values),
+        )
+    )
+    aliases = aliases[~aliases.index.duplicated()]
+
+    return {
+        "annotations": annotations,
+        "aliases": aliases,
+        "signature": files_signature(),
+        "version": INDEX_VERSION,
+    }
+
+
+def load_index(rebuild=False):
+    """
+    Loads the MEGARes index from memory, from the cache, or builds and caches it.
+
+    :param rebuild: Build the index even if a valid one is cached.
+    :return: Dict from build_index.
+    """
+    global _index
+    if _index is not None and not rebuild:
+        return _index
+
+    cache = os.path.join(CONFIG["cache_dir"], "megares", "annotation_index.pkl")
+    if not rebuild and os.path.isfile(cache):
+        index = pd.read_pickle(cache)
+        if (
+            index.get("version") == INDEX_VERSION
+            and index["signature"] == files_signature()
+        ):
+            _index = index
+            return _index
+
+    logger.info("Building MEGARes annotation index.")
+    _index = build_index()
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    pd.to_pickle(_index, cache)
+
+    return _index
+
+
+def annotate_hits(hits):
+    """
+    Joins hits to their MEGARes class, mechanism and group.
+
+    :param hits: Dataframe with a 'hit' column holding the hit descriptions.
+    :return: hits with 'header' and annotation columns added.
+    """
+    index = load_index()
+    hit = hits["hit"].astype(str)
+    header = hit.map(index["aliases"])
+    # BLAST may keep only the first word of a header as the hit description.
+    first_word = hit.str.split(" ", n=1).str[0].map(index["aliases"])
+    header = header.where(header.notna(), first_word)
+    hits = hits.assign(header=header.astype(object))
+    hits = hits.join(index["annotations"], on="header")
+
+    # Headers missing from the tables still have class|mechanism|group as their last fields.
+    missing = hits["class"].isna()
+    if missing.any():
+        fields = hit[missing].str.split("|")
+        for ix, column in enumerate(ANNOTATION_COLUMNS):
+            values = fields.map(
+                lambda i: i[ix - 3].replace("_", " ") if len(i) >= 3 else None
+            )
+            hits[column] = hits[column].astype(object)
+            hits.loc[missing, column] = values
+
+    return hits
+
+
+def hits_table(hits_file, genome=None):
+    """
+    :param hits_file: A .hits file written by Genome.blast_seqs.
+    :param genome: Genome name, added as a column.
+    :return: Dataframe with 'gene' and 'hit' columns, and 'genome' if given.
+    """
+    hits = read_hits(hits_file)
+    df = pd.DataFrame({"gene": list(hits), "hit": list(hits.values())})
+    if genome:
+        df.insert(0, "genome", genome)
+
+    return df
+
+
+def resistance_summary(genome, write=True):
+    """
+    :param genome: A Genome instance with MEGARes hits.
+    :param write: Write the summary next to the genome files.
+    :return: Dataframe with a row per annotated gene and its class, mechanism and group.
+    """
+    if "records" in genome.geneset.get("megares", dict()):
+        records = genome.geneset["megares"]["records"]
+        hits = [i.description.split(" ", 1) for i in records]
+        hits = pd.DataFrame(
+            {"gene": [i[0] for i in hits], "hit": [i[-1] for i in hits]}
+        )
+    else:
+        hits = hits_table(genome.files["megares"]["hits"])
+
+    summary = annotate_hits(hits)
+    if write:
+        out = os.path.join(genome.directory, genome.name + "_megares_summary.tsv")
+        summary.to_csv(out, sep="\t", index=False)
+        genome.files["megares"]["summary"] = out
+        logger.info(f"Wrote resistance summary of {genome.name} to {out}.")
+
+    return summary
+
+
+def resistance_matrix(genomes, level="class"):
+    """
+    Builds a genome by class (or mechanism, or group) matrix of MEGARes hits.
+
+    :param genomes: A GenomeCollection, or a list of Genome instances.
+    :param level: 'class', 'mechanism' or 'group'.
+    :return: Dataframe with the number of annotated genes per genome and level.
+    """
+    tables = []
+    for genome in genomes:
+        if isinstance(genome, str):  # GenomeCollection iterates over names
+            name, files = genome, genomes.genome_files(genome)
+        else:
+            name, files = genome.name, genome.files
+        hits = files.get("megares", dict()).get("hits")
+        if hits and os.path.isfile(hits):
+            tables.append(hits_table(hits, genome=name))
+
+    if not tables:
+        return pd.DataFrame()
+
+    hits = annotate_hits(pd.concat(tables, ignore_index=True))
+
+    return pd.crosstab(hits["genome"], hits[level])
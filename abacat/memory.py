@@ -0,0 +1,236 @@
+"""
+A process-wide memory budget for the gene and protein sets of loaded genomes.
+
+Each Genome.geneset and Genome.protset entry is a SeqSet, a dict with 'records' and
+'origin'. Loaded records are counted against CONFIG["memory"]["budget"] (bytes, None
+for no budget). When the budget is exceeded, the records of the least recently used
+sets are dropped, and read again from their origin file the next time
+set["records"] is accessed. Sets without an origin file, generators and shared sets
+are not counted and never evicted.
+
+Example:
+    CONFIG["memory"]["budget"] = 2 * 2 ** 30
+    for name in collection:
+        collection[name].run_pathways()
+    memory_stats()  # {'budget': 2147483648, 'resident_bytes': ..., 'evictions': ..., 'reloads': ...}
+"""
+
+import os
+import weakref
+import logging
+import threading
+from collections import OrderedDict
+from abacat.config import CONFIG
+from abacat.abacat_helper import get_records
+
+logger = logging.getLogger(__name__)
+
+# Estimated bytes of a SeqRecord besides its sequence and strings, and of its key in
+# a dict of records. Measured with tracemalloc on Prodigal gene sets.
+RECORD_OVERHEAD = 1000
+DICT_ENTRY_OVERHEAD = 280
+
+
+def records_size(records):
+    """
+    :param records: Dict or list of SeqRecords.
+    :return: Estimated bytes used by the records.
+    """
+    overhead = RECORD_OVERHEAD
+    if isinstance(records, dict):
+        overhead += DICT_ENTRY_OVERHEAD
+        records = records.values()
+
+    return sum(
+        len(i.seq) + len(i.id) + len(i.name) + len(i.description) + overhead
+        for i in records
+    )
+
+
+class MemoryBudget:
+    """
+    MemoryBudget, the resident SeqSets of the process in least recently used order.
+    """
+
+    def __init__(self):
+        super(MemoryBudget, self).__init__()
+        self.sets = OrderedDict()  # id of the SeqSet as keys, (weakref, bytes) as values.
+        self.resident_bytes = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.lock = threading.RLock()
+
+    @property
+    def budget(self):
+        return CONFIG["memory"]["budget"]
+
+    def register(self, seqset):
+        """
+        Counts the records of seqset, and evicts other sets if the budget is exceeded.
+        """
+        with self.lock:
+            self.forget(seqset)
+            size = records_size(dict.__getitem__(seqset, "records"))
+            self.sets[id(seqset)] = (
+                weakref.ref(seqset, lambda _, key=id(seqset): self._collected(key)),
+                size,
+            )
+            self.resident_bytes += size
+            self.enforce(keep=seqset)
+
+    def forget(self, seqset):
+        with self.lock:
+            _, size = self.sets.pop(id(seqset), (None, 0))
+            self.resident_bytes -= size
+
+    def _collected(self, key):
+        with self.lock:
+            _, size = self.sets.pop(key, (None, 0))
+            self.resident_bytes -= size
+
+    def touch(self, seqset):
+        with self.lock:
+            if id(seqset) in self.sets:
+                self.sets.move_to_end(id(seqset))
+
+    def enforce(self, keep=None):
+        """
+        Evicts the least recently used sets until the resident bytes fit in the budget.
+
+        :param keep: SeqSet not to evict, e.g. the one being accessed.
+        """
+        if self.budget is None:
+            return
+        with self.lock:
+            for key in list(self.sets):
+                if self.resident_bytes <= self.budget:
+                    break
+                seqset = self.sets[key][0]()
+                if seqset is None or seqset is keep:
+                    continue
+                seqset.evict()
+                self.evictions += 1
+            if self.resident_bytes > self.budget:
+                logger.warning(
+                    f"Loaded sets use {self.resident_bytes} bytes, over the budget of {self.budget}."
+                )
+
+    def stats(self):
+        """
+        :return: Dict with the budget, resident bytes, number of resident sets, evictions and reloads.
+        """
+        with self.lock:
+            return {
+                "budget": self.budget,
+                "resident_bytes": self.resident_bytes,
+                "resident_sets": len(self.sets),
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.evictions = 0
+            self.reloads = 0
+
+
+budget = MemoryBudget()
+
+
+class SeqSet(dict):
+    """
+    SeqSet, a gene or protein set of a Genome, {'records': ..., 'origin': ...}, whose
+    records may be evicted under the memory budget. Accessing 'records' reloads them
+    from the origin file if they were evicted.
+    """
+
+    def __init__(self, *args, records_kind=None, evicted=False, **kwargs):
+        """
+        :param records_kind: 'dict' or 'list', as in get_records. Default is the type of the records.
+        :param evicted: The records are not loaded yet, and are read from the origin on first access.
+        """
+        self.records_kind = records_kind
+        self.evicted = evicted
+        super(SeqSet, self).__init__(*args, **kwargs)
+        if dict.__contains__(self, "records"):
+            self.__setitem__("records", dict.__getitem__(self, "records"))
+
+    def __reduce__(self):
+        items = dict((k, v) for k, v in dict.items(self))
+        return (
+            self.__class__,
+            (items,),
+            {"records_kind": self.records_kind, "evicted": self.evicted},
+        )
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        if key == "records":
+            self.evicted = False
+            if self.trackable:
+                self.records_kind = "dict" if isinstance(value, dict) else "list"
+                budget.register(self)
+            else:
+                budget.forget(self)
+
+    def __getitem__(self, key):
+        if key == "records":
+            if self.evicted:
+                self.reload()
+            budget.touch(self)
+        return dict.__getitem__(self, key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        if key == "records":
+            budget.forget(self)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (key == "records" and self.evicted)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pop(self, key, *default):
+        if key == "records" and self.evicted:
+            self.reload()
+        if key == "records":
+            budget.forget(self)
+        return dict.pop(self, key, *default)
+
+    @property
+    def trackable(self):
+        """
+        :return: True if the records are a dict or list that can be read again from the origin file.
+        """
+        records = dict.get(self, "records")
+        origin = dict.get(self, "origin")
+        return (
+            type(records) in (dict, list)
+            and isinstance(origin, str)
+            and os.path.isfile(origin)
+        )
+
+    def evict(self):
+        """
+        Drops the records. They are read again from the origin file on next access.
+        """
+        dict.__delitem__(self, "records")
+        budget.forget(self)
+        self.evicted = True
+        logger.debug(f"Evicted records of {dict.get(self, 'origin')}.")
+
+    def reload(self):
+        logger.debug(f"Reloading records from {dict.get(self, 'origin')}.")
+        with budget.lock:
+            budget.reloads += 1
+        self["records"] = get_records(
+            dict.__getitem__(self, "origin"), kind=self.records_kind or "dict"
+        )
+
+
+def memory_stats():
+    """
+    :return: Counters of the memory budget, see MemoryBudget.stats().
+    """
+    return budget.stats()
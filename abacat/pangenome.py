@@ -0,0 +1,253 @@
+"""
+Group homologous proteins of many genomes into gene families.
+
+Instead of an all-vs-all BLAST, each protein is reduced to a small sketch of its
+k-mers (the ones with the lowest hash values). Proteins sharing a sketch k-mer are
+linked to the longest protein of that k-mer, as in Linclust, so the number of
+candidate pairs grows linearly with the number of proteins. Candidates are checked
+in-process by comparing their full k-mer sets, or by alignment with align=True,
+and a union-find joins the accepted pairs into families.
+"""
+
+import os
+import logging
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+from Bio import SeqIO
+from Bio.Align import PairwiseAligner
+from abacat.abacat_helper import UnionFind
+
+logger = logging.getLogger(__name__)
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+# Amino acids are encoded from 0 to 19, anything else (X, *, B, Z...) as 20.
+_encoding = np.full(256, len(AMINO_ACIDS), dtype=np.uint8)
+for _ix, _aa in enumerate(AMINO_ACIDS):
+    _encoding[ord(_aa)] = _encoding[ord(_aa.lower())] = _ix
+
+
+def protein_kmers(seq, k=5):
+    """
+    :param seq: Protein sequence as a string.
+    :param k: k-mer length. k-mers are encoded in base 21, so k must be at most 7.
+    :return: Sorted unique array of the k-mer codes of seq. k-mers with unknown residues are skipped.
+    """
+    codes = _encoding[np.frombuffer(seq.encode(), dtype=np.uint8)]
+    if len(codes) < k:
+        return np.empty(0, dtype=np.uint32)
+
+    windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+    valid = (windows < len(AMINO_ACIDS)).all(axis=1)
+    powers = len(AMINO_ACIDS) ** np.arange(k - 1, -1, -1, dtype=np.uint32)
+    kmers = (windows[valid].astype(np.uint32) * powers).sum(axis=1, dtype=np.uint32)
+
+    return np.unique(kmers)
+
+
+def kmer_hash(kmers):
+    """
+    Multiplicative hash used to pick sketch k-mers, so they are not biased
+    towards low-complexity k-mers like 'AAAAA'.
+    """
+    return (kmers.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+
+
+class ProteinClusters:
+    """
+    ProteinClusters, a class to cluster proteins of many genomes into gene families.
+
+    Example:
+        clusters = ProteinClusters()
+        clusters.add_collection(collection)
+        clusters.cluster()
+        clusters.matrix()
+    """
+
+    def __init__(self, k=5, sketch_size=24, identity=0.5, coverage=0.8, align=False):
+        """
+        :param k: k-mer length for the index.
+        :param sketch_size: Number of k-mers per protein in the index.
+        :param identity: Minimum identity of two proteins in the same family.
+        :param coverage: Minimum length ratio of two proteins in the same family.
+        :param align: Check identity with a global alignment instead of k-mer similarity. Slower.
+        """
+        super(ProteinClusters, self).__init__()
+        self.k = k
+        self.sketch_size = sketch_size
+        self.identity = identity
+        self.coverage = coverage
+        self.align = align
+        self.genomes = []  # Genome of each protein
+        self.ids = []  # Id of each protein
+        self.seqs = []  # Sequence of each protein, only kept when align=True
+        self.lengths = []
+        self.kmers = []  # Sorted k-mer codes of each protein
+        self.families = None  # Dataframe set by cluster()
+        self.stats = dict()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, genome, records):
+        """
+        :param genome: Genome name.
+        :param records: Iterable of protein SeqRecords, e.g. Genome.protset["prodigal"]["records"].values()
+        """
+        for record in records:
+            seq = str(record.seq).rstrip("*")
+            self.genomes.append(genome)
+            self.ids.append(record.id)
+            self.lengths.append(len(seq))
+            self.kmers.append(protein_kmers(seq, self.k))
+            if self.align:
+                self.seqs.append(seq)
+
+    def add_collection(self, collection):
+        """
+        Adds the Prodigal proteins of every genome in a GenomeCollection.
+        Uses the loaded protein sets of loaded genomes, and reads the protein files of the others.
+        """
+        for name in collection:
+            genome = collection.genomes.get(name)
+            if genome and "prodigal" in genome.protset:
+                records = genome.protset["prodigal"]["records"]
+                records = records.values() if isinstance(records, Mapping) else records
+            else:
+                proteins = collection.genome_files(name)["prodigal"]["proteins"]
+                if not os.path.isfile(proteins):
+                    logger.info(f"No Prodigal proteins file for {name}. Skipping it.")
+                    continue
+                records = SeqIO.parse(proteins, "fasta")
+            self.add(name, records)
+
+        logger.info(
+            f"Added {len(self)} proteins from {len(set(self.genomes))} genomes."
+        )
+
+    def candidate_pairs(self):
+        """
+        :return: Array of shape (n, 2) with unique candidate pairs of protein indices.
+        """
+        # Sketch: the sketch_size k-mers with the lowest hashes of each protein.
+        proteins, hashes = [], []
+        for ix, kmers in enumerate(self.kmers):
+            h = kmer_hash(kmers)
+            if len(h) > self.sketch_size:
+                h = np.partition(h, self.sketch_size)[: self.sketch_size]
+            hashes.append(h)
+            proteins.append(np.full(len(h), ix, dtype=np.int64))
+        if not hashes:
+            return np.empty((0, 2), dtype=np.int64)
+        proteins, hashes = np.concatenate(proteins), np.concatenate(hashes)
+        lengths = np.asarray(self.lengths)
+
+        # Group by hash, longest protein first. The first protein of each group is its center.
+        order = np.lexsort((proteins, -lengths[proteins], hashes))
+        proteins, hashes = proteins[order], hashes[order]
+        first = np.ones(len(hashes), dtype=bool)
+        first[1:] = hashes[1:] != hashes[:-1]
+        centers = proteins[
+            np.maximum.accumulate(np.where(first, np.arange(len(first)), 0))
+        ]
+
+        pairs = np.stack((proteins, centers), axis=1)[proteins != centers]
+        pairs = np.unique(pairs, axis=0)
+        self.stats["candidate_pairs"] = len(pairs)
+
+        return pairs
+
+    def pair_identity(self, i, j):
+        """
+        :return: Identity estimate of proteins i and j.
+        """
+        if self.align:
+            # With these scores the alignment score is the number of identical residues.
+            aligner = PairwiseAligner(match_score=1, mismatch_score=0, gap_score=0)
+            return aligner.score(self.seqs[i], self.seqs[j]) / max(
+                self.lengths[i], self.lengths[j]
+            )
+
+        a, b = self.kmers[i], self.kmers[j]
+        shared = len(np.intersect1d(a, b, assume_unique=True))
+        if not shared:
+            return 0.0
+        jaccard = shared / (len(a) + len(b) - shared)
+        # Mash estimate of identity from k-mer Jaccard similarity.
+        return (2 * jaccard / (1 + jaccard)) ** (1 / self.k)
+
+    def cluster(self):
+        """
+        Clusters the proteins into families.
+
+        :return: Dataframe with genome, protein, family and representative columns. Also set as self.families.
+        """
+        logger.info(f"Clustering {len(self)} proteins.")
+        uf = UnionFind(len(self))
+        accepted = 0
+        for i, j in self.candidate_pairs():
+            if uf.find(i) == uf.find(j):
+                continue  # Already in the same family, no need to check.
+            short, long = sorted((self.lengths[i], self.lengths[j]))
+            if short < self.coverage * long:
+                continue
+            if self.pair_identity(i, j) >= self.identity:
+                uf.union(i, j)
+                accepted += 1
+        self.stats["accepted_pairs"] = accepted
+
+        roots = np.asarray(uf.labels(), dtype=np.int64)
+        lengths = np.asarray(self.lengths)
+
+        # Families are numbered by size, largest first. The representative is the longest member.
+        _, inverse, sizes = np.unique(roots, return_inverse=True, return_counts=True)
+        rank = np.empty(len(sizes), dtype=np.int64)
+        rank[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+        family = rank[inverse]
+        order = np.lexsort((np.arange(len(self)), -lengths, family))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = family[order][1:] != family[order][:-1]
+        representative = np.empty(len(sizes), dtype=np.int64)
+        representative[family[order][first]] = order[first]
+
+        ids = np.asarray(self.ids, dtype=object)
+        self.families = pd.DataFrame(
+            {
+                "genome": pd.Categorical(self.genomes),
+                "protein": self.ids,
+                "length": lengths,
+                "family": [f"family_{i}" for i in family],
+                "representative": ids[representative[family]],
+            }
+        )
+        self.stats["families"] = len(sizes)
+        logger.info(
+            f"Found {len(sizes)} families from {self.stats['candidate_pairs']} candidate pairs."
+        )
+
+        return self.families
+
+    def matrix(self):
+        """
+        :return: Genome by family dataframe with the number of proteins of each family in each genome.
+        """
+        if self.families is None:
+            self.cluster()
+
+        return pd.crosstab(self.families["genome"], self.families["family"])
+
+
+def cluster_proteins(collection, **kwargs):
+    """
+    Clusters the proteins of a GenomeCollection into families.
+
+    :param collection: A GenomeCollection instance.
+    :param kwargs: Keyword arguments for ProteinClusters.
+    :return: Tuple of (families dataframe, genome by family dataframe).
+    """
+    clusters = ProteinClusters(**kwargs)
+    clusters.add_collection(collection)
+    families = clusters.cluster()
+
+    return families, clusters.matrix()
@@ -0,0 +1,99 @@
+"""
+Pathway completeness of many genomes at once.
+
+pathways.json lists the genes of each phenotyping pathway, and hits to the phenotyping
+database are named pathway.gene.n, e.g. 'arabinose.Ribulokinase.1'. Instead of checking
+each genome's hits against each pathway, the hits of all genomes are turned into a sparse
+genome by gene presence matrix. The genes found of every pathway in every genome are then
+a single product with the sparse pathway by gene incidence matrix.
+
+Example:
+    collection.pathway_completeness()  # Dataframe of genomes by pathways
+    table[table["L-arabinose"] == 1]  # Genomes with all L-arabinose genes
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from abacat.config import pathways as default_pathways
+
+logger = logging.getLogger(__name__)
+
+
+def hit_genes(hits):
+    """
+    :param hits: Iterable of hit descriptions to the phenotyping database, e.g. 'arabinose.Ribulokinase.1'.
+    :return: Series of gene names, e.g. 'Ribulokinase'. As in Genome.run_pathways.
+    """
+    return pd.Series(list(hits), dtype=object).str.split(".", n=2).str[1]
+
+
+def pathway_incidence(pathways=default_pathways):
+    """
+    :param pathways: Dict of pathway names as keys and lists of gene names as values, as in pathways.json.
+    :return: Tuple of (pathways by genes sparse boolean matrix, pathway names, gene names).
+    """
+    genes = list(
+        dict.fromkeys(gene for members in pathways.values() for gene in members)
+    )
+    index = dict((gene, ix) for ix, gene in enumerate(genes))
+    members = [list(dict.fromkeys(i)) for i in pathways.values()]
+    rows = np.repeat(np.arange(len(members)), [len(i) for i in members])
+    cols = np.array([index[gene] for i in members for gene in i], dtype=np.int64)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)),
+        shape=(len(members), len(genes)),
+    )
+
+    return incidence, list(pathways), genes
+
+
+def presence_matrix(genomes, hits, genes):
+    """
+    :param genomes: Genome name of each hit.
+    :param hits: Hit descriptions to the phenotyping database.
+    :param genes: Gene names of the columns, e.g. from pathway_incidence. Other genes are left out.
+    :return: Tuple of (genomes by genes sparse boolean matrix, genome names of the rows).
+    """
+    rows, names = pd.factorize(pd.Series(list(genomes), dtype=object))
+    cols = pd.Index(genes).get_indexer(hit_genes(hits))
+    found = cols >= 0
+    presence = sparse.csr_matrix(
+        (np.ones(found.sum(), dtype=np.int32), (rows[found], cols[found])),
+        shape=(len(names), len(genes)),
+    )
+    presence.data[:] = 1  # Genes with several hits count once
+
+    return presence.astype(bool), list(names)
+
+
+def pathway_completeness(
+    genomes, hits, pathways=default_pathways, all_genomes=None, fraction=True
+):
+    """
+    :param genomes: Genome name of each hit.
+    :param hits: Hit descriptions to the phenotyping database.
+    :param pathways: Dict of pathway names as keys and lists of gene names as values.
+    :param all_genomes: Genome names of the rows, so genomes without hits are included. Default is
+                        the genomes with hits.
+    :param fraction: Fraction of the genes of each pathway found. False for the number of genes.
+    :return: Dataframe with genomes as index and pathways as columns.
+    """
+    incidence, pathway_names, genes = pathway_incidence(pathways)
+    presence, names = presence_matrix(genomes, hits, genes)
+    found = (presence.astype(np.int32) @ incidence.T.astype(np.int32)).toarray()
+    if fraction:
+        sizes = np.asarray(incidence.sum(axis=1)).ravel()
+        found = found / np.maximum(sizes, 1)
+
+    table = pd.DataFrame(
+        found, index=pd.Index(names, name="genome"), columns=pathway_names
+    )
+    if all_genomes is not None:
+        table = table.reindex(pd.Index(list(all_genomes), name="genome"), fill_value=0)
+    logger.info(
+        f"Found {presence.nnz} pathway genes in {len(names)} genomes for {len(pathway_names)} pathways."
+    )
+
+    return table
@@ -16,16 +16,37 @@ import sys
 import argparse
 import logging
 from abacat import Genome, timer_wrapper, CONFIG
+from abacat.duplicates import read_duplicates, copy_results, output_suffixes
 
-def annotate(input_, db, blast, evalue, prodigal=True):
+def annotate(
+    input_,
+    db,
+    blast,
+    evalue,
+    prodigal=True,
+    prescreen=False,
+    duplicates=None,
+    aligner=None,
+    summary=False,
+):
     """
     :param input_: Input file. Must a valid FASTA contigs file (post-assembly).
     :param db: Database name. Must be in abacat.CONFIG.py db parameter.
     :param blast: Blast method. Choose from 'blastn', 'blastp' or 'blastx'. Default is 'blastn'
+    :param prescreen: Only blast genes sharing k-mers with db. Use 'only' to skip Blast.
+    :param duplicates: Table from abacat/duplicates.py. If input_ is a duplicate of a genome that was
+                       already annotated, its outputs are copied instead.
+    :param aligner: 'blast', 'diamond' or 'mmseqs'. Default is the one of db in abacat.CONFIG.
+    :param summary: Write the resistance summary of the MEGARes hits. Only for db 'megares'.
     :return:
     """
     logging.basicConfig(filename=os.path.splitext(input_)[0] + ".log", level = logging.INFO)
     logger = logging.getLogger(__name__)
+    if duplicates:
+        genome = copy_representative(input_, db, read_duplicates(duplicates))
+        if genome:
+            logger.info(f"{input_} is a duplicate. Copied the outputs of its representative.")
+            return genome
     #handler = logging.FileHandler(os.path.splitext(input_)[0] + ".log", "w")
     #logger.addHandler(handler)
     genome = Genome(input_)
@@ -35,7 +56,11 @@ def annotate(input_, db, blast, evalue, prodigal=True):
         genome.run_prodigal()
     else:
         genome.load_prodigal()
-    genome.blast_seqs(db=db, blast=blast, evalue=evalue)
+    genome.blast_seqs(
+        db=db, blast=blast, evalue=evalue, prescreen=prescreen, aligner=aligner
+    )
+    if summary:
+        genome.resistance_summary()
     handler = logging.FileHandler(os.path.join(genome.directory, genome.name + ".log"), "w")
     logger.addHandler(handler)
     #with open(os.path.join(genome.directory, genome.name + ".log"), "w") as f:
@@ -43,6 +68,29 @@ def annotate(input_, db, blast, evalue, prodigal=True):
     return genome
 
 
+def copy_representative(input_, db, duplicates):
+    """
+    :param input_: Contigs file.
+    :param db: Database name.
+    :param duplicates: Dataframe from abacat.duplicates.read_duplicates.
+    :return: Genome with the copied outputs, or None if input_ is not a duplicate or its
+             representative has no Prodigal and db outputs yet.
+    """
+    name = os.path.splitext(os.path.basename(input_))[0]
+    if name not in duplicates.index or duplicates.loc[name, "kind"] == "unique":
+        return None
+    representative = duplicates.loc[name, "representative"]
+    prefix = os.path.join(os.path.dirname(duplicates.loc[representative, "file"]), representative)
+    if not all(os.path.isfile(prefix + i) for i in ("_prodigal_genes.fna", f"_{db}.hits")):
+        return None
+
+    copy_results(duplicates.loc[representative, "file"], input_, output_suffixes(dbs=[db]))
+    genome = Genome(input_)
+    genome.load_prodigal(load_protset=os.path.isfile(prefix + "_prodigal_proteins.faa"))
+
+    return genome
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Annotation pipeline. Starts with a contig file."
@@ -72,10 +120,52 @@ if __name__ == "__main__":
         default=CONFIG["blast"]["evalue"],
         help="E-value for BLAST. Default is the one set in abacat/config.py",
     )
+    parser.add_argument(
+        "-s",
+        "--prescreen",
+        type=str,
+        default=None,
+        help="Screen genes with a k-mer index of the database first. "
+        "'blast' to only BLAST genes sharing k-mers with it, 'only' to report them without BLAST.",
+    )
+    parser.add_argument(
+        "-d",
+        "--duplicates",
+        type=str,
+        default=None,
+        help="Table of duplicate genomes from abacat/duplicates.py. "
+        "Duplicates of an annotated genome copy its outputs instead of running again.",
+    )
+    parser.add_argument(
+        "-a",
+        "--aligner",
+        type=str,
+        default=None,
+        choices=["blast", "diamond", "mmseqs"],
+        help="Search program. Default is the one of the database in abacat/config.py.",
+    )
+    parser.add_argument(
+        "-r",
+        "--resistance-summary",
+        action="store_true",
+        help="Write the resistance class, mechanism and group of the MEGARes hits. Only for megares.",
+    )
     args = parser.parse_args()
+    if args.resistance_summary and args.database != "megares":
+        parser.error("--resistance-summary needs the megares database.")
+    prescreen = "only" if args.prescreen == "only" else bool(args.prescreen)
 
     @timer_wrapper
     def run():
-        annotate(args.input, args.database, args.blast, args.evalue)
+        annotate(
+            args.input,
+            args.database,
+            args.blast,
+            args.evalue,
+            prescreen=prescreen,
+            duplicates=args.duplicates,
+            aligner=args.aligner,
+            summary=args.resistance_summary,
+        )
 
     run()
@@ -7,14 +7,14 @@ import argparse
 from abacat import Genome, from_json, timer_wrapper
 
 
-def main(input_, evalue, json=False):
+def main(input_, evalue, json=False, blast="blastp"):
     if json:
         g = from_json(input_)
     else:
         g = Genome(input_)
         g.run_prodigal()
 
-    g.run_pathways(evalue=evalue)
+    g.run_pathways(evalue=evalue, blast=blast)
     g.to_json()
 
 
@@ -41,10 +41,17 @@ if __name__ == "__main__":
         default=False,
         help="Specifies that you're using an already processed JSON input.",
     )
+    parser.add_argument(
+        "-b",
+        "--blast",
+        default="blastp",
+        choices=["blastp", "blastx"],
+        help="blastp searches the Prodigal proteins, blastx the genes in all six frames.",
+    )
     args = parser.parse_args()
 
     @timer_wrapper
     def run():
-        main(args.input, args.evalue, args.json)
+        main(args.input, args.evalue, args.json, args.blast)
 
     run()
@@ -16,12 +16,117 @@ Example usage:
     python prodigal.py -i contigs.fasta
 """
 
+import io
 import os
+import re
 import sys
+import shlex
+import csv
+import logging
 import argparse
 import subprocess
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from abacat.config import CONFIG
 from abacat.abacat_helper import is_fasta, is_fasta_wrapper, timer_wrapper
 
+logger = logging.getLogger(__name__)
+
+# Hits and misses of the training file cache in this process. See training_stats().
+training_counts = {"hits": 0, "misses": 0}
+
+# Columns of the start scores file (-s), one row per candidate start of each gene:
+# Beg End Std Total CodPot StrtSc Codon RBSMot Spacer RBSScr UpsScr TypeScr GCCont.
+# Scores are named as in the /note of the GenBank output.
+SCORES_COLUMNS = {
+    "start": np.int64,
+    "stop": np.int64,
+    "strand": "category",
+    "score": np.float32,
+    "cscore": np.float32,
+    "sscore": np.float32,
+    "start_type": "category",
+    "rbs_motif": "category",
+    "rbs_spacer": "category",
+    "rscore": np.float32,
+    "uscore": np.float32,
+    "tscore": np.float32,
+    "gc_cont": np.float32,
+}
+
+# Fields of the /note of each CDS of the GenBank output, e.g.
+# /note="ID=1_1;partial=00;start_type=ATG;rbs_motif=AGGAG;rbs_spacer=5-10bp;gc_cont=0.325;
+# conf=99.99;score=170.32;cscore=153.98;sscore=16.34;rscore=10.65;uscore=1.86;tscore=3.83;"
+# Without their keys, the values are split on ";", and the ID on "_" into the sequence and
+# gene numbers.
+CDS_NOTE_FIELDS = {
+    "seqnum": np.int64,
+    "gene": np.int64,
+    "partial": np.int8,
+    "start_type": "category",
+    "rbs_motif": "category",
+    "rbs_spacer": "category",
+    "gc_cont": np.float32,
+    "conf": np.float32,
+    "score": np.float32,
+    "cscore": np.float32,
+    "sscore": np.float32,
+    "rscore": np.float32,
+    "uscore": np.float32,
+    "tscore": np.float32,
+}
+SEQHDR = re.compile(r'seqhdr="([^"\s]*)')
+
+
+def training_file(key):
+    """
+    :param key: Species, ANI cluster or other label of the genomes sharing a training file.
+    :return: Path of the training file of key in the cache.
+    """
+    key = re.sub(r"[^\w.-]", "_", str(key))
+
+    return os.path.join(CONFIG["cache_dir"], "prodigal_training", f"{key}.trn")
+
+
+def train(contigs, key, quiet=True):
+    """
+    Trains Prodigal on contigs and caches the training file by key, unless it is cached.
+
+    :param contigs: Contigs of a genome representative of key, of at least 20 kbp.
+    :param key: Cache key, e.g. a species or ANI cluster label.
+    :return: Path of the training file, or None if training failed.
+    """
+    out = training_file(key)
+    if os.path.isfile(out):
+        training_counts["hits"] += 1
+        return out
+
+    training_counts["misses"] += 1
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    tmp = f"{out}.{os.getpid()}.tmp"  # Runs training the same key don't mix files
+    cmd = ["prodigal", "-i", contigs, "-t", tmp] + (["-q"] if quiet else [])
+    returncode = subprocess.call(cmd)
+    if returncode != 0 or not os.path.isfile(tmp):
+        # A failed run may leave a partial training file, which is not cached.
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+        logger.warning(
+            f"Prodigal training on {contigs} failed. Genomes of {key} train on themselves."
+        )
+        return None
+    os.replace(tmp, out)
+    logger.info(f"Trained Prodigal on {contigs}. Cached training file at {out}.")
+
+    return out
+
+
+def training_stats():
+    """
+    :return: Dict with the hits and misses of the training file cache in this process.
+    """
+    return dict(training_counts)
+
 
 class Prodigal:
     """
@@ -34,9 +139,20 @@ class Prodigal:
     Output:
     Genes (.fna), proteins (.faa), gene scores (.txt), gbk file (.gbk).
 
+    With a training key, Prodigal reuses the cached training file of the key instead of
+    training on each genome. The first run of a key trains on train_on, or on contigs.
+
     """
 
-    def __init__(self, contigs, output=None, quiet=False, scores=False):
+    def __init__(
+        self,
+        contigs,
+        output=None,
+        quiet=False,
+        scores=False,
+        training=None,
+        train_on=None,
+    ):
         super(Prodigal, self).__init__()
         self.name = None
         is_fasta(contigs)
@@ -44,6 +160,8 @@ class Prodigal:
         self.quiet = quiet
         self.finished = None
         self.scores = scores
+        self.training = training  # Cache key of the training file, e.g. a species.
+        self.train_on = train_on or contigs
 
         if not output:
             output = os.path.join(
@@ -73,7 +191,12 @@ class Prodigal:
 
     def run(self, print_files=False):
         is_fasta_wrapper(self.contigs)
-        subprocess.call(self.cmd, shell=True)
+        cmd = self.cmd
+        if self.training is not None:
+            trn = train(self.train_on, self.training, quiet=self.quiet)
+            if trn:
+                cmd += f" -t {shlex.quote(trn)}"
+        subprocess.call(cmd, shell=True)
 
         if all(os.path.isfile(value) for _, value in self.output_files.items()):
             self.finished = True
@@ -88,11 +211,183 @@ class Prodigal:
         return self.output_files
 
 
-def run(contig_file, output=None, quiet=False, print_files=False):
+def contig_id(line):
+    """
+    :param line: Prodigal header of a sequence, with seqhdr="...".
+    :return: First word of the contig header, as in the gene ids.
+    """
+    return SEQHDR.search(line).group(1)
+
+
+def contig_column(contigs, bounds, n_rows):
+    """
+    :param contigs: Contig of each sequence of the file, in order.
+    :param bounds: Index of the first row of each sequence.
+    :return: Categorical of the contig of each of n_rows rows.
+    """
+    codes, categories = pd.factorize(pd.Index(contigs, dtype=object))
+    counts = np.diff(np.append(np.asarray(bounds, dtype=np.int64), n_rows))
+
+    return pd.Categorical.from_codes(
+        np.repeat(codes.astype(np.int32), counts), categories=categories
+    )
+
+
+def read_scores_rows(lines):
+    """
+    :param lines: Data lines of a scores file.
+    :return: Dataframe with SCORES_COLUMNS, strand as +1/-1.
+    """
+    rows = pd.read_csv(
+        io.StringIO("".join(lines)),
+        sep="\t",
+        header=None,
+        names=list(SCORES_COLUMNS),
+        dtype=SCORES_COLUMNS,
+        quoting=csv.QUOTE_NONE,
+        na_filter=False,
+    )
+    rows["strand"] = np.where(rows["strand"] == "-", -1, 1).astype(np.int8)
+
+    return rows
+
+
+def concat_columns(chunks):
+    """
+    :return: Dataframe of the chunks, merging the categories of categorical columns.
+    """
+    columns = dict()
+    for column, dtype in chunks[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals([i[column] for i in chunks])
+        else:
+            columns[column] = np.concatenate([i[column].to_numpy() for i in chunks])
+
+    return pd.DataFrame(columns)
+
+
+def parse_scores(scores_file, chunk_size=2 ** 18):
+    """
+    Streams a Prodigal start scores file (-s) into a table, chunk_size rows at a time.
+    The file has a row for every candidate start, so it is much larger than the genes.
+
+    :param scores_file: Prodigal _scores.txt file.
+    :param chunk_size: Number of rows parsed at once.
+    :return: Dataframe with a contig column and SCORES_COLUMNS. Text columns are categorical.
+    """
+    contigs, bounds, chunks, lines = [], [], [], []
+    n_rows = 0
+    with open(scores_file) as f:
+        for line in f:
+            if line[:1].isdigit():
+                lines.append(line)
+                if len(lines) == chunk_size:
+                    chunks.append(read_scores_rows(lines))
+                    n_rows += len(lines)
+                    lines = []
+            elif line.startswith("# Sequence Data"):
+                contigs.append(contig_id(line))
+                bounds.append(n_rows + len(lines))
+    if lines or not chunks:
+        chunks.append(read_scores_rows(lines))
+        n_rows += len(lines)
+
+    table = concat_columns(chunks)
+    table.insert(0, "contig", contig_column(contigs, bounds, n_rows))
+
+    return table
+
+
+def parse_cds(cds_file):
+    """
+    Reads the CDS features of the Prodigal GenBank output (-o) into a table.
+
+    :param cds_file: Prodigal _cds.gbk file.
+    :return: Dataframe of the genes, indexed by their ids in the genes and proteins files.
+    """
+    contigs, bounds, locations, notes = [], [], [], []
+    with open(cds_file) as f:
+        for line in f:
+            if line.startswith("     CDS "):
+                locations.append(line[21:])
+            elif line.startswith("                     /note="):
+                notes.append(line[28:])
+            elif line.startswith("DEFINITION"):
+                contigs.append(contig_id(line))
+                bounds.append(len(locations))
+
+    # Locations are start..stop or complement(start..stop), with < and > on partial ends.
+    complement = np.array([i[0] == "c" for i in locations], dtype=bool)
+    coordinates = pd.read_csv(
+        io.StringIO(
+            "".join(locations)
+            .replace("complement(", "")
+            .replace(")", "")
+            .replace("<", "")
+            .replace(">", "")
+            .replace("..", "\t")
+        ),
+        sep="\t",
+        header=None,
+        names=["start", "stop"],
+        dtype=np.int64,
+    )
+    notes = "".join(notes).replace(';"\n', "\n").replace('"\n', "\n")
+    notes = notes.replace("ID=", "")
+    for key in list(CDS_NOTE_FIELDS)[2:]:
+        notes = notes.replace(f";{key}=", ";")
+    fields = pd.read_csv(
+        io.StringIO(notes.replace("_", ";")),
+        sep=";",
+        header=None,
+        names=list(CDS_NOTE_FIELDS),
+        dtype=CDS_NOTE_FIELDS,
+        quoting=csv.QUOTE_NONE,
+        na_filter=False,
+    )
+    contig = contig_column(contigs, bounds, len(locations))
+
+    table = pd.DataFrame(
+        {
+            "contig": contig,
+            "start": coordinates["start"].to_numpy(),
+            "stop": coordinates["stop"].to_numpy(),
+            "strand": np.where(complement, -1, 1).astype(np.int8),
+            "partial_left": (fields["partial"] // 10 == 1).to_numpy(),
+            "partial_right": (fields["partial"] % 10 == 1).to_numpy(),
+        },
+        index=pd.Index(
+            np.asarray(contig, dtype=object)
+            + "_"
+            + fields["gene"].to_numpy().astype(str).astype(object),
+            name="id",
+        ),
+    )
+    for column in list(CDS_NOTE_FIELDS)[3:]:
+        table[column] = fields[column].values
+
+    return table
+
+
+def low_confidence(cds, min_conf=CONFIG["prodigal"]["min_conf"], partial=False):
+    """
+    :param cds: Table from parse_cds.
+    :param min_conf: Confidence, in percent, under which a gene is low confidence.
+    :param partial: Genes running off a contig edge are also low confidence.
+    :return: Boolean array, True for the low confidence genes.
+    """
+    mask = cds["conf"].to_numpy() < min_conf
+    if partial:
+        mask |= cds["partial_left"].to_numpy() | cds["partial_right"].to_numpy()
+
+    return mask
+
+
+def run(contig_file, output=None, quiet=False, print_files=False, training=None):
     """
     Run outside of class scope.
     """
-    p = Prodigal(contig_file, output=output, quiet=quiet)
+    p = Prodigal(contig_file, output=output, quiet=quiet, training=training)
     p.run(print_files=print_files)
 
     return p.output_files
@@ -110,6 +405,11 @@ if __name__ == "__main__":
         "-i", "--input", help="Input FASTA file or dir containing fasta files"
     )
     parser.add_argument("-o", "--output", help="Path to output folder", default=".")
+    parser.add_argument(
+        "-t",
+        "--training",
+        help="Cache key of the training file, e.g. the species. Genomes with the same key train once.",
+    )
 
     args = parser.parse_args()
 
@@ -123,7 +423,7 @@ if __name__ == "__main__":
     def main():
         if os.path.isfile(input_):
             print(f"Starting script. Your input file is {input}.")
-            p = Prodigal(input_, output=args.output)
+            p = Prodigal(input_, output=args.output, training=args.training)
             p.run()
 
         elif os.path.isdir(input_):
@@ -144,7 +444,7 @@ if __name__ == "__main__":
             for contig_file in files:
                 try:
                     print(f"Running Prodigal for {contig_file}.")
-                    run(contig_file)
+                    run(contig_file, training=args.training)
                     if os.path.isdir(os.path.splitext(contig_file)[0]):
                         success += 1
                 except ValueError:
@@ -156,6 +456,11 @@ if __name__ == "__main__":
 
             print("\n")
             print(f"Done. {success} assemblies processed. {failure} errors.")
+            if args.training is not None:
+                stats = training_stats()
+                print(
+                    f"Training cache: {stats['hits']} hits, {stats['misses']} misses."
+                )
 
         else:
             raise FileNotFoundError
@@ -0,0 +1,252 @@
+"""
+Gene and protein sets in shared memory, to send genomes to worker processes without copies.
+
+Pickling a Genome for a process pool would pickle every SeqRecord of its sets. Instead,
+Genome.share() packs each set into a multiprocessing.shared_memory block: the sequences
+and headers are concatenated into bytes with int64 offset arrays, followed by a numeric
+table of the Prodigal coordinates. A shared Genome pickles as the names of its blocks,
+and workers attach to the same memory by name.
+
+The process that creates a block owns it and unlinks it on close(), on leaving a
+with block, or when the set is garbage collected. Workers only close their view.
+"""
+
+import weakref
+import logging
+from collections.abc import Mapping
+from multiprocessing import shared_memory
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+logger = logging.getLogger(__name__)
+
+# Numeric columns parsed from Prodigal headers, e.g.
+# >NC_002745.2_1 # 517 # 1878 # 1 # ID=1_1;partial=00;start_type=ATG;...;gc_cont=0.331
+PRODIGAL_TABLE_DTYPE = np.dtype(
+    [
+        ("start", np.int64),
+        ("stop", np.int64),
+        ("strand", np.int8),
+        ("partial_left", np.bool_),
+        ("partial_right", np.bool_),
+        ("gc_cont", np.float32),
+    ]
+)
+
+
+def prodigal_table(descriptions):
+    """
+    :param descriptions: List of Prodigal FASTA headers.
+    :return: Structured array with PRODIGAL_TABLE_DTYPE. Rows of other headers are zeros.
+    """
+    table = np.zeros(len(descriptions), dtype=PRODIGAL_TABLE_DTYPE)
+    fields = pd.Series(descriptions, dtype=object).str.split(" # ", expand=True)
+    if fields.shape[1] != 5:
+        return table
+
+    valid = fields[4].notna().to_numpy()
+    fields = fields[valid]
+    tags = fields[4].str.extract(r"partial=(\d)(\d).*gc_cont=([\d.]+)")
+    table["start"][valid] = fields[1].astype(np.int64)
+    table["stop"][valid] = fields[2].astype(np.int64)
+    table["strand"][valid] = fields[3].astype(np.int8)
+    table["partial_left"][valid] = tags[0] == "1"
+    table["partial_right"][valid] = tags[1] == "1"
+    table["gc_cont"][valid] = tags[2].astype(np.float32)
+
+    return table
+
+
+def _release(shm, owner):
+    try:
+        shm.close()
+    except BufferError:
+        pass  # Arrays still point to the block. The mapping goes away with them.
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedSeqSet(Mapping):
+    """
+    SharedSeqSet, a read-only mapping of record ids to SeqRecords backed by a shared memory block.
+
+    Layout of the block: sequence offsets (n + 1 int64), description offsets (n + 1 int64),
+    the Prodigal table (n rows of PRODIGAL_TABLE_DTYPE), sequence bytes and description bytes.
+
+    Example:
+        with SharedSeqSet.from_records(genome.geneset["prodigal"]["records"].values()) as genes:
+            pool.map(work, [genes.handle] * 4)  # Workers call SharedSeqSet.attach(handle)
+    """
+
+    def __init__(self, shm, n, seq_size, desc_size, owner=False):
+        super(SharedSeqSet, self).__init__()
+        self.shm = shm
+        self.n = n
+        self.seq_size = seq_size
+        self.desc_size = desc_size
+        self.owner = owner
+        self._index = (
+            None  # Record ids as keys and positions as values, built on first lookup.
+        )
+
+        buf, offset = shm.buf, 0
+        self.seq_offsets = np.ndarray(n + 1, dtype=np.int64, buffer=buf, offset=offset)
+        offset += self.seq_offsets.nbytes
+        self.desc_offsets = np.ndarray(n + 1, dtype=np.int64, buffer=buf, offset=offset)
+        offset += self.desc_offsets.nbytes
+        self.table = np.ndarray(
+            n, dtype=PRODIGAL_TABLE_DTYPE, buffer=buf, offset=offset
+        )
+        offset += self.table.nbytes
+        self.seqs = np.ndarray(seq_size, dtype=np.uint8, buffer=buf, offset=offset)
+        offset += seq_size
+        self.descs = np.ndarray(desc_size, dtype=np.uint8, buffer=buf, offset=offset)
+
+        self._finalizer = weakref.finalize(self, _release, shm, owner)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Copies records into a new shared memory block, owned by this process.
+
+        :param records: Iterable of SeqRecords.
+        :return: A SharedSeqSet instance.
+        """
+        seqs, descs = [], []
+        for record in records:
+            seqs.append(bytes(record.seq))
+            descs.append(record.description.encode())
+        n = len(seqs)
+        seq_offsets = np.cumsum([0] + [len(i) for i in seqs], dtype=np.int64)
+        desc_offsets = np.cumsum([0] + [len(i) for i in descs], dtype=np.int64)
+        seq_size, desc_size = int(seq_offsets[-1]), int(desc_offsets[-1])
+
+        size = 2 * seq_offsets.nbytes + n * PRODIGAL_TABLE_DTYPE.itemsize
+        size += seq_size + desc_size
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        shared = cls(shm, n, seq_size, desc_size, owner=True)
+        shared.seq_offsets[:] = seq_offsets
+        shared.desc_offsets[:] = desc_offsets
+        shared.table[:] = prodigal_table([i.decode() for i in descs])
+        shared.seqs[:] = np.frombuffer(b"".join(seqs), dtype=np.uint8)
+        shared.descs[:] = np.frombuffer(b"".join(descs), dtype=np.uint8)
+        logger.info(f"Shared {n} records in {shm.name} ({size} bytes).")
+
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        :param handle: SharedSeqSet.handle of a set created in another process.
+        :return: A SharedSeqSet instance reading the same memory.
+        """
+        shm = shared_memory.SharedMemory(name=handle["name"])
+        return cls(shm, handle["n"], handle["seq_size"], handle["desc_size"])
+
+    @property
+    def handle(self):
+        """
+        :return: Dict with what attach() needs. It is what gets pickled.
+        """
+        return {
+            "name": self.shm.name,
+            "n": self.n,
+            "seq_size": self.seq_size,
+            "desc_size": self.desc_size,
+        }
+
+    def __reduce__(self):
+        return SharedSeqSet.attach, (self.handle,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Closes this view of the block, and unlinks the block if this process created it.
+        """
+        self.seq_offsets = self.desc_offsets = self.table = self.seqs = self.descs = (
+            None
+        )
+        self._finalizer()
+
+    @property
+    def closed(self):
+        return not self._finalizer.alive
+
+    def __len__(self):
+        return self.n
+
+    def description(self, ix):
+        return bytes(
+            self.descs[self.desc_offsets[ix] : self.desc_offsets[ix + 1]]
+        ).decode()
+
+    def sequence(self, ix):
+        return bytes(
+            self.seqs[self.seq_offsets[ix] : self.seq_offsets[ix + 1]]
+        ).decode()
+
+    def record(self, ix):
+        """
+        :return: SeqRecord at position ix, as SeqIO would have parsed it.
+        """
+        description = self.description(ix)
+        return SeqRecord(
+            Seq(self.sequence(ix)),
+            id=description.split(" ", 1)[0],
+            name=description.split(" ", 1)[0],
+            description=description,
+        )
+
+    def __iter__(self):
+        for ix in range(self.n):
+            yield self.description(ix).split(" ", 1)[0]
+
+    def __getitem__(self, id_):
+        if self._index is None:
+            self._index = dict((j, i) for i, j in enumerate(self))
+        return self.record(self._index[id_])
+
+    def values(self):
+        return (self.record(ix) for ix in range(self.n))
+
+    def items(self):
+        return ((i.id, i) for i in self.values())
+
+    def to_frame(self):
+        """
+        :return: Dataframe of the Prodigal table, with record ids as index.
+        """
+        return pd.DataFrame(self.table, index=pd.Index(list(self), name="id"))
+
+
+@contextmanager
+def shared(genomes):
+    """
+    Shares the sets of many genomes for the duration of a with block.
+
+    Example:
+        with shared(genomes):
+            with ProcessPoolExecutor() as executor:
+                results = list(executor.map(work, genomes))
+
+    :param genomes: Iterable of Genome instances.
+    """
+    genomes = list(genomes)
+    try:
+        for genome in genomes:
+            genome.share()
+        yield genomes
+    finally:
+        for genome in genomes:
+            genome.release_shared()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+"""
+MinHash sketches of genomes, to find the closest references of a new genome.
+
+Each genome is reduced to the s smallest hashes of its canonical k-mers (a bottom-s
+sketch, as in Mash). The Jaccard similarity of two genomes is estimated from their
+sketches, and turned into ANI with the Mash distance. A SketchIndex keeps the
+sketches of a collection on disk, with an inverted index of hashes to references,
+so a query only touches the references it shares hashes with.
+
+fastANI then only needs to run against the top k references, instead of rerunning
+ANIDendrogram over the whole collection.
+
+Example:
+    index = SketchIndex.build(list_of_contigs_files)
+    index.save("collection_sketches")
+    SketchIndex.load("collection_sketches").query("new_isolate.fna", top_k=10)
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+from abacat.config import CONFIG
+from abacat.kmers import canonical_kmers
+from abacat.ani import FASTANI_COLUMNS, genome_name
+from abacat.abacat_helper import timer_wrapper
+
+logger = logging.getLogger(__name__)
+
+# Pads the sketches of genomes with fewer k-mers than the sketch size.
+EMPTY = np.iinfo(np.uint64).max
+
+
+def sketch_hash(kmers):
+    """
+    Multiplicative hash of k-mers, a bijection of uint64, so the smallest hashes are a
+    random sample of the k-mers rather than the ones starting with A's.
+    """
+    return kmers * np.uint64(0x9E3779B97F4A7C15)
+
+
+def bottom_hashes(seq, k=CONFIG["sketch"]["k"], size=CONFIG["sketch"]["size"]):
+    """
+    :param seq: Nucleotide sequence as a string. Join contigs with N, which no k-mer can span.
+    :param k: k-mer length.
+    :param size: Number of hashes kept.
+    :return: Sorted uint64 array of the smallest hashes of the canonical k-mers of seq.
+    """
+    hashes = sketch_hash(canonical_kmers(seq, k))
+
+    # Select the smallest hashes instead of sorting all of them. Repeated k-mers may
+    # take some of the places, so the selection grows until it has size distinct hashes.
+    n = 2 * size
+    while n < len(hashes):
+        bottom = np.unique(np.partition(hashes, n - 1)[:n])
+        if len(bottom) >= size:
+            return bottom[:size]
+        n *= 4
+
+    return np.unique(hashes)[:size]
+
+
+def genome_sketch(contigs_file, k=CONFIG["sketch"]["k"], size=CONFIG["sketch"]["size"]):
+    """
+    :param contigs_file: FASTA file of a genome.
+    :param k: k-mer length.
+    :param size: Number of hashes kept.
+    :return: Sketch of the genome. See bottom_hashes().
+    """
+    with open(contigs_file) as handle:
+        seq = "N".join(seq for _, seq in SimpleFastaParser(handle))
+
+    return bottom_hashes(seq, k, size)
+
+
+def mash_ani(jaccard, k=CONFIG["sketch"]["k"]):
+    """
+    :param jaccard: Estimated Jaccard similarity, a float or an array.
+    :return: ANI, in percent, from the Mash distance. 0 when nothing is shared.
+    """
+    jaccard = np.asarray(jaccard, dtype=np.float64)
+    with np.errstate(divide="ignore"):
+        distance = -np.log(2 * jaccard / (1 + jaccard)) / k
+
+    return np.clip(100 * (1 - distance), 0, 100)
+
+
+class SketchIndex:
+    """
+    SketchIndex, the sketches of a collection of genomes and an inverted index of their hashes.
+
+    Attributes:
+        sketches: n by size uint64 array, one sorted sketch per row, padded with EMPTY.
+        hashes: Sorted array of all hashes of the sketches.
+        refs: Row of each hash in hashes.
+        names: Genome names, as in GenomeCollection.
+        files: Genome files, given to fastANI when placing a query.
+    """
+
+    def __init__(self, k=CONFIG["sketch"]["k"], size=CONFIG["sketch"]["size"]):
+        super(SketchIndex, self).__init__()
+        self.k = k
+        self.size = size
+        self.sketches = np.empty((0, size), dtype=np.uint64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.refs = np.empty(0, dtype=np.int32)
+        self.names = []
+        self.files = []
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def build(cls, files, k=CONFIG["sketch"]["k"], size=CONFIG["sketch"]["size"]):
+        """
+        :param files: Contigs or genes files of the genomes.
+        :return: A SketchIndex instance.
+        """
+        index = cls(k, size)
+        index.add(files)
+
+        return index
+
+    def add(self, files):
+        """
+        Sketches genomes and adds them to the index. Files already in the index are skipped.
+
+        :param files: Contigs or genes files of the genomes.
+        """
+        indexed = set(self.files)
+        files = [os.path.abspath(i) for i in files]
+        files = [i for i in dict.fromkeys(files) if i not in indexed]
+        if not files:
+            return
+
+        rows = np.full((len(files), self.size), EMPTY, dtype=np.uint64)
+        for ix, file in enumerate(files):
+            sketch = genome_sketch(file, self.k, self.size)
+            rows[ix, : len(sketch)] = sketch
+        self.sketches = np.concatenate([self.sketches, rows])
+        self.files += files
+        self.names += [genome_name(i) for i in files]
+
+        # Inverted index of all hashes, rebuilt from the sketches.
+        refs = np.repeat(np.arange(len(self), dtype=np.int32), self.size)
+        hashes = self.sketches.ravel()
+        keep = hashes != EMPTY
+        order = np.argsort(hashes[keep], kind="stable")
+        self.hashes, self.refs = hashes[keep][order], refs[keep][order]
+        logger.info(f"Sketched {len(files)} genomes. The index has {len(self)}.")
+
+    def save(self, prefix):
+        """
+        Writes prefix.sketches.npy, prefix.hashes.npy, prefix.refs.npy and prefix.json.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        np.save(prefix + ".sketches.npy", self.sketches)
+        np.save(prefix + ".hashes.npy", self.hashes)
+        np.save(prefix + ".refs.npy", self.refs)
+        with open(prefix + ".json", "w") as f:
+            json.dump(
+                {
+                    "k": self.k,
+                    "size": self.size,
+                    "names": self.names,
+                    "files": self.files,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, prefix, mmap=True):
+        """
+        Loads an index written with save(). The arrays are memory mapped by default.
+
+        :return: A SketchIndex instance.
+        """
+        with open(prefix + ".json") as f:
+            j = json.load(f)
+        index = cls(j["k"], j["size"])
+        index.names, index.files = j["names"], j["files"]
+        mmap_mode = "r" if mmap else None
+        index.sketches = np.load(prefix + ".sketches.npy", mmap_mode=mmap_mode)
+        index.hashes = np.load(prefix + ".hashes.npy", mmap_mode=mmap_mode)
+        index.refs = np.load(prefix + ".refs.npy", mmap_mode=mmap_mode)
+
+        return index
+
+    def search(self, sketch, top_k=10):
+        """
+        :param sketch: Sketch of the query, from genome_sketch() with the k and size of the index.
+        :param top_k: Number of references to return.
+        :return: Dataframe of the top_k references sharing the most with the query, indexed by
+                 genome name, with file, shared hashes, jaccard and ani columns. ANI is an estimate.
+        """
+        columns = ["file", "shared", "jaccard", "ani"]
+        starts = np.searchsorted(self.hashes, sketch, side="left")
+        ends = np.searchsorted(self.hashes, sketch, side="right")
+        if not (ends > starts).any():
+            return pd.DataFrame(columns=columns, index=pd.Index([], name="genome"))
+        hits = np.concatenate(
+            [self.refs[s:e] for s, e in zip(starts, ends) if e > s]
+        ).astype(np.int64)
+        hit_hashes = np.repeat(sketch, ends - starts)
+        candidates = np.unique(hits)
+
+        # Jaccard of the union's bottom hashes: both sketches up to the lower of their maxima.
+        sketches = np.asarray(self.sketches[candidates])
+        last = np.where(sketches == EMPTY, 0, sketches).max(axis=1)
+        threshold = np.minimum(last, sketch[-1])
+        local = np.searchsorted(candidates, hits)
+        in_range = hit_hashes <= threshold[local]
+        shared = np.bincount(local[in_range], minlength=len(candidates))
+        union = (
+            (sketches <= threshold[:, None]).sum(axis=1)
+            + np.searchsorted(sketch, threshold, side="right")
+            - shared
+        )
+        jaccard = shared / np.maximum(union, 1)
+
+        order = np.lexsort((candidates, -jaccard))[:top_k]
+        refs = candidates[order]
+
+        return pd.DataFrame(
+            {
+                "file": [self.files[i] for i in refs],
+                "shared": shared[order],
+                "jaccard": jaccard[order],
+                "ani": mash_ani(jaccard[order], self.k),
+            },
+            index=pd.Index([self.names[i] for i in refs], name="genome"),
+        )
+
+    def query(self, contigs_file, top_k=10):
+        """
+        :param contigs_file: FASTA file of the query genome.
+        :param top_k: Number of references to return.
+        :return: Dataframe of the closest references. See search().
+        """
+        return self.search(genome_sketch(contigs_file, self.k, self.size), top_k)
+
+    def place(
+        self,
+        contigs_file,
+        top_k=10,
+        output_dir=".",
+        threads=CONFIG["threads"],
+        fraglen=None,
+    ):
+        """
+        Runs fastANI of a query genome against its top_k closest references only.
+
+        :param contigs_file: FASTA file of the query genome.
+        :param top_k: Number of references given to fastANI.
+        :param output_dir: Directory of the reference list and the fastANI output.
+        :param threads: Number of threads to use with fastANI.
+        :param fraglen: Fragment length for fastANI. Default is fastANI's.
+        :return: Dataframe of the top_k references, with the fastANI columns added.
+                 References fastANI left out have no ANI.
+        """
+        closest = self.query(contigs_file, top_k)
+        name = genome_name(contigs_file)
+        os.makedirs(output_dir, exist_ok=True)
+        reference_list = os.path.join(output_dir, f"{name}_references.txt")
+        output = os.path.join(output_dir, f"{name}_fastani_out")
+        with open(reference_list, "w") as f:
+            f.write("\n".join(closest["file"]) + "\n")
+
+        cmd = [
+            CONFIG["third_party"]["fastANI"],
+            "-q",
+            contigs_file,
+            "--rl",
+            reference_list,
+            "-o",
+            output,
+            "-t",
+            str(threads),
+        ]
+        if fraglen:
+            cmd += ["--fragLen", str(fraglen)]
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+        fastani = pd.read_csv(
+            output, sep="\t", header=None, names=list(FASTANI_COLUMNS)
+        )
+        fastani.index = pd.Index([genome_name(i) for i in fastani["reference"]])
+        closest = closest.join(
+            fastani[["ani", "fragments", "total_fragments"]], rsuffix="_fastani"
+        )
+
+        return closest.sort_values(["ani_fastani", "ani"], ascending=False)
+
+
+def contigs_files(inputs):
+    """
+    :param inputs: Directories of genomes, or files with one genome path per line.
+    :return: List of genome files.
+    """
+    files = []
+    for i in inputs:
+        if os.path.isdir(i):
+            files += [
+                os.path.join(i, f)
+                for f in sorted(os.listdir(i))
+                if f.endswith((".fna", ".fasta", ".fa"))
+            ]
+        else:
+            with open(i) as f:
+                files += [line.strip() for line in f if line.strip()]
+
+    return files
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="""
+    Finds the closest references of a genome from MinHash sketches of a collection.
+    Build an index once, then query it with new genomes.
+    """)
+    parser.add_argument(
+        "-x", "--index", required=True, help="Prefix of the index files."
+    )
+    parser.add_argument(
+        "-b",
+        "--build",
+        nargs="*",
+        help="Directories of genomes, or files with one genome path per line, to add to the index. "
+        "Creates the index if it does not exist.",
+    )
+    parser.add_argument("-q", "--query", nargs="*", help="Genomes to search for.")
+    parser.add_argument(
+        "-k", "--top-k", type=int, default=10, help="Number of references to report."
+    )
+    parser.add_argument(
+        "--fastani",
+        action="store_true",
+        help="Run fastANI of each query against its top references.",
+    )
+    parser.add_argument(
+        "-o", "--output", default=".", help="Output directory of fastANI runs."
+    )
+    parser.add_argument(
+        "-t", "--threads", type=int, default=CONFIG["threads"], help="fastANI threads."
+    )
+    args = parser.parse_args()
+    if not (args.build or args.query):
+        parser.error("Nothing to do. Pass --build, --query or both.")
+
+    @timer_wrapper
+    def main():
+        if os.path.isfile(args.index + ".json"):
+            index = SketchIndex.load(args.index, mmap=not args.build)
+        else:
+            index = SketchIndex()
+        if args.build:
+            index.add(contigs_files(args.build))
+            index.save(args.index)
+            print(f"Wrote index of {len(index)} genomes to {args.index}.")
+
+        for query in args.query or ():
+            if args.fastani:
+                closest = index.place(
+                    query, args.top_k, output_dir=args.output, threads=args.threads
+                )
+            else:
+                closest = index.query(query, args.top_k)
+            closest.insert(0, "query", genome_name(query))
+            closest.to_csv(sys.stdout, sep="\t")
+
+    main()
@@ -0,0 +1,104 @@
+"""
+One-frame translation of Prodigal genes, in-process.
+
+Blastx searches the six frames of every gene, but Prodigal genes are already in frame.
+Searching their proteins with blastp is a sixth of the work. When only the genes file is
+at hand, e.g. prescreen candidates, genes are translated here instead: all genes of a file
+are joined into one array, every codon is looked up in a codon table at once, and the
+proteins are cut back at the gene boundaries. Proteins are written as Prodigal writes them,
+with the gene's header, 'M' for the start codon and a trailing '*' for the stop codon.
+
+Example:
+    translate_fasta("genome_prodigal_genes.fna", "genome_translated.faa")
+"""
+
+import logging
+import numpy as np
+from Bio.Data import CodonTable
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+from abacat.kmers import encode_nucleotides
+
+logger = logging.getLogger(__name__)
+
+# Prodigal's default translation table.
+PRODIGAL_TABLE = 11
+
+# Codon tables and start codon codes, by table id. See codon_table().
+_tables = dict()
+
+
+def codon_code(codes):
+    """
+    :param codes: Array of codons as rows of 3 nucleotide codes, from kmers.encode_nucleotides.
+    :return: Array of codon codes, 25 * first + 5 * second + third, from 0 to 124.
+    """
+    return codes.astype(np.int64) @ np.array([25, 5, 1])
+
+
+def codon_table(table=PRODIGAL_TABLE):
+    """
+    :param table: NCBI translation table id.
+    :return: Tuple of (uint8 array of amino acids indexed by codon code, array of the codes of start
+             codons). Stop codons are '*', codons with other characters than A, C, G, T are 'X'.
+    """
+    if table not in _tables:
+        codons = CodonTable.unambiguous_dna_by_id[table]
+        residues = np.full(125, ord("X"), dtype=np.uint8)
+        for codon, residue in codons.forward_table.items():
+            residues[codon_code(encode_nucleotides(codon))] = ord(residue)
+        for codon in codons.stop_codons:
+            residues[codon_code(encode_nucleotides(codon))] = ord("*")
+        starts = codon_code(
+            encode_nucleotides("".join(codons.start_codons)).reshape(-1, 3)
+        )
+        _tables[table] = (residues, starts)
+
+    return _tables[table]
+
+
+def translate(seqs, starts=None, table=PRODIGAL_TABLE):
+    """
+    :param seqs: List of gene sequences, in frame from their first base. Bases after the last full
+                 codon are left out.
+    :param starts: List of booleans, whether each gene begins at a start codon. Start codons are
+                   translated as 'M', as by Prodigal. Default is no starts.
+    :param table: NCBI translation table id.
+    :return: List of protein sequences.
+    """
+    residues, start_codes = codon_table(table)
+    lengths = np.array([len(seq) // 3 for seq in seqs], dtype=np.int64)
+    joined = "".join(seq[: 3 * n] for seq, n in zip(seqs, lengths))
+    codes = codon_code(encode_nucleotides(joined).reshape(-1, 3))
+    proteins = residues[codes]
+
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    if starts is not None and len(codes):
+        first = offsets[:-1][(lengths > 0) & np.asarray(starts, dtype=bool)]
+        first = first[np.isin(codes[first], start_codes)]
+        proteins[first] = ord("M")
+
+    proteins = proteins.tobytes().decode()
+    return [proteins[i:j] for i, j in zip(offsets[:-1], offsets[1:])]
+
+
+def translate_fasta(fasta_file, out, table=PRODIGAL_TABLE):
+    """
+    Translates a FASTA file of genes, keeping their headers so hits map back to the gene ids.
+    Genes begin at a start codon unless Prodigal marks them start_type=Edge, i.e. running off a contig.
+
+    :param fasta_file: FASTA file of genes, e.g. Prodigal's genes file.
+    :param out: Output FASTA file of proteins.
+    :param table: NCBI translation table id.
+    :return: Number of proteins written.
+    """
+    with open(fasta_file) as handle:
+        records = list(SimpleFastaParser(handle))
+    starts = ["start_type=Edge" not in header for header, _ in records]
+    proteins = translate([seq for _, seq in records], starts, table)
+
+    with open(out, "w", buffering=2 ** 20) as f:
+        for (header, _), protein in zip(records, proteins):
+            f.write(f">{header}\n{protein}\n")
+    logger.info(f"Translated {len(proteins)} genes of {fasta_file} to {out}.")
+
+    return len(proteins)
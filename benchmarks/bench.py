@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the hot paths of Abacat, run one by one on the genomes of
+abacat/data/genomes. External tools are replaced by the outputs of fixtures.py, so
+runs are offline and repeatable.
+
+Each benchmark is timed `repeat` times and its median is reported. Results are
+written as JSON with a threshold per benchmark. Comparing to a baseline fails when a
+median is slower than the baseline median by more than its threshold.
+
+Example usage:
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py -b is_fasta load_contigs -r 10
+    python benchmarks/bench.py -o results.json --compare benchmarks/baseline.json
+"""
+
+import io
+import os
+import sys
+import json
+import logging
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+from time import perf_counter
+from datetime import datetime
+from contextlib import redirect_stdout
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures  # noqa: E402
+import abacat  # noqa: E402
+from abacat import abacat_helper, prodigal  # noqa: E402
+from abacat.dendrogram import ANIDendrogram  # noqa: E402
+from matplotlib import pyplot as plt  # noqa: E402
+
+GENOME = fixtures.GENOME
+
+DEFAULT_THRESHOLD = 0.25
+
+BENCHMARKS = dict()
+
+
+def benchmark(repeat=5, threshold=DEFAULT_THRESHOLD):
+    """
+    Registers a benchmark. The decorated function takes the fixtures manifest and a
+    scratch directory, does the setup, and returns the function to time.
+
+    :param repeat: Default number of timed runs.
+    :param threshold: Allowed slowdown of the median against a baseline, as a fraction.
+    """
+
+    def decorator(setup):
+        BENCHMARKS[setup.__name__] = {
+            "setup": setup,
+            "repeat": repeat,
+            "threshold": threshold,
+        }
+        return setup
+
+    return decorator
+
+
+def contigs_file(manifest, name=GENOME):
+    return next(i["contigs"] for i in manifest["genomes"] if i["name"] == name)
+
+
+def fixture_genome(manifest, directory, name=GENOME):
+    """
+    :return: Genome with its Prodigal files from the fixtures, writing its outputs to directory.
+    """
+    genome = abacat.Genome(contigs_file(manifest, name))
+    genome.directory = directory
+    genome.load_prodigal(manifest["dir"], load_geneset=False, load_protset=False)
+
+    return genome
+
+
+"""
+Benchmarks.
+"""
+
+
+@benchmark(repeat=20)
+def is_fasta(manifest, directory):
+    contigs = contigs_file(manifest)
+    return lambda: abacat_helper.is_fasta(contigs)
+
+
+@benchmark(repeat=20)
+def load_contigs(manifest, directory):
+    contigs = contigs_file(manifest)
+    return lambda: abacat.Genome().load_contigs(contigs)
+
+
+def records_benchmark(kind):
+    def setup(manifest, directory):
+        genes = fixture_genome(manifest, directory).files["prodigal"]["genes"]
+        # 'gen' returns a generator, so consume it to read the records.
+        return lambda: list(abacat_helper.get_records(genes, kind=kind))
+
+    setup.__name__ = f"get_records_{kind}"
+    return benchmark()(setup)
+
+
+for _kind in ("gen", "list", "dict"):
+    records_benchmark(_kind)
+
+
+@benchmark(repeat=3)
+def df_prodigal(manifest, directory):
+    genome = fixture_genome(manifest, directory)
+    genome.load_geneset(records="list")
+    return genome.df_prodigal
+
+
+def prodigal_table_benchmark(kind):
+    def setup(manifest, directory):
+        table = fixture_genome(manifest, directory).files["prodigal"][kind]
+        parser = getattr(prodigal, f"parse_{kind}")
+        return lambda: parser(table)
+
+    setup.__name__ = f"parse_{kind}"
+    return benchmark()(setup)
+
+
+for _kind in ("cds", "scores"):
+    prodigal_table_benchmark(_kind)
+
+
+@benchmark()
+def parse_alignments(manifest, directory):
+    genome = fixture_genome(manifest, directory)
+    genome.load_geneset()
+    genome.files["phenotyping"] = {"alignments": manifest["phenotyping_alignments"]}
+    return lambda: genome.parse_alignments("phenotyping")
+
+
+@benchmark()
+def run_pathways(manifest, directory):
+    genome = fixture_genome(manifest, directory)
+    genome.load_geneset()
+    genome.files["phenotyping"] = {"alignments": manifest["phenotyping_alignments"]}
+    genome.parse_alignments("phenotyping", write_hits=False)
+    return lambda: genome.run_pathways(info=False)
+
+
+@benchmark()
+def make_ani_table(manifest, directory):
+    ani = ANIDendrogram(fastani_output=manifest["fastani_output"], output_dir=directory)
+    return ani.make_ani_table
+
+
+@benchmark(threshold=0.5)
+def make_dendrogram(manifest, directory):
+    ani = ANIDendrogram(fastani_output=manifest["fastani_output"], output_dir=directory)
+    ani.make_ani_table()
+
+    def run():
+        ani.make_dendrogram()
+        plt.close("all")
+
+    return run
+
+
+"""
+Running and comparing.
+"""
+
+
+def time_benchmark(name, manifest, repeat=None):
+    """
+    :return: Dict with the median, min and max time in seconds, the runs and the threshold.
+    """
+    spec = BENCHMARKS[name]
+    repeat = repeat or spec["repeat"]
+    directory = tempfile.mkdtemp(prefix=f"abacat_bench_{name}_")
+    times = []
+    try:
+        with redirect_stdout(io.StringIO()):
+            func = spec["setup"](manifest, directory)
+            func()  # Warm up
+            for _ in range(repeat):
+                start = perf_counter()
+                func()
+                times.append(perf_counter() - start)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "max": max(times),
+        "runs": repeat,
+        "threshold": spec["threshold"],
+    }
+
+
+def run_benchmarks(names=None, repeat=None, manifest=None):
+    """
+    :param names: Benchmark names. Default is all of them.
+    :param repeat: Number of timed runs. Default is the one of each benchmark.
+    :return: Dict with 'meta' and 'benchmarks'.
+    """
+    manifest = manifest or fixtures.build()
+    results = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fixtures": manifest["source"],
+        },
+        "benchmarks": dict(),
+    }
+    for name in names or BENCHMARKS:
+        results["benchmarks"][name] = time_benchmark(name, manifest, repeat)
+        r = results["benchmarks"][name]
+        print(
+            f"{name:<20}{r['median'] * 1000:>12.2f} ms  "
+            f"(min {r['min'] * 1000:.2f}, max {r['max'] * 1000:.2f}, {r['runs']} runs)"
+        )
+
+    return results
+
+
+def compare(results, baseline):
+    """
+    :param results: Dict from run_benchmarks.
+    :param baseline: Dict from run_benchmarks to compare to.
+    :return: List of (name, baseline median, median, threshold) of the regressed benchmarks.
+    """
+    regressions = []
+    for name, r in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        base = baseline["benchmarks"][name]
+        threshold = base.get("threshold", DEFAULT_THRESHOLD)
+        change = r["median"] / base["median"] - 1
+        print(f"{name:<20}{change:>+10.1%}  (threshold {threshold:+.0%})")
+        if change > threshold:
+            regressions.append((name, base["median"], r["median"], threshold))
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the hot paths of Abacat on the packaged genomes."
+    )
+    parser.add_argument(
+        "-b",
+        "--benchmarks",
+        nargs="*",
+        choices=list(BENCHMARKS),
+        help="Benchmarks to run. Default is all of them.",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, help="Number of timed runs of each benchmark."
+    )
+    parser.add_argument("-o", "--output", help="Write results to this JSON file.")
+    parser.add_argument(
+        "--compare",
+        metavar="BASELINE",
+        help="Baseline JSON file. Exits with 1 if a benchmark regressed past its threshold.",
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    results = run_benchmarks(args.benchmarks, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=3)
+        print(f"Wrote results to {args.output}.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for name, base, median, threshold in regressions:
+            print(
+                f"{name} regressed: {base * 1000:.2f} ms to {median * 1000:.2f} ms, "
+                f"over its {threshold:.0%} threshold."
+            )
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+Fixture outputs of the external tools, so the benchmarks run offline and give the same
+inputs every time.
+
+For each genome in abacat/data/genomes this writes the Prodigal genes, proteins,
+GenBank features and start scores, blastx tabular hits of one genome against the phenotyping database, and a
+fastANI output of all genomes. Outputs are recorded from the real tools when they are in
+PATH, and synthesized otherwise:
+
+    Prodigal    ATG..stop open reading frames of at least 300 bp on both strands.
+    blastx      Deterministic hits of ~4% of the genes to phenotyping references.
+    fastANI     ANI estimated from the Jaccard similarity of 21-mers of the genes.
+
+The formats are the ones of the real tools, so the parsers do the same work. Fixtures
+are written once to benchmarks/fixtures/ and reused. fixtures.json says which were
+recorded and which were synthesized.
+
+Example usage:
+
+    python benchmarks/fixtures.py
+    python benchmarks/fixtures.py --synthetic --force
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import subprocess
+from itertools import combinations
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from abacat import CONFIG, genomes_dir  # noqa: E402
+from abacat.kmers import canonical_kmers  # noqa: E402
+from abacat.aligners import BLAST_FIELDS  # noqa: E402
+from formats import (  # noqa: E402
+    read_fasta,
+    write_prodigal,
+    synthetic_hits,
+    write_blast_tabular,
+    write_fastani,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Genome of the single genome fixtures, like the phenotyping blastx.
+GENOME = "GCF_001021895.1_ASM102189v1_genomic"
+
+# Fixtures written by an older version are written again.
+VERSION = 3
+
+
+def genome_files():
+    """
+    :return: Sorted contigs files of abacat/data/genomes.
+    """
+    return sorted(
+        os.path.join(genomes_dir, i)
+        for i in os.listdir(genomes_dir)
+        if i.endswith(".fna") and "prodigal" not in i
+    )
+
+
+def name_of(file):
+    return os.path.splitext(os.path.basename(file))[0]
+
+
+"""
+fastANI.
+"""
+
+
+def estimate_ani(kmers_a, kmers_b, k=21):
+    """
+    :param kmers_a: Sorted unique k-mer array.
+    :param kmers_b: Sorted unique k-mer array.
+    :return: ANI estimate from the Mash distance of the two k-mer sets, in percent.
+    """
+    shared = len(np.intersect1d(kmers_a, kmers_b, assume_unique=True))
+    if not shared:
+        return 70.0
+    jaccard = shared / (len(kmers_a) + len(kmers_b) - shared)
+    mash = -np.log(2 * jaccard / (1 + jaccard)) / k
+
+    return max(70.0, 100 * (1 - mash))
+
+
+def kmer_ani_pairs(gene_files, fraglen=3000, k=21):
+    """
+    :return: List of fastANI output rows for all pairs of gene files, in both directions.
+    """
+    kmers, fragments = [], []
+    for file in gene_files:
+        seqs = [seq for _, seq in read_fasta(file)]
+        kmers.append(np.unique(canonical_kmers("N".join(seqs), k)))
+        fragments.append(max(1, sum(len(i) for i in seqs) // fraglen))
+
+    pairs = []
+    for i, j in [(i, i) for i in range(len(gene_files))] + list(
+        combinations(range(len(gene_files)), 2)
+    ):
+        ani = 100.0 if i == j else estimate_ani(kmers[i], kmers[j], k)
+        for a, b in {(i, j), (j, i)}:
+            matched = int(fragments[a] * min(1.0, (ani - 70) / 25))
+            pairs.append((gene_files[a], gene_files[b], ani, matched, fragments[a]))
+
+    return pairs
+
+
+"""
+Recording with the real tools.
+"""
+
+
+def run(cmd):
+    subprocess.run(
+        cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+    )
+
+
+def build(fixtures_dir=FIXTURES_DIR, synthetic=False, force=False):
+    """
+    Writes the fixtures, unless they are already there.
+
+    :param synthetic: Never call the real tools.
+    :param force: Write the fixtures again.
+    :return: Dict from fixtures.json.
+    """
+    manifest_file = os.path.join(fixtures_dir, "fixtures.json")
+    if os.path.isfile(manifest_file) and not force:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == VERSION:
+            return manifest
+
+    os.makedirs(fixtures_dir, exist_ok=True)
+
+    def recorded(tool):
+        return not synthetic and shutil.which(tool) is not None
+
+    manifest = {
+        "version": VERSION,
+        "dir": fixtures_dir,
+        "genomes": [],
+        "source": dict(),
+    }
+
+    manifest["source"]["prodigal"] = "recorded" if recorded("prodigal") else "synthetic"
+    for contigs in genome_files():
+        prefix = os.path.join(fixtures_dir, name_of(contigs))
+        genes, proteins, cds, scores = (
+            prefix + "_prodigal_genes.fna",
+            prefix + "_prodigal_proteins.faa",
+            prefix + "_prodigal_cds.gbk",
+            prefix + "_prodigal_scores.txt",
+        )
+        if recorded("prodigal"):
+            run(
+                ["prodigal", "-i", contigs, "-d", genes, "-a", proteins]
+                + ["-o", cds, "-s", scores, "-q"]
+            )
+        else:
+            write_prodigal(contigs, genes, proteins, cds, scores)
+        manifest["genomes"].append(
+            {
+                "name": name_of(contigs),
+                "contigs": contigs,
+                "genes": genes,
+                "proteins": proteins,
+                "cds": cds,
+                "scores": scores,
+            }
+        )
+        print(f"Wrote genes of {name_of(contigs)}.")
+
+    # Phenotyping blastx, as in Genome.run_pathways.
+    genome = next(i for i in manifest["genomes"] if i["name"] == GENOME)
+    alignments = os.path.join(fixtures_dir, genome["name"] + "_phenotyping_blast.tsv")
+    manifest["source"]["blastx"] = "recorded" if recorded("blastx") else "synthetic"
+    if recorded("blastx"):
+        run(
+            [
+                "blastx",
+                "-query",
+                genome["genes"],
+                "-db",
+                CONFIG["db"]["phenotyping"],
+                "-evalue",
+                "0.001",
+                "-outfmt",
+                " ".join(("6",) + BLAST_FIELDS),
+                "-max_target_seqs",
+                "5",
+                "-out",
+                alignments,
+            ]
+        )
+    else:
+        subjects = [
+            (title, len(seq)) for title, seq in read_fasta(CONFIG["db"]["phenotyping"])
+        ]
+        write_blast_tabular(
+            synthetic_hits(read_fasta(genome["genes"]), subjects, protein=True),
+            alignments,
+            stitle=True,
+        )
+    manifest["phenotyping_alignments"] = alignments
+
+    fastani_input = os.path.join(fixtures_dir, "fastani_input.txt")
+    fastani_out = os.path.join(fixtures_dir, "fastani_out_3000")
+    gene_files = [i["genes"] for i in manifest["genomes"]]
+    with open(fastani_input, "w") as f:
+        f.write("\n".join(gene_files) + "\n")
+    manifest["source"]["fastANI"] = "recorded" if recorded("fastANI") else "synthetic"
+    if recorded("fastANI"):
+        run(
+            [
+                "fastANI",
+                "--ql",
+                fastani_input,
+                "--rl",
+                fastani_input,
+                "-o",
+                fastani_out,
+                "--minFraction",
+                "0",
+            ]
+        )
+    else:
+        write_fastani(kmer_ani_pairs(gene_files), fastani_out)
+    manifest["fastani_output"] = fastani_out
+
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=3)
+    print(f"Wrote fixtures to {fixtures_dir}: {manifest['source']}.")
+
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record or synthesize the tool outputs used by the benchmarks."
+    )
+    parser.add_argument(
+        "-o", "--output", default=FIXTURES_DIR, help="Fixtures directory."
+    )
+    parser.add_argument(
+        "-s",
+        "--synthetic",
+        action="store_true",
+        help="Synthesize all outputs, even if the tools are installed.",
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="Write the fixtures again."
+    )
+    args = parser.parse_args()
+    build(args.output, synthetic=args.synthetic, force=args.force)
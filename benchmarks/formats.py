@@ -0,0 +1,287 @@
+"""
+Writers of the output formats of Prodigal, BLAST and fastANI, shared by the benchmark
+fixtures and the tool shims in benchmarks/shims.
+
+Only the standard library is used, so the shims start fast.
+"""
+
+import os
+import time
+import random
+import hashlib
+from xml.sax.saxutils import escape
+
+_bases = "TCAG"
+_amino_acids = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+CODONS = dict(
+    (a + b + c, _amino_acids[16 * i + 4 * j + k])
+    for i, a in enumerate(_bases)
+    for j, b in enumerate(_bases)
+    for k, c in enumerate(_bases)
+)
+COMPLEMENT = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+STOPS = ("TAA", "TAG", "TGA")
+
+
+def sleep_latency(*files):
+    """
+    Sleeps ABACAT_SHIM_LATENCY seconds, plus ABACAT_SHIM_LATENCY_PER_MB seconds for each
+    megabyte of the input files, to stand in for the run time of a tool.
+    """
+    latency = float(os.environ.get("ABACAT_SHIM_LATENCY", 0))
+    per_mb = float(os.environ.get("ABACAT_SHIM_LATENCY_PER_MB", 0))
+    if per_mb:
+        latency += per_mb * sum(os.path.getsize(i) for i in files) / 2 ** 20
+    if latency:
+        time.sleep(latency)
+
+
+def read_fasta(file):
+    """
+    :return: Generator of (title, sequence) tuples, like Bio.SeqIO.FastaIO.SimpleFastaParser.
+    """
+    title, seq = None, []
+    with open(file) as f:
+        for line in f:
+            line = line.rstrip()
+            if line.startswith(">"):
+                if title is not None:
+                    yield title, "".join(seq)
+                title, seq = line[1:], []
+            elif line:
+                seq.append(line)
+    if title is not None:
+        yield title, "".join(seq)
+
+
+def translate(seq):
+    return "".join(CODONS.get(seq[i : i + 3], "X") for i in range(0, len(seq) - 2, 3))
+
+
+def wrap(seq, width=60):
+    return "\n".join(seq[i : i + width] for i in range(0, len(seq), width))
+
+
+"""
+Prodigal.
+"""
+
+
+def call_orfs(seq, min_len=300):
+    """
+    :param seq: Upper case nucleotide sequence.
+    :param min_len: Minimum ORF length, in nucleotides.
+    :return: Sorted list of (start, stop, strand, nucleotide sequence), with 1-based inclusive coordinates.
+    """
+    n, orfs = len(seq), []
+    for strand, s in ((1, seq), (-1, seq.translate(COMPLEMENT)[::-1])):
+        for frame in range(3):
+            start = None
+            for i in range(frame, n - 2, 3):
+                codon = s[i : i + 3]
+                if start is None and codon == "ATG":
+                    start = i
+                elif start is not None and codon in STOPS:
+                    if i + 3 - start >= min_len:
+                        if strand == 1:
+                            orfs.append((start + 1, i + 3, 1, s[start : i + 3]))
+                        else:
+                            orfs.append((n - i - 2, n - start, -1, s[start : i + 3]))
+                    start = None
+
+    return sorted(orfs)
+
+
+def write_prodigal(
+    contigs, genes=None, proteins=None, cds=None, scores=None, min_len=300
+):
+    """
+    Writes Prodigal's genes, proteins, GenBank features and start scores of a contigs file.
+    Genes are the ATG..stop open reading frames of at least min_len on both strands.
+
+    :return: Number of genes.
+    """
+    handles = [open(i, "w") if i else None for i in (genes, proteins, cds, scores)]
+    genes, proteins, cds, scores = handles
+    rng = random.Random(0)
+    n_genes = 0
+    for seqnum, (title, seq) in enumerate(read_fasta(contigs), 1):
+        contig, seq = title.split()[0], seq.upper()
+        header = f'seqnum={seqnum};seqlen={len(seq)};seqhdr="{title}"'
+        if cds:
+            cds.write(
+                f"DEFINITION  {header}\nFEATURES             Location/Qualifiers\n"
+            )
+        if scores:
+            gc = (seq.count("G") + seq.count("C")) / max(len(seq), 1)
+            scores.write(
+                f"# Sequence Data: {header}\n"
+                f'# Run Data: version=Prodigal.v2.6.3;run_type=Single;model="Ab initio";'
+                f"gc_cont={gc * 100:.2f};transl_table=11;uses_sd=1\n"
+                "Beg\tEnd\tStd\tTotal\tCodPot\tStrtSc\tCodon\tRBSMot\tSpacer\tRBSScr\tUpsScr\tTypeScr\tGCCont\n"
+            )
+        for ix, (start, stop, strand, nt) in enumerate(call_orfs(seq, min_len), 1):
+            gc = (nt.count("G") + nt.count("C")) / len(nt)
+            fields = (
+                f"ID={seqnum}_{ix};partial=00;start_type=ATG;rbs_motif=AGGAG;"
+                f"rbs_spacer=5-10bp;gc_cont={gc:.3f}"
+            )
+            description = f">{contig}_{ix} # {start} # {stop} # {strand} # {fields}"
+            if genes:
+                genes.write(f"{description}\n{wrap(nt)}\n")
+            if proteins:
+                proteins.write(f"{description}\n{wrap(translate(nt) + '*')}\n")
+            cscore, sscore = rng.uniform(-5, 300), rng.uniform(-10, 15)
+            if cds:
+                location = (
+                    f"{start}..{stop}"
+                    if strand == 1
+                    else f"complement({start}..{stop})"
+                )
+                conf = min(99.99, max(50.0, 50 + cscore / 6))
+                cds.write(
+                    f"     CDS             {location}\n"
+                    f'                     /note="{fields};conf={conf:.2f};score={cscore + sscore:.2f};'
+                    f'cscore={cscore:.2f};sscore={sscore:.2f};rscore=4.46;uscore=1.99;tscore=3.63;"\n'
+                )
+            if scores:
+                scores.write(
+                    f"{start}\t{stop}\t{'+' if strand == 1 else '-'}\t{cscore + sscore:.2f}\t"
+                    f"{cscore:.2f}\t{sscore:.2f}\tATG\tAGGAG\t5-10bp\t4.46\t1.99\t3.63\t{gc:.3f}\n"
+                )
+            n_genes += 1
+        if cds:
+            cds.write("//\n")
+
+    for handle in handles:
+        if handle:
+            handle.close()
+
+    return n_genes
+
+
+"""
+BLAST.
+"""
+
+
+def synthetic_hits(queries, subjects, hit_rate=0.04, max_hits=5, protein=False):
+    """
+    :param queries: Iterable of (title, sequence) tuples.
+    :param subjects: List of (title, length) tuples of the database.
+    :param hit_rate: Fraction of queries with hits.
+    :param protein: Align the translated query, as blastx does.
+    :return: Generator of (title, query length, hits, aligned query) for write_blast_xml.
+             Identical queries always get the same hits.
+    """
+    for title, seq in queries:
+        seq = seq.upper()
+        rng = random.Random(int(hashlib.md5(seq.encode()).hexdigest(), 16))
+        hits = []
+        if subjects and rng.random() < hit_rate:
+            hits = rng.sample(subjects, k=min(rng.randint(1, max_hits), len(subjects)))
+        yield title, len(seq), hits, translate(seq) if protein else seq
+
+
+def write_blast_xml(results, out, program="blastn", db=""):
+    """
+    Writes BLAST XML output (-outfmt 5).
+
+    :param results: Iterable of (query title, query length, [(hit title, hit length), ...], aligned query).
+    :param out: Output file.
+    """
+    with open(out, "w") as f:
+        f.write(
+            '<?xml version="1.0"?>\n'
+            '<!DOCTYPE BlastOutput PUBLIC "-//NCBI//NCBI BlastOutput/EN" '
+            '"http://www.ncbi.nlm.nih.gov/dtd/NCBI_BlastOutput.dtd">\n'
+            "<BlastOutput>\n"
+            f"  <BlastOutput_program>{program}</BlastOutput_program>\n"
+            f"  <BlastOutput_version>{program.upper()} 2.9.0+</BlastOutput_version>\n"
+            "  <BlastOutput_reference>Altschul et al.</BlastOutput_reference>\n"
+            f"  <BlastOutput_db>{escape(db)}</BlastOutput_db>\n"
+            "  <BlastOutput_query-ID>Query_1</BlastOutput_query-ID>\n"
+            "  <BlastOutput_query-def>Query_1</BlastOutput_query-def>\n"
+            "  <BlastOutput_query-len>1</BlastOutput_query-len>\n"
+            "  <BlastOutput_param><Parameters><Parameters_expect>0.001</Parameters_expect>"
+            "</Parameters></BlastOutput_param>\n"
+            "<BlastOutput_iterations>\n"
+        )
+        for q_ix, (query, q_len, hits, aligned) in enumerate(results, 1):
+            f.write(
+                "<Iteration>\n"
+                f"  <Iteration_iter-num>{q_ix}</Iteration_iter-num>\n"
+                f"  <Iteration_query-ID>Query_{q_ix}</Iteration_query-ID>\n"
+                f"  <Iteration_query-def>{escape(query)}</Iteration_query-def>\n"
+                f"  <Iteration_query-len>{q_len}</Iteration_query-len>\n"
+                "<Iteration_hits>\n"
+            )
+            for h_ix, (title, h_len) in enumerate(hits, 1):
+                length = min(len(aligned), h_len)
+                f.write(
+                    "<Hit>\n"
+                    f"  <Hit_num>{h_ix}</Hit_num>\n"
+                    f"  <Hit_id>gnl|BL_ORD_ID|{h_ix}</Hit_id>\n"
+                    f"  <Hit_def>{escape(title)}</Hit_def>\n"
+                    f"  <Hit_accession>{h_ix}</Hit_accession>\n"
+                    f"  <Hit_len>{h_len}</Hit_len>\n"
+                    "  <Hit_hsps><Hsp>\n"
+                    "    <Hsp_num>1</Hsp_num>\n"
+                    f"    <Hsp_bit-score>{length * 1.8:.1f}</Hsp_bit-score>\n"
+                    f"    <Hsp_score>{length * 2}</Hsp_score>\n"
+                    "    <Hsp_evalue>1e-50</Hsp_evalue>\n"
+                    f"    <Hsp_query-from>1</Hsp_query-from><Hsp_query-to>{length}</Hsp_query-to>\n"
+                    f"    <Hsp_hit-from>1</Hsp_hit-from><Hsp_hit-to>{length}</Hsp_hit-to>\n"
+                    "    <Hsp_query-frame>1</Hsp_query-frame><Hsp_hit-frame>1</Hsp_hit-frame>\n"
+                    f"    <Hsp_identity>{length}</Hsp_identity><Hsp_positive>{length}</Hsp_positive>\n"
+                    f"    <Hsp_gaps>0</Hsp_gaps><Hsp_align-len>{length}</Hsp_align-len>\n"
+                    f"    <Hsp_qseq>{aligned[:length]}</Hsp_qseq>\n"
+                    f"    <Hsp_hseq>{aligned[:length]}</Hsp_hseq>\n"
+                    f"    <Hsp_midline>{'|' * length}</Hsp_midline>\n"
+                    "  </Hsp></Hit_hsps>\n"
+                    "</Hit>\n"
+                )
+            f.write(
+                "</Iteration_hits>\n"
+                "  <Iteration_stat><Statistics><Statistics_db-num>1</Statistics_db-num>"
+                "<Statistics_db-len>1</Statistics_db-len><Statistics_hsp-len>0</Statistics_hsp-len>"
+                "<Statistics_eff-space>0</Statistics_eff-space><Statistics_kappa>0.041</Statistics_kappa>"
+                "<Statistics_lambda>0.267</Statistics_lambda><Statistics_entropy>0.14</Statistics_entropy>"
+                "</Statistics></Iteration_stat>\n"
+                "</Iteration>\n"
+            )
+        f.write("</BlastOutput_iterations>\n</BlastOutput>\n")
+
+
+def write_blast_tabular(results, out, stitle=False):
+    """
+    Writes BLAST tabular output (-outfmt 6): qseqid sseqid pident length mismatch gapopen
+    qstart qend sstart send evalue bitscore, and stitle if asked for.
+
+    :param results: Same as for write_blast_xml.
+    """
+    with open(out, "w") as f:
+        for query, _, hits, aligned in results:
+            for title, h_len in hits:
+                length = min(len(aligned), h_len)
+                f.write(
+                    f"{query.split()[0]}\t{title.split()[0]}\t100.000\t{length}\t0\t0\t"
+                    f"1\t{length}\t1\t{length}\t1e-50\t{length * 1.8:.1f}"
+                    + (f"\t{title}\n" if stitle else "\n")
+                )
+
+
+"""
+fastANI.
+"""
+
+
+def write_fastani(pairs, out):
+    """
+    Writes fastANI output: query, reference, ANI, matched fragments and total fragments.
+
+    :param pairs: Iterable of (query, reference, ANI, matched fragments, total fragments).
+    """
+    with open(out, "w") as f:
+        for query, reference, ani, matched, total in pairs:
+            f.write(f"{query}\t{reference}\t{ani:.4f}\t{matched}\t{total}\n")
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+"""
+Load test of the Abacat pipelines on growing sets of synthetic genomes.
+
+Prodigal, BLAST and fastANI are replaced by the shims in benchmarks/shims, which write
+the formats and sizes of the real tools. Their run time can be set with
+ABACAT_SHIM_LATENCY (seconds per call) and ABACAT_SHIM_LATENCY_PER_MB (seconds per
+megabyte of input). For each number of genomes, each pipeline runs in a new process,
+and its time, throughput and peak memory are recorded:
+
+    prodigal      Genome.run_prodigal on each genome. Runs first, the others need its genes.
+    annotate      GenomeCollection.blast_seqs of all genes to MEGARes.
+    phenotyping   Genome.run_pathways of each genome of a GenomeCollection.
+    dendrogram    ANIDendrogram of all genomes: fastANI, ANI table and dendrogram.
+
+Example usage:
+
+    python benchmarks/loadtest.py -n 10 100 1000 -o loadtest.json --plot loadtest.png
+    python benchmarks/loadtest.py -n 10000 --genes 100 -p prodigal annotate  # 1M genes
+    python benchmarks/loadtest.py -n 5000 -p dendrogram  # 5k-way ANI
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import platform
+import resource
+import traceback
+import multiprocessing
+from time import perf_counter
+from datetime import datetime
+from contextlib import redirect_stdout
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SHIMS_DIR = os.path.join(BENCHMARKS_DIR, "shims")
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from synthetic import SyntheticGenomes  # noqa: E402
+
+PIPELINES = ("prodigal", "annotate", "phenotyping", "dendrogram")
+
+
+def use_shims(work_dir, memory_budget=None):
+    """
+    Puts the shims first in PATH, and points CONFIG at them and at work_dir.
+
+    :param memory_budget: CONFIG["memory"]["budget"], in megabytes.
+    """
+    os.environ["PATH"] = SHIMS_DIR + os.pathsep + os.environ["PATH"]
+
+    from abacat import CONFIG
+
+    CONFIG["third_party"]["fastANI"] = os.path.join(SHIMS_DIR, "fastANI")
+    CONFIG["cache_dir"] = os.path.join(work_dir, "cache")
+    if memory_budget is not None:
+        CONFIG["memory"]["budget"] = int(memory_budget * 2 ** 20)
+
+
+def count_genes(genes_files):
+    n = 0
+    for file in genes_files:
+        with open(file) as f:
+            n += sum(1 for line in f if line.startswith(">"))
+
+    return n
+
+
+"""
+Pipelines. Each takes the contigs files of a step, and returns the number of genes it processed.
+"""
+
+
+def run_prodigal(contigs):
+    import abacat
+
+    for file in contigs:
+        abacat.Genome(file).run_prodigal(quiet=True, load_sets=[])
+
+    return count_genes(genes_files(contigs))
+
+
+def run_annotate(contigs):
+    import abacat
+
+    collection = abacat.GenomeCollection(contigs)
+    collection.blast_seqs("megares", blast="n")
+
+    return collection.stats["blast_megares"]["queries"]
+
+
+def run_phenotyping(contigs):
+    import abacat
+
+    collection = abacat.GenomeCollection(contigs)
+    for name in collection:
+        collection[name].run_pathways(info=False)
+
+    return count_genes(genes_files(contigs))
+
+
+def run_dendrogram(contigs):
+    from matplotlib import pyplot as plt
+    from abacat.dendrogram import ANIDendrogram
+
+    directory = os.path.dirname(contigs[0])
+    ani = ANIDendrogram(output_dir=os.path.join(directory, "ani_output"))
+    ani.make_fastani_input(genes_files(contigs))
+    ani.run()
+    ani.make_ani_table()
+    ani.make_dendrogram()
+    plt.close("all")
+
+    return count_genes(genes_files(contigs))
+
+
+def genes_files(contigs):
+    return [os.path.splitext(i)[0] + "_prodigal_genes.fna" for i in contigs]
+
+
+def measure(pipeline, contigs, work_dir, memory_budget, queue):
+    """
+    Runs a pipeline in this process and puts its measures in queue.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    logging.disable(logging.INFO)
+    use_shims(work_dir, memory_budget)
+    result = {"genomes": len(contigs)}
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = perf_counter()
+    try:
+        with redirect_stdout(io.StringIO()):
+            result["genes"] = globals()[f"run_{pipeline}"](contigs)
+    except Exception:
+        result["error"] = traceback.format_exc()
+    seconds = perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux. The tools are not counted, they run in their own processes.
+    result.update(
+        {
+            "seconds": seconds,
+            "genomes_per_second": len(contigs) / seconds,
+            "genes_per_second": result.get("genes", 0) / seconds,
+            "start_rss_mb": start_rss / 1024,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+    )
+    from abacat import memory_stats
+
+    result["memory"] = memory_stats()
+    queue.put(result)
+
+
+def run_step(pipeline, contigs, work_dir, memory_budget=None):
+    """
+    :return: Dict of measures of a pipeline, run in a new process.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(pipeline, contigs, work_dir, memory_budget, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    return result
+
+
+def step_contigs(genome_files, step_dir):
+    """
+    :return: Links to genome_files in step_dir, so each step writes its outputs apart.
+    """
+    os.makedirs(step_dir, exist_ok=True)
+    links = []
+    for file in genome_files:
+        link = os.path.join(step_dir, os.path.basename(file))
+        if not os.path.exists(link):
+            os.symlink(os.path.abspath(file), link)
+        links.append(link)
+
+    return links
+
+
+def load_test(
+    sizes,
+    pipelines=PIPELINES,
+    work_dir="abacat_loadtest",
+    keep=False,
+    memory_budget=None,
+    **generator_kwargs,
+):
+    """
+    :param sizes: Numbers of genomes to run the pipelines on.
+    :param pipelines: Pipelines to run. prodigal is added if any other one is run.
+    :param work_dir: Directory for the genomes and outputs.
+    :param keep: Keep the outputs of each step.
+    :param memory_budget: Memory budget of the loaded gene and protein sets, in megabytes. See abacat.memory.
+    :param generator_kwargs: Arguments of SyntheticGenomes.
+    :return: Dict with 'meta' and 'steps', one per size.
+    """
+    work_dir = os.path.abspath(work_dir)  # Links and pipeline processes need absolute paths
+    pipelines = [i for i in PIPELINES if i in pipelines or i == "prodigal"]
+    generator = SyntheticGenomes(**generator_kwargs)
+    results = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "generator": generator_kwargs,
+            "memory_budget_mb": memory_budget,
+            "shims": dict(
+                (i, os.environ[i]) for i in os.environ if i.startswith("ABACAT_SHIM")
+            ),
+        },
+        "steps": [],
+    }
+
+    start = perf_counter()
+    genome_files = generator.write(os.path.join(work_dir, "genomes"), max(sizes))
+    print(f"Wrote {max(sizes)} genomes in {perf_counter() - start:.1f} s.")
+
+    for n in sorted(sizes):
+        step_dir = os.path.join(work_dir, f"step_{n}")
+        contigs = step_contigs(genome_files[:n], step_dir)
+        step = {"genomes": n, "pipelines": dict()}
+        for pipeline in pipelines:
+            result = run_step(pipeline, contigs, work_dir, memory_budget)
+            step["pipelines"][pipeline] = result
+            if "error" in result:
+                print(f"{pipeline} failed on {n} genomes:\n{result['error']}")
+            else:
+                print(
+                    f"{n:>8} genomes {pipeline:<12}{result['seconds']:>10.2f} s"
+                    f"{result['genes_per_second']:>12.0f} genes/s"
+                    f"{result['peak_rss_mb']:>10.0f} MB peak"
+                )
+        step["genes"] = step["pipelines"]["prodigal"].get("genes")
+        results["steps"].append(step)
+        if not keep:
+            shutil.rmtree(step_dir)
+
+    return results
+
+
+def plot(results, out):
+    """
+    Plots throughput and peak memory of each pipeline against the number of genes.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    fig, (ax_speed, ax_memory) = plt.subplots(1, 2, figsize=(12, 5))
+    for pipeline in results["steps"][0]["pipelines"]:
+        points = [
+            (i["genes"], i["pipelines"][pipeline])
+            for i in results["steps"]
+            if "error" not in i["pipelines"][pipeline]
+        ]
+        genes = [i for i, _ in points]
+        ax_speed.plot(
+            genes, [r["genes_per_second"] for _, r in points], "o-", label=pipeline
+        )
+        ax_memory.plot(
+            genes, [r["peak_rss_mb"] for _, r in points], "o-", label=pipeline
+        )
+    for ax, label in ((ax_speed, "Genes per second"), (ax_memory, "Peak RSS (MB)")):
+        ax.set_xscale("log")
+        ax.set_xlabel("Genes")
+        ax.set_ylabel(label)
+        ax.legend()
+    plt.savefig(out, bbox_inches="tight")
+    plt.close(fig)
+    print(f"Wrote plot to {out}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test the Abacat pipelines on synthetic genomes, with stand-in tools."
+    )
+    parser.add_argument(
+        "-n",
+        "--genomes",
+        nargs="+",
+        type=int,
+        default=[10, 30, 100],
+        help="Numbers of genomes to run on. Default is 10 30 100.",
+    )
+    parser.add_argument(
+        "-p",
+        "--pipelines",
+        nargs="+",
+        choices=PIPELINES,
+        default=list(PIPELINES),
+        help="Pipelines to run. Default is all of them.",
+    )
+    parser.add_argument(
+        "--genes", type=int, default=100, help="Genes per genome. Default is 100."
+    )
+    parser.add_argument(
+        "--clade-size", type=int, default=50, help="Genomes per clade. Default is 50."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-w",
+        "--work-dir",
+        default="abacat_loadtest",
+        help="Directory for the genomes and outputs.",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the outputs of each step."
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        help="Memory budget of the loaded gene and protein sets, in MB. Default is none.",
+    )
+    parser.add_argument("-o", "--output", help="Write results to this JSON file.")
+    parser.add_argument("--plot", help="Plot the curves to this image file.")
+    args = parser.parse_args()
+
+    results = load_test(
+        args.genomes,
+        args.pipelines,
+        args.work_dir,
+        args.keep,
+        args.memory_budget,
+        genes_per_genome=args.genes,
+        clade_size=args.clade_size,
+        seed=args.seed,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=3)
+        print(f"Wrote results to {args.output}.")
+    if args.plot:
+        plot(results, args.plot)
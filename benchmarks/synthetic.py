@@ -0,0 +1,188 @@
+"""
+Generators of synthetic genomes and genes for the load tests.
+
+Genomes come in clades of closely related strains, so ANI, shared genes and duplicate
+genes look like those of a set of genomes of a species. Each genome only depends on
+the seed and its index, so the genomes of a small run are the first genomes of a
+larger one.
+
+Example:
+    genomes = SyntheticGenomes(genes_per_genome=100, clade_size=50)
+    files = genomes.write("genomes/", 1000)  # 100k genes
+"""
+
+import os
+import numpy as np
+
+_bases = "TCAG"
+_amino_acids = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+SENSE_CODONS = np.array(
+    [
+        list((a + b + c).encode())
+        for i, a in enumerate(_bases)
+        for j, b in enumerate(_bases)
+        for k, c in enumerate(_bases)
+        if _amino_acids[16 * i + 4 * j + k] != "*"
+    ],
+    dtype=np.uint8,
+)
+STOP_CODONS = (b"TAA", b"TAG", b"TGA")
+COMPLEMENT = bytes.maketrans(b"ACGT", b"TGCA")
+
+
+def random_genes(rng, n, mean_length=900, min_length=300):
+    """
+    :param rng: numpy Generator.
+    :param n: Number of genes.
+    :param mean_length: Mean gene length, in nucleotides.
+    :return: List of arrays of sense codon indexes, without the start and stop codons.
+    """
+    lengths = rng.gamma(4, mean_length / 4, size=n).astype(int) // 3
+    lengths = np.maximum(lengths, min_length // 3)
+
+    return [rng.integers(0, len(SENSE_CODONS), size=i, dtype=np.uint8) for i in lengths]
+
+
+def mutate(rng, genes, rate):
+    """
+    :param genes: List of codon index arrays, from random_genes.
+    :param rate: Fraction of codons changed to another sense codon.
+    :return: Mutated copies of genes. Genes keep their length and never get a stop codon.
+    """
+    if not genes:
+        return []
+    codons = np.concatenate(genes)
+    mutated = rng.random(len(codons)) < rate
+    codons[mutated] = rng.integers(
+        0, len(SENSE_CODONS), size=mutated.sum(), dtype=np.uint8
+    )
+
+    return np.split(codons, np.cumsum([len(i) for i in genes])[:-1])
+
+
+def gene_sequence(codons, stop=b"TAA"):
+    """
+    :return: Nucleotide sequence of a gene, as bytes, with its start and stop codons.
+    """
+    return b"ATG" + SENSE_CODONS[codons].tobytes() + stop
+
+
+class SyntheticGenomes:
+    """
+    SyntheticGenomes, a population of synthetic bacterial genomes.
+
+    All genomes share the genes of a root genome. Each clade diverges from the root by
+    clade_divergence, and each genome from its clade by strain_divergence, as the
+    fraction of codons changed. A fraction of each genome's genes (accessory) comes
+    from a pool of accessory genes instead. Genes are laid out on both strands of a few
+    contigs, separated by short intergenic regions.
+    """
+
+    def __init__(
+        self,
+        genes_per_genome=100,
+        clade_size=50,
+        clade_divergence=0.05,
+        strain_divergence=0.005,
+        accessory=0.1,
+        mean_length=900,
+        seed=0,
+    ):
+        super(SyntheticGenomes, self).__init__()
+        self.genes_per_genome = genes_per_genome
+        self.clade_size = clade_size
+        self.clade_divergence = clade_divergence
+        self.strain_divergence = strain_divergence
+        self.accessory = accessory
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.core = random_genes(rng, genes_per_genome, mean_length)
+        self.accessory_pool = random_genes(rng, 2 * genes_per_genome, mean_length)
+        self._clades = dict()
+
+    def name(self, ix):
+        return f"synthetic_{self.seed}_{ix:06d}"
+
+    def clade(self, ix):
+        """
+        :return: Core genes of the clade of genome ix.
+        """
+        clade = ix // self.clade_size
+        if clade not in self._clades:
+            rng = np.random.default_rng((self.seed, 1, clade))
+            self._clades = {clade: mutate(rng, self.core, self.clade_divergence)}
+
+        return self._clades[clade]
+
+    def genes(self, ix):
+        """
+        :return: List of codon index arrays of the genes of genome ix.
+        """
+        rng = np.random.default_rng((self.seed, 2, ix))
+        genes = [i.copy() for i in self.clade(ix)]
+        n_accessory = int(round(self.accessory * len(genes)))
+        if n_accessory:
+            replaced = rng.choice(len(genes), size=n_accessory, replace=False)
+            picked = rng.choice(
+                len(self.accessory_pool), size=n_accessory, replace=False
+            )
+            for i, j in zip(replaced, picked):
+                genes[i] = self.accessory_pool[j].copy()
+
+        return mutate(rng, genes, self.strain_divergence)
+
+    def contigs(self, ix):
+        """
+        :return: List of (contig name, sequence) tuples of genome ix.
+        """
+        rng = np.random.default_rng((self.seed, 3, ix))
+        genes = self.genes(ix)
+        n_contigs = int(rng.integers(1, 4))
+        breaks = (
+            set(rng.choice(np.arange(1, len(genes)), size=n_contigs - 1, replace=False))
+            if len(genes) > n_contigs
+            else set()
+        )
+
+        contigs, pieces = [], []
+        for i, codons in enumerate(genes):
+            if i in breaks:
+                contigs.append(b"".join(pieces))
+                pieces = []
+            spacer = SENSE_CODONS[
+                rng.integers(0, len(SENSE_CODONS), size=rng.integers(10, 60))
+            ]
+            pieces.append(b"T" + spacer.tobytes())  # Out of the frame of the next gene
+            seq = gene_sequence(codons, STOP_CODONS[i % 3])
+            if rng.random() < 0.5:
+                seq = seq.translate(COMPLEMENT)[::-1]
+            pieces.append(seq)
+        contigs.append(b"".join(pieces))
+
+        return [
+            (f"{self.name(ix)}_contig_{i + 1}", seq.decode())
+            for i, seq in enumerate(contigs)
+        ]
+
+    def write(self, directory, n, start=0):
+        """
+        Writes the contigs files of genomes start to start + n, skipping the ones already there.
+
+        :return: List of contigs files.
+        """
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for ix in range(start, start + n):
+            file = os.path.join(directory, self.name(ix) + ".fna")
+            if not os.path.isfile(file):
+                with open(file + ".tmp", "w") as f:
+                    for name, seq in self.contigs(ix):
+                        f.write(f">{name}\n")
+                        f.write(
+                            "\n".join(seq[i : i + 80] for i in range(0, len(seq), 80))
+                            + "\n"
+                        )
+                os.replace(file + ".tmp", file)
+            files.append(file)
+
+        return files
@@ -18,6 +18,9 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     scripts=[
         "abacat/prodigal.py",
+        "abacat/database.py",
+        "abacat/sketch.py",
+        "abacat/duplicates.py",
         "abacat/pipelines/annotate.py",
         "abacat/pipelines/phenotyping.py",
         "abacat/deprecated/prokka.py",
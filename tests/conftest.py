@@ -0,0 +1,67 @@
+import os
+import pytest
+import abacat
+
+"""
+Fixtures of the tests: stand-ins for third party programs, and databases in CONFIG.
+"""
+
+# Stand-ins of benchmarks/shims: blastn, blastp, blastx, makeblastdb, prodigal and fastANI.
+SHIMS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "shims"
+)
+
+
+@pytest.fixture
+def shims(monkeypatch):
+    """
+    Puts the stand-ins of benchmarks/shims in PATH.
+    :return: Directory of the stand-ins.
+    """
+    monkeypatch.setenv("PATH", SHIMS + os.pathsep + os.environ["PATH"])
+
+    return SHIMS
+
+
+@pytest.fixture
+def stand_ins(monkeypatch, tmp_path):
+    """
+    Puts a bin directory in PATH, for stand-ins written by the test.
+    :return: Function of (program, script) that writes an executable stand-in and returns its path.
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+    def stand_in(program, script):
+        executable = bin_dir / program
+        executable.write_text(script)
+        executable.chmod(0o755)
+        return executable
+
+    return stand_in
+
+
+@pytest.fixture
+def database(monkeypatch, tmp_path):
+    """
+    Databases of CONFIG in a db directory, with CONFIG["cache_dir"] in tmp_path so indexes
+    built from them are not cached for other runs.
+    :return: Function of (db, fasta=None, dbtype='nucl') that writes the FASTA of db, or a prebuilt
+             Blast database of empty index files without one, and returns its path.
+    """
+    db_dir = tmp_path / "db"
+    db_dir.mkdir()
+    monkeypatch.setitem(abacat.CONFIG, "cache_dir", str(tmp_path / "cache"))
+
+    def write_database(db, fasta=None, dbtype="nucl"):
+        path = db_dir / f"{db}.fasta"
+        if fasta is None:
+            for ext in ("hr", "in", "sq"):
+                (db_dir / f"{db}.fasta.{dbtype[0]}{ext}").touch()
+        else:
+            path.write_text(fasta)
+        monkeypatch.setitem(abacat.CONFIG["db"], db, str(path))
+        return path
+
+    return write_database
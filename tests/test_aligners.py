@@ -0,0 +1,140 @@
+import os
+import abacat
+import pytest
+from abacat.aligners import (
+    HIT_COLUMNS,
+    get_aligner,
+    best_hits,
+    read_alignments,
+    DiamondAligner,
+)
+from tests.test_collection import write_genome
+
+"""
+Module for testing the aligner backends and their tabular hits.
+"""
+
+# Stand-in for diamond and mmseqs: indexes by touching the index, and every first gene of a contig
+# gets a worse hit and then a better one. Calls are logged next to it.
+STAND_IN = """#!/usr/bin/env python
+import os
+import sys
+program, args = os.path.basename(sys.argv[0]), sys.argv[1:]
+with open(os.path.join(os.path.dirname(sys.argv[0]), "calls"), "a") as f:
+    f.write(f"{program} {args[0]}\\n")
+if args[0] in ("makedb", "createdb"):
+    index = args[args.index("--db") + 1] if program == "diamond" else args[2] + ".dbtype"
+    open(index, "w").close()
+    sys.exit(0)
+if program == "diamond":
+    query, out = args[args.index("--query") + 1], args[args.index("--out") + 1]
+    fields = args[args.index("--outfmt") + 2 : args.index("--evalue")]
+    expected = "qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore stitle"
+else:
+    query, out = args[1], args[3]
+    os.makedirs(args[4])
+    fields = args[args.index("--format-output") + 1].split(",")
+    expected = "query target pident alnlen mismatch gapopen qstart qend tstart tend evalue bits theader"
+if fields != expected.split():
+    sys.exit(f"Error: invalid output fields {fields}")
+queries = [i[1:].split()[0] for i in open(query) if i.startswith(">")]
+with open(out, "w") as f:
+    for query in queries:
+        if query.endswith("_1"):
+            f.write(f"{query}\\tref_b\\t40.0\\t90\\t54\\t2\\t1\\t90\\t1\\t90\\t1e-5\\t50.5\\tref_b worse\\n")
+            f.write(f"{query}\\tref_a\\t99.0\\t99\\t1\\t0\\t1\\t99\\t1\\t99\\t1e-60\\t200\\tref_a Bla|OXA-223\\n")
+"""
+
+
+def use_stand_ins(stand_ins, database):
+    """
+    Puts the diamond and mmseqs stand-ins in PATH and a protein FASTA database as COG in CONFIG.
+    :return: File of the logged calls.
+    """
+    database("COG", ">ref_a Bla|OXA-223\nMKLV\n>ref_b worse\nMKKV\n")
+    stand_ins("diamond", STAND_IN)
+
+    return stand_ins("mmseqs", STAND_IN).with_name("calls")
+
+
+def test_best_hits(tmp_path):
+    """
+    :return: asserts that the best hit of each query has the highest bit score, and the first one on ties.
+    """
+    hits_file = tmp_path / "hits.tsv"
+    hits_file.write_text(
+        "q1\ts1\t90\t10\t1\t0\t1\t10\t1\t10\t1e-5\t20\ts1 first\n"
+        "q1\ts2\t95\t10\t0\t0\t1\t10\t1\t10\t1e-9\t30\ts2 best\n"
+        "q2\ts3\t90\t10\t1\t0\t1\t10\t1\t10\t1e-5\t20\ts3 tied\n"
+        "q2\ts1\t90\t10\t1\t0\t1\t10\t1\t10\t1e-5\t20\ts1 tied\n"
+    )
+    assert list(best_hits(str(hits_file))) == [("q1", "s2 best"), ("q2", "s3 tied")]
+    alignments = read_alignments(str(hits_file))
+    assert tuple(alignments.columns) == HIT_COLUMNS and len(alignments) == 4
+    assert alignments["bitscore"].max() == 30
+
+
+def test_get_aligner(monkeypatch):
+    """
+    :return: asserts that backends are picked by database in CONFIG, and reject searches they cannot run.
+    """
+    monkeypatch.setitem(abacat.CONFIG["aligner"], "by_db", {"COG": "diamond"})
+    assert isinstance(get_aligner("COG", blast="blastp"), DiamondAligner)
+    assert get_aligner("megares").name == abacat.CONFIG["aligner"]["backend"]
+    assert get_aligner("COG", blast="p", backend="mmseqs").name == "mmseqs"
+    with pytest.raises(ValueError):
+        get_aligner("COG", blast="blastn")
+    with pytest.raises(Exception):
+        get_aligner("COG", backend="hmmer")
+
+
+def test_blast_seqs_diamond(monkeypatch, tmp_path, stand_ins, database):
+    """
+    :return: asserts that a collection searched with the backend of CONFIG gets the best hits, and
+             the index is only built once.
+    """
+    calls = use_stand_ins(stand_ins, database)
+    monkeypatch.setitem(abacat.CONFIG["aligner"], "by_db", {"COG": "diamond"})
+
+    genomes = tmp_path / "genomes"
+    genomes.mkdir()
+    for i in range(2):
+        write_genome(str(genomes), f"genome_{i}", seed=i)
+    collection = abacat.from_directory(str(genomes))
+    assert collection.blast_seqs("COG", blast="p") == {"genome_0": 1, "genome_1": 1}
+    collection.blast_seqs("COG", blast="p")
+
+    assert calls.read_text().split("\n")[:-1] == [
+        "diamond makedb",
+        "diamond blastp",
+        "diamond blastp",
+    ]
+    with open(collection["genome_1"].files["COG"]["hits"]) as f:
+        assert f.read() == "genome_1_contig_1 ref_a Bla|OXA-223\n"
+
+
+def test_genome_blast_seqs_mmseqs(tmp_path, stand_ins, database):
+    """
+    :return: asserts that Genome.blast_seqs takes the hits of another backend, and cleans up after it.
+    """
+    calls = use_stand_ins(stand_ins, database)
+    genomes = tmp_path / "genomes"
+    genomes.mkdir()
+    write_genome(str(genomes), "genome_0")
+    genome = abacat.from_directory(str(genomes))["genome_0"]
+    report = genome.blast_seqs("COG", blast="x", aligner="mmseqs")
+
+    assert report["hits"] == 1 and report["queries"] == 20
+    assert calls.read_text() == "mmseqs createdb\nmmseqs easy-search\n"
+    assert genome.files["COG"]["alignments"].endswith("genome_0_COG_mmseqs.tsv")
+    assert [i.description for i in genome.geneset["COG"]["records"]] == [
+        "genome_0_contig_1 ref_a Bla|OXA-223"
+    ]
+    assert sorted(os.listdir(genomes)) == [
+        "genome_0.fna",
+        "genome_0_COG.fasta",
+        "genome_0_COG.hits",
+        "genome_0_COG_mmseqs.tsv",
+        "genome_0_megares.hits",
+        "genome_0_prodigal_genes.fna",
+    ]
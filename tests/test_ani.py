@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import random
+import numpy as np
+import pandas as pd
+from abacat.ani import ANIMatrix, read_fastani, cluster_fastani
+from abacat.config import CONFIG
+from abacat.abacat_helper import acquire_lock, heartbeat
+from abacat.dendrogram import ANIDendrogram
+
+"""
+Module for testing sparse ANI matrices from fastANI outputs.
+"""
+
+FASTANI = """dir/a_prodigal_genes.fna	dir/a_prodigal_genes.fna	100	10	10
+dir/a_prodigal_genes.fna	dir/b_prodigal_genes.fna	96	9	10
+dir/b_prodigal_genes.fna	dir/a_prodigal_genes.fna	97	9	10
+dir/b_prodigal_genes.fna	dir/c_prodigal_genes.fna	95.5	8	10
+dir/c_prodigal_genes.fna	dir/d_prodigal_genes.fna	81	4	10
+dir/e_prodigal_genes.fna	dir/e_prodigal_genes.fna	100	10	10
+"""
+
+
+def test_read_fastani(tmp_path):
+    """
+    :return: asserts that chunks are read into a symmetric matrix with the mean ANI of both directions.
+    """
+    fastani_output = tmp_path / "fastani_out"
+    fastani_output.write_text(FASTANI)
+    ani = read_fastani(str(fastani_output), chunk_size=2, fold_size=3)
+
+    assert sorted(ani.names) == ["a", "b", "c", "d", "e"]
+    assert len(ani) == 5 and ani.pairs == 3
+    assert (ani.matrix != ani.matrix.T).nnz == 0
+    assert ani.ani("dir/a_prodigal_genes.fna", "dir/b_prodigal_genes.fna") == 96.5
+    assert ani.ani("dir/d_prodigal_genes.fna", "dir/c_prodigal_genes.fna") == 81
+    assert ani.ani("dir/a_prodigal_genes.fna", "dir/e_prodigal_genes.fna") == 0
+    assert np.isnan(ani.to_frame().iloc[0, 4])
+
+
+def test_clusters(tmp_path):
+    """
+    :return: asserts that clusters join genomes through pairs over the ANI threshold.
+    """
+    fastani_output = tmp_path / "fastani_out"
+    fastani_output.write_text(FASTANI)
+    ani = read_fastani(str(fastani_output))
+
+    clusters = ani.clusters(min_ani=95)
+    assert clusters["a"] == clusters["b"] == clusters["c"]
+    assert len(set(clusters[["a", "d", "e"]])) == 3
+    assert ani.clusters(min_ani=80).nunique() == 2
+
+
+def test_clusters_either_direction(tmp_path):
+    """
+    :return: asserts that both clusterings join genomes over the threshold in one direction only.
+    """
+    fastani_output = tmp_path / "fastani_out"
+    fastani_output.write_text(
+        "a.fna\tb.fna\t96\t9\t10\nb.fna\ta.fna\t90\t9\t10\nb.fna\tc.fna\t91\t9\t10\n"
+    )
+    ani = read_fastani(str(fastani_output))
+    assert ani.ani("a.fna", "b.fna") == 93
+
+    clusters = ani.clusters(min_ani=95)
+    assert clusters["a"] == clusters["b"] != clusters["c"]
+    streamed = cluster_fastani(str(fastani_output), min_ani=95)["cluster"]
+    assert streamed["a"] == streamed["b"] != streamed["c"]
+
+
+def write_genes(directory, n=5):
+    """
+    :return: List of genes files. Genome i differs from genome 0 at about 2 * i% of its bases.
+    """
+    rng = random.Random(0)
+    base = "".join(rng.choice("ACGT") for _ in range(5000))
+    genes = []
+    for i in range(n):
+        seq = "".join(
+            c if rng.random() > 0.02 * i else rng.choice("ACGT") for c in base
+        )
+        genes.append(directory / f"genome_{i}_prodigal_genes.fna")
+        genes[-1].write_text(f">genome_{i}_1\n{seq}\n")
+
+    return genes
+
+
+def test_sharded_fastani(tmp_path, monkeypatch, shims):
+    """
+    :return: asserts that sharded FastANI runs merge into the output of a single run, and reruns skip done shards.
+    """
+    monkeypatch.setitem(
+        CONFIG["third_party"], "fastANI", os.path.join(shims, "fastANI")
+    )
+    genes = write_genes(tmp_path)
+
+    def dendrogram(name):
+        ani = ANIDendrogram(output_dir=str(tmp_path / name), fraglen=None)
+        ani.make_fastani_input([str(i) for i in genes])
+        return ani
+
+    single = dendrogram("single")
+    assert single.run()
+    sharded = dendrogram("sharded")
+    assert sharded.run(shards=3)
+    with open(single.fastani_output) as a, open(sharded.fastani_output) as b:
+        assert a.read() == b.read()
+
+    manifest_file = tmp_path / "sharded" / "shards" / "manifest.json"
+    manifest = json.loads(manifest_file.read_text())
+    assert [len(open(i["queries"]).read().split()) for i in manifest["shards"]] == [
+        2,
+        1,
+        2,
+    ]
+    assert all(i["done"] for i in manifest["shards"])
+
+    # An interrupted run: shard 1 is not done, and the other shards are not run again.
+    manifest["shards"][1]["done"] = False
+    manifest_file.write_text(json.dumps(manifest))
+    os.remove(manifest["shards"][1]["output"])
+    done_at = os.path.getmtime(manifest["shards"][0]["output"])
+    assert not sharded.merge_shards(manifest)
+    assert sharded.run(shards=3)
+    assert os.path.getmtime(manifest["shards"][0]["output"]) == done_at
+    with open(single.fastani_output) as a, open(sharded.fastani_output) as b:
+        assert a.read() == b.read()
+
+
+def test_shard_locks(tmp_path, monkeypatch, stand_ins):
+    """
+    :return: asserts that locks of crashed runs are taken over, and failed FastANI runs are not marked done.
+    """
+    # Exits with an error after writing part of its output.
+    failing = stand_ins(
+        "fastANI",
+        '#!/bin/sh\nprev=""\nfor a in "$@"; do\n'
+        '  if [ "$prev" = "-o" ]; then echo partial > "$a"; fi\n  prev="$a"\ndone\nexit 1\n',
+    )
+    monkeypatch.setitem(CONFIG["third_party"], "fastANI", str(failing))
+    ani = ANIDendrogram(output_dir=str(tmp_path / "ani"), fraglen=None)
+    ani.make_fastani_input([str(i) for i in write_genes(tmp_path, n=3)])
+    manifest = ani.plan_shards(2)
+
+    lock = manifest["shards"][0]["output"] + ".lock"
+    with open(lock, "w") as f:
+        json.dump({"host": "crashed", "pid": 1, "time": time.time() - 10 * 86400}, f)
+    assert not ani.run_shard(manifest, 0)
+    assert not os.path.exists(lock)
+    assert not [i for i in os.listdir(manifest["dir"]) if i.endswith(".tmp")]
+    assert not os.path.exists(manifest["shards"][0]["output"])
+
+    # A lock refreshed by a live run on another host is not taken over.
+    assert acquire_lock(lock)
+    with heartbeat(lock, interval=0.05):
+        with open(lock) as f:
+            acquired = json.load(f)["time"]
+        time.sleep(0.3)
+        with open(lock) as f:
+            assert json.load(f)["time"] > acquired
+        assert not acquire_lock(lock, stale_after=0.2)
+
+
+def test_cluster_fastani(tmp_path):
+    """
+    :return: asserts that streamed clusters match the clusters of the sparse matrix, across chunks.
+    """
+    fastani_output = tmp_path / "fastani_out"
+    fastani_output.write_text(FASTANI)
+    clusters = cluster_fastani(str(fastani_output), min_ani=95, chunk_size=2)
+
+    clusters = clusters.sort_index()
+    assert list(clusters.index) == ["a", "b", "c", "d", "e"]
+    assert list(clusters["cluster"][:3]) == [0, 0, 0]
+    assert sorted(clusters["cluster"][3:]) == [1, 2]
+    assert list(clusters["size"]) == [3, 3, 3, 1, 1]
+    assert set(clusters["representative"]) == {"b", "d", "e"}
+    sparse_clusters = read_fastani(str(fastani_output)).clusters(min_ani=95)
+    assert (
+        clusters["cluster"].groupby(sparse_clusters).nunique() == 1
+    ).all() and clusters["cluster"].nunique() == sparse_clusters.nunique()
+
+    # Pairs with a different ANI in each direction.
+    rng = random.Random(0)
+    lines = []
+    for i in range(60):
+        for j in range(i + 1, 60):
+            if rng.random() < 0.03:
+                lines += [f"g{i}.fna\tg{j}.fna\t{rng.choice([90, 97])}\t1\t1\n"]
+                lines += [f"g{j}.fna\tg{i}.fna\t{rng.choice([90, 97])}\t1\t1\n"]
+    fastani_output.write_text("".join(lines))
+    streamed = cluster_fastani(str(fastani_output), chunk_size=7)
+    expected = read_fastani(str(fastani_output)).clusters(min_ani=95)
+    streamed = streamed["cluster"][expected.index]
+    assert (streamed.groupby(expected).nunique() == 1).all()
+    assert streamed.nunique() == expected.nunique()
+
+
+def ani_block(labels, rng):
+    values = np.array([[rng.uniform(80, 99) for _ in labels] for _ in labels])
+    values = np.round((values + values.T) / 2, 2)
+    np.fill_diagonal(values, 99.99)
+    return pd.DataFrame(values, index=labels, columns=labels)
+
+
+def test_ani_matrix(tmp_path):
+    """
+    :return: asserts that the matrix grows as genomes are added, and reopens with its labels.
+    """
+    rng = random.Random(0)
+    prefix = str(tmp_path / "ani_matrix")
+    first = ani_block(["a", "b", "c"], rng)
+    matrix = ANIMatrix.create(prefix, capacity=2)
+    matrix.update(first)
+    assert matrix.capacity == 4 and len(matrix) == 3
+
+    second = ani_block(["c", "d", "e", "f"], rng)
+    matrix.update(second)
+    assert matrix.capacity == 8 and matrix.labels == ["a", "b", "c", "d", "e", "f"]
+
+    matrix = ANIMatrix(prefix, mode="r")
+    assert abs(matrix.ani("a", "b") - first.loc["a", "b"]) < 10 ** -3
+    assert abs(matrix.ani("f", "d") - second.loc["f", "d"]) < 10 ** -3
+    assert np.isnan(matrix.ani("a", "f"))
+    subset = matrix.subset(["e", "a", "c"])
+    assert list(subset.index) == ["e", "a", "c"]
+    assert abs(subset.loc["c", "e"] - second.loc["c", "e"]) < 10 ** -3
+
+
+def test_dendrogram_from_matrix(tmp_path):
+    """
+    :return: asserts that make_dendrogram plots the genomes of a key file from a stored matrix.
+    """
+    prefix = str(tmp_path / "ani_matrix")
+    ANIMatrix.create(prefix).update(ani_block(list("abcdef"), random.Random(0)))
+    dn = ANIDendrogram(output_dir=str(tmp_path))
+    dn.key_df = pd.DataFrame({"old_name": ["a", "c", "d"], "new_name": ["A", "C", "D"]})
+    dn.make_dendrogram(filter_rename=True, matrix=prefix)
+    assert os.path.isfile(dn.fig_output + ".png")
+
+
+def test_dendrogram_missing_pairs(tmp_path, capsys):
+    """
+    :return: asserts that genomes with missing pairs are dropped from a dendrogram of a stored matrix.
+    """
+    prefix = str(tmp_path / "ani_matrix")
+    matrix = ANIMatrix.create(prefix)
+    matrix.update(ani_block(list("abcd"), random.Random(0)))
+    matrix.update(ani_block(list("de"), random.Random(1)))
+    assert np.isnan(matrix.subset(["a", "e"]).loc["a", "e"])
+
+    dn = ANIDendrogram(output_dir=str(tmp_path))
+    dn.make_dendrogram(matrix=prefix)
+    assert os.path.isfile(dn.fig_output + ".png")
+    assert "Dropping 1 genome(s) with missing ANI pairs: e." in capsys.readouterr().out
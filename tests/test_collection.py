@@ -0,0 +1,115 @@
+import abacat
+import random
+from os import path
+
+"""
+Module for testing the GenomeCollection class.
+"""
+
+
+def write_genome(directory, name, n_genes=20, seed=0):
+    """
+    Writes a contigs file and a Prodigal-like genes file for a small synthetic genome.
+    """
+    rng = random.Random(seed)
+    contig = "".join(rng.choice("ACGT") for _ in range(n_genes * 400))
+    contigs = path.join(directory, name + ".fna")
+    with open(contigs, "w") as f:
+        f.write(f">{name}_contig\n{contig}\n")
+
+    with open(path.join(directory, name + "_prodigal_genes.fna"), "w") as f:
+        for i in range(n_genes):
+            start, stop, strand = i * 400 + 1, i * 400 + 300, (-1) ** i
+            partial = "10" if i == 0 else "00"
+            f.write(
+                f">{name}_contig_{i + 1} # {start} # {stop} # {strand} # "
+                f"ID=1_{i + 1};partial={partial};start_type=ATG;rbs_motif=AGGAG;"
+                f"rbs_spacer=5-10bp;gc_cont=0.{40 + i % 10}\n"
+                f"{contig[start - 1:stop]}\n"
+            )
+    with open(path.join(directory, name + "_megares.hits"), "w") as f:
+        f.write(f"{name}_contig_1 Bla|OXA-223|JN248564|1-825|825|betalactams\n")
+
+    return contigs
+
+
+def test_from_directory(tmp_path):
+    """
+    :return: asserts that a directory of contigs becomes a lazy collection.
+    """
+    for i in range(3):
+        write_genome(str(tmp_path), f"genome_{i}", seed=i)
+    collection = abacat.from_directory(str(tmp_path))
+
+    assert len(collection) == 3
+    assert not collection.genomes
+    assert type(collection["genome_0"]) is abacat.genome.Genome
+    assert list(collection.genomes) == ["genome_0"]
+
+
+def test_gene_table(tmp_path):
+    """
+    :return: asserts that the gene table holds the genes of all genomes.
+    """
+    contigs = [write_genome(str(tmp_path), f"genome_{i}", seed=i) for i in range(3)]
+    collection = abacat.GenomeCollection(contigs)
+    genes = collection.load_gene_table()
+
+    assert len(genes) == 60
+    assert genes["partial_left"].sum() == 3
+    assert genes["megares"].notna().sum() == 3
+    assert len(collection.filter(strand=-1, genome=["genome_0", "genome_1"])) == 20
+    assert len(collection.filter("gc_cont >= 0.45")) == 30
+    assert list(collection.summary()["genes"]) == [20, 20, 20]
+
+
+# Stand-in for blastn: every first gene of a contig hits the same reference, in tabular hits.
+BLASTN = """#!/usr/bin/env python
+import sys
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+queries = [i[1:].split()[0] for i in open(args["-query"]) if i.startswith(">")]
+with open(args["-out"], "w") as f:
+    for query in queries:
+        if query.endswith("_1"):
+            f.write(f"{query}\\tBla\\t99.0\\t300\\t3\\t0\\t1\\t300\\t1\\t300\\t1e-150\\t540\\tBla|OXA-223\\n")
+with open(args["-out"] + ".calls", "a") as f:
+    f.write("x\\n")
+"""
+
+
+def test_blast_seqs(tmp_path, stand_ins, database):
+    """
+    :return: asserts that one Blast run annotates every genome of the collection.
+    """
+    stand_ins("blastn", BLASTN)
+    database("megares")
+
+    genomes = tmp_path / "genomes"
+    genomes.mkdir()
+    for i in range(3):
+        write_genome(str(genomes), f"genome_{i}", seed=i)
+    collection = abacat.from_directory(str(genomes))
+    n_hits = collection.blast_seqs("megares")
+
+    assert n_hits == {"genome_0": 1, "genome_1": 1, "genome_2": 1}
+    assert len(list(genomes.glob("*.calls"))) == 1
+    with open(collection["genome_1"].files["megares"]["hits"]) as f:
+        assert f.read().startswith("genome_1_contig_1 Bla|OXA-223")
+
+
+def test_blast_seqs_dedup(tmp_path, stand_ins, database):
+    """
+    :return: asserts that genes shared by genomes are searched once and their hits go to every genome.
+    """
+    stand_ins("blastn", BLASTN)
+    database("megares")
+
+    genomes = tmp_path / "genomes"
+    genomes.mkdir()
+    contigs = [write_genome(str(genomes), f"genome_{i}", seed=0) for i in range(2)]
+    collection = abacat.GenomeCollection(contigs, name="dedup")
+    n_hits = collection.blast_seqs("megares")
+
+    assert n_hits == {"genome_0": 1, "genome_1": 1}
+    assert collection.stats["blast_megares"]["queries"] == 40
+    assert collection.stats["blast_megares"]["unique"] == 20
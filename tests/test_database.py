@@ -0,0 +1,70 @@
+import os
+import abacat
+from abacat.database import BlastDatabase, parse_info
+
+"""
+Module for testing the BLAST database manager.
+"""
+
+# Stand-in for makeblastdb: writes the three index files and counts its calls.
+MAKEBLASTDB = """#!/bin/sh
+while [ $# -gt 0 ]; do
+    case $1 in -out) out=$2;; -dbtype) type=$2;; esac
+    shift
+done
+ext=n; [ "$type" = prot ] && ext=p
+for i in hr in sq; do touch "$out.$ext$i"; done
+echo x >> "$out.calls"
+"""
+
+
+def calls(fasta):
+    return len(open(str(fasta) + ".calls").readlines())
+
+
+def test_update(tmp_path, stand_ins):
+    """
+    :return: asserts that a database is only built again when its FASTA changes.
+    """
+    stand_ins("makeblastdb", MAKEBLASTDB)
+    fasta = tmp_path / "db.fasta"
+    fasta.write_text(">a\nMKLVVAAGG\n")
+    db = BlastDatabase("test", path=str(fasta))
+
+    assert db.dbtype == "prot"
+    assert db.update()
+    assert not db.update()
+    os.utime(fasta)  # Touched, same contents
+    assert not db.update()
+    fasta.write_text(">a\nMKLVVAAGGW\n")
+    assert db.update()
+    assert calls(fasta) == 2
+    assert db.manifest()["dbtype"] == "prot"
+
+
+def test_update_databases(monkeypatch, tmp_path, stand_ins):
+    """
+    :return: asserts that only stale databases are built, and prebuilt ones are left alone.
+    """
+    stand_ins("makeblastdb", MAKEBLASTDB)
+    for name in ("a", "b"):
+        (tmp_path / f"{name}.fasta").write_text(">a\nACGTACGT\n")
+    for ext in ("nhr", "nin", "nsq"):
+        (tmp_path / f"prebuilt.fasta.{ext}").touch()
+    databases = dict((i, str(tmp_path / f"{i}.fasta")) for i in ("a", "b", "prebuilt"))
+    monkeypatch.setitem(abacat.CONFIG, "db", databases)
+
+    BlastDatabase("a").update()
+    built = abacat.update_databases(threads=2)
+
+    assert built == {"a": False, "b": True, "prebuilt": False}
+    assert calls(databases["a"]) == calls(databases["b"]) == 1
+
+
+def test_parse_info():
+    """
+    :return: asserts that blastdbcmd -info output is parsed.
+    """
+    info = "Database: megares_database_v1.01.fasta\n\t7,868 sequences; 8,554,090 total bases\n"
+
+    assert parse_info(info) == {"sequences": 7868, "letters": 8554090}
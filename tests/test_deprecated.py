@@ -0,0 +1,94 @@
+import abacat
+import gzip
+import pytest
+from os import path, listdir
+
+"""
+Module for testing the helper functions of the deprecated module.
+"""
+
+content = b">contig_1\nATGAAACCCGGGTTTTAA\n" * 1000
+
+
+def make_assembly_dir(directory, name="GCF_000000000.1_ASM0v1"):
+    directory.mkdir()
+    with gzip.open(directory / f"{name}_genomic.fna.gz", "wb") as f:
+        f.write(content)
+    (directory / "annotation_hashes.txt").write_text("")
+    return str(directory)
+
+
+def test_ls_and_decompress(tmp_path):
+    """
+    :return: asserts that .gz files are replaced by their decompressed content.
+    """
+    assembly_dir = make_assembly_dir(tmp_path / "assembly")
+    files = abacat.ls_and_decompress(assembly_dir, threads=2)
+    fna = path.join(assembly_dir, "GCF_000000000.1_ASM0v1_genomic.fna")
+
+    assert fna in files
+    assert not any(i.endswith((".gz", ".part")) for i in listdir(assembly_dir))
+    with open(fna, "rb") as f:
+        assert f.read() == content
+
+
+def test_ls_and_decompress_dirs(tmp_path):
+    """
+    :return: asserts that files of several directories are decompressed by one pool.
+    """
+    assembly_dirs = [make_assembly_dir(tmp_path / f"assembly_{i}") for i in range(3)]
+    decompressed = abacat.ls_and_decompress_dirs(assembly_dirs, threads=2)
+
+    assert sorted(decompressed) == sorted(assembly_dirs)
+    assert all(len(files) == 1 for files in decompressed.values())
+
+
+def test_ls_and_decompress_dirs_failure(tmp_path):
+    """
+    :return: asserts that a corrupt .gz only fails its own directory.
+    """
+    assembly_dirs = [make_assembly_dir(tmp_path / f"assembly_{i}") for i in range(3)]
+    with open(path.join(assembly_dirs[1], "corrupt.fna.gz"), "wb") as f:
+        f.write(b"not gzip")
+    decompressed = abacat.ls_and_decompress_dirs(assembly_dirs, threads=2)
+
+    assert isinstance(decompressed[assembly_dirs[1]], OSError)
+    assert (
+        len(decompressed[assembly_dirs[0]]) == len(decompressed[assembly_dirs[2]]) == 1
+    )
+
+
+report_header = """# Assembly name:  ASM0v1
+# Organism name:  Staphylococcus aureus (firmicutes)
+# Infraspecific name:  strain=CA15
+# Taxid:          1280
+# BioSample:      SAMN00000000
+# Assembly level: Complete Genome
+# GenBank assembly accession: GCA_000000000.1
+"""
+
+
+def test_aggregate_reports(tmp_path):
+    """
+    :return: asserts that reports are collected into columns and failures are kept.
+    """
+    reports = []
+    for i in range(4):
+        report = tmp_path / f"GCF_00000000{i}.1_ASM0v1_assembly_report.txt"
+        report.write_text(report_header)
+        reports.append(str(report))
+    reports.append(str(tmp_path / "missing_assembly_report.txt"))
+
+    df, failures = abacat.aggregate_reports(reports, threads=2)
+    assert len(df) == 4
+    assert list(df["Taxid"].unique()) == ["1280"]
+    assert list(failures["report"]) == [reports[-1]]
+
+    output_files = abacat.write_reports(
+        df, failures, str(tmp_path / "reports"), fmt=None
+    )
+    assert all(path.isfile(i) for i in output_files.values())
+
+    with pytest.raises(ValueError):
+        abacat.write_reports(df, failures, str(tmp_path / "invalid"), fmt="csv")
+    assert not [i for i in listdir(tmp_path) if i.startswith("invalid")]
@@ -0,0 +1,103 @@
+import random
+import abacat
+from abacat.config import CONFIG
+from abacat.duplicates import find_duplicates, fingerprint, output_suffixes
+
+"""
+Module for testing the detection of duplicate genomes.
+"""
+
+
+def reverse_complement(seq):
+    return seq[::-1].translate(str.maketrans("ACGT", "TGCA"))
+
+
+def write_genomes(directory):
+    """
+    :return: List of contigs files: a genome, an exact duplicate, a near duplicate and another genome.
+    """
+    rng = random.Random(0)
+    contigs = ["".join(rng.choice("ACGT") for _ in range(4000)) for _ in range(3)]
+    other = "".join(rng.choice("ACGT") for _ in range(8000))
+    genomes = {
+        "genome_a": [
+            ("contig_1", contigs[0]),
+            ("contig_2", contigs[1]),
+            ("contig_3", contigs[2]),
+        ],
+        # Renamed, reordered, reverse complemented and lower case contigs.
+        "genome_b": [
+            ("GCF_1", contigs[2].lower()),
+            ("GCF_2", reverse_complement(contigs[0])),
+            ("GCF_3", contigs[1]),
+        ],
+        # One more small contig.
+        "genome_c": [
+            ("contig_1", contigs[0]),
+            ("contig_2", contigs[1]),
+            ("contig_3", contigs[2]),
+        ]
+        + [("contig_4", other[:150])],
+        "genome_d": [("contig_1", other)],
+    }
+    files = []
+    for name, records in genomes.items():
+        files.append(str(directory / f"{name}.fna"))
+        with open(files[-1], "w") as f:
+            f.write("".join(f">{id_}\n{seq}\n" for id_, seq in records))
+
+    return files
+
+
+def test_find_duplicates(tmp_path):
+    """
+    :return: asserts that exact and near duplicates point to the first genome.
+    """
+    files = write_genomes(tmp_path)
+    assert fingerprint(files[0])[0] == fingerprint(files[1])[0]
+
+    duplicates = find_duplicates(files)
+    assert list(duplicates["kind"]) == ["unique", "exact", "near", "unique"]
+    assert list(duplicates["representative"]) == [
+        "genome_a",
+        "genome_a",
+        "genome_a",
+        "genome_d",
+    ]
+    assert duplicates.loc["genome_b", "jaccard"] == 1
+    assert 0.95 <= duplicates.loc["genome_c", "jaccard"] < 1
+    assert list(find_duplicates(files, min_jaccard=None)["kind"]) == [
+        "unique",
+        "exact",
+        "unique",
+        "unique",
+    ]
+
+
+def test_skip_duplicates(tmp_path, monkeypatch, shims):
+    """
+    :return: asserts that Prodigal only runs on representatives, and duplicates get their outputs.
+    """
+    monkeypatch.setitem(CONFIG, "cache_dir", str(tmp_path / "cache"))
+    files = write_genomes(tmp_path)
+    collection = abacat.GenomeCollection(files)
+    outputs = collection.run_prodigal(skip_duplicates=True)
+
+    assert collection.stats["duplicates"] == {"genomes": 4, "exact": 1, "near": 1}
+    assert collection.stats["prodigal"]["copied"] == 2
+    assert sorted(outputs) == ["genome_a", "genome_b", "genome_c", "genome_d"]
+    with open(outputs["genome_a"]["genes"]) as a, open(
+        outputs["genome_b"]["genes"]
+    ) as b:
+        assert a.read() == b.read()
+    assert len(collection["genome_c"].geneset["prodigal"]["records"])
+
+
+def test_output_suffixes():
+    """
+    :return: asserts that the MEGARes summary is copied along with the MEGARes hits only.
+    """
+    assert "_megares_summary.tsv" in output_suffixes(dbs=["megares"])
+    assert "_megares_summary.tsv" in output_suffixes()
+    assert "_megares_summary.tsv" not in output_suffixes(dbs=["COG"])
+    assert len(output_suffixes(dbs=())) == 4
@@ -153,3 +153,41 @@ def test_from_json():
     """
     h = abacat.from_json(path.join(g.directory, g.name + ".json"))
     assert type(h) is abacat.genome.Genome
+
+
+def test_parse_alignments(tmp_path, capsys):
+    """
+    :return: asserts that tabular hits are streamed to annotation files without touching the Prodigal records.
+    """
+    genes = tmp_path / "genome_prodigal_genes.fna"
+    genes.write_text(
+        "".join(f">contig_{i} # 1 # 9 # 1 # ID=1_{i}\nATGAAATAA\n" for i in range(1, 4))
+    )
+    alignments = tmp_path / "genome_phenotyping_blast.tsv"
+    alignments.write_text(
+        "".join(
+            f"contig_{i}\tref_a\t100.0\t9\t0\t0\t1\t9\t1\t9\t1e-5\t18.0\tref_a\n"
+            for i in (1, 3)
+        )
+    )
+    genome = abacat.Genome(name="genome", directory=str(tmp_path))
+    genome.files = {
+        "prodigal": {"genes": str(genes)},
+        "phenotyping": {"alignments": str(alignments)},
+    }
+    genome.load_geneset()
+    genome.parse_alignments("phenotyping")
+
+    assert capsys.readouterr().out == ""
+    assert [i.description for i in genome.geneset["phenotyping"]["records"]] == [
+        "contig_1 ref_a",
+        "contig_3 ref_a",
+    ]
+    assert genome.geneset["prodigal"]["records"]["contig_1"].description.endswith(
+        "ID=1_1"
+    )
+    assert genome.geneset["phenotyping"]["origin"] == str(
+        tmp_path / "genome_phenotyping.fasta"
+    )
+    with open(genome.files["phenotyping"]["hits"]) as f:
+        assert f.read() == "contig_1 ref_a\ncontig_3 ref_a\n"
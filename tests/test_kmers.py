@@ -0,0 +1,85 @@
+import abacat
+import random
+import pytest
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from abacat.kmers import canonical_kmers, load_index
+from tests.test_collection import write_genome
+
+"""
+Module for testing the k-mer index used to prescreen genes.
+"""
+
+rng = random.Random(0)
+references = ["".join(rng.choice("ACGT") for _ in range(900)) for _ in range(5)]
+
+
+def test_canonical_kmers():
+    """
+    :return: asserts that a sequence and its reverse complement have the same k-mers.
+    """
+    seq = references[0]
+    rc = str(Seq(seq).reverse_complement())
+    assert sorted(canonical_kmers(seq)) == sorted(canonical_kmers(rc))
+    assert len(canonical_kmers(seq[:100] + "N" + seq[100:200], k=21)) == 160
+
+
+def test_kmer_index(tmp_path):
+    """
+    :return: asserts that only genes sharing k-mers with a reference are candidates.
+    """
+    index = abacat.KmerIndex()
+    index.build((f"ref_{i}", seq) for i, seq in enumerate(references))
+    index.save(str(tmp_path / "index"))
+    index = abacat.KmerIndex()
+    index.load(str(tmp_path / "index"))
+
+    genes = [
+        SeqRecord(Seq(references[2][100:700]).reverse_complement(), id="resistance"),
+        SeqRecord(Seq("".join(rng.choice("ACGT") for _ in range(600))), id="random"),
+    ]
+    candidates = index.screen(genes)
+
+    assert list(candidates) == ["resistance"]
+    assert candidates["resistance"][:2] == ("ref_2", 580)
+
+
+def test_prescreen_protein_db(monkeypatch, tmp_path, shims, database):
+    """
+    :return: asserts that protein databases are not k-mer indexed, and prescreens search all genes instead.
+    """
+    monkeypatch.setenv("ABACAT_SHIM_HIT_RATE", "1")
+    database("phenotyping", ">arabinose.Ribulokinase.1\nMKLVWWYQRHE\n")
+
+    with pytest.raises(ValueError):
+        load_index("phenotyping")
+    write_genome(str(tmp_path), "genome_0")
+    genome = abacat.from_directory(str(tmp_path))["genome_0"]
+    report = genome.blast_seqs("phenotyping", blast="p", prescreen=True)
+    assert report["hits"] == 20 and "candidates" not in genome.files["phenotyping"]
+
+
+def test_prescreen_report(tmp_path, database):
+    """
+    :return: asserts that a prescreen without a search reports the same keys as a search.
+    """
+    contigs = write_genome(str(tmp_path), "genome_0")
+    with open(contigs) as f:
+        contig = f.read().split()[1]
+    database("megares", f">Bla|OXA-223\n{contig[:300]}\n")
+
+    genome = abacat.from_directory(str(tmp_path))["genome_0"]
+    report = genome.blast_seqs("megares", prescreen="only")
+    assert report == {
+        "queries": 1,
+        "unique": 1,
+        "dedup_ratio": 1.0,
+        "screened": 20,
+        "candidates": 1,
+        "hits": 1,
+    }
+
+    # No gene passes: the report tells 0 of 20 genes from 0 genes.
+    database("COG", ">poly_a\n" + "A" * 300 + "\n")
+    report = genome.blast_seqs("COG", prescreen=True)
+    assert report["screened"] == 20 and report["candidates"] == report["hits"] == 0
@@ -0,0 +1,33 @@
+import os
+import sys
+import json
+import subprocess
+
+"""
+Module for testing the load test of benchmarks/loadtest.py.
+"""
+
+LOADTEST = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "benchmarks",
+    "loadtest.py",
+)
+
+
+def test_relative_work_dir(tmp_path):
+    """
+    :return: asserts that every pipeline runs with the default work dir, relative to where it is run.
+    """
+    subprocess.run(
+        [sys.executable, LOADTEST, "-n", "2", "--genes", "10", "-o", "results.json"],
+        cwd=str(tmp_path),
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    with open(tmp_path / "results.json") as f:
+        results = json.load(f)
+
+    pipelines = results["steps"][0]["pipelines"]
+    assert sorted(pipelines) == ["annotate", "dendrogram", "phenotyping", "prodigal"]
+    assert [i for i in pipelines if "error" in pipelines[i]] == []
+    assert os.path.isdir(tmp_path / "abacat_loadtest" / "genomes")
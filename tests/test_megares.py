@@ -0,0 +1,88 @@
+import abacat
+import pandas as pd
+from abacat import megares
+from os import path
+from tests.test_collection import write_genome
+
+"""
+Module for testing the MEGARes annotation of hits.
+"""
+
+HEADER = "Bla|OXA-223|JN248564|1-825|825|betalactams|Class_D_betalactamases|OXA"
+
+
+def use_cache(monkeypatch, tmp_path):
+    monkeypatch.setitem(abacat.CONFIG, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(megares, "_index", None)
+
+
+def test_annotate_hits(monkeypatch, tmp_path):
+    """
+    :return: asserts that hits get their class, mechanism and group, and that the index is cached.
+    """
+    use_cache(monkeypatch, tmp_path)
+    hits = pd.DataFrame({"hit": [HEADER, "Foo|x|y|1-2|2|cls|mech_a|grp"]})
+    hits = megares.annotate_hits(hits)
+
+    assert list(hits["class"]) == ["betalactams", "cls"]
+    assert megares.annotate_hits(hits[1:][["hit"]])["group"].tolist() == ["grp"]
+    assert hits["mechanism"][0] == "Class D betalactamases"
+    assert path.isfile(
+        path.join(abacat.CONFIG["cache_dir"], "megares", "annotation_index.pkl")
+    )
+
+
+def test_source_headers(monkeypatch, tmp_path):
+    """
+    :return: asserts that source headers with spaces are kept whole, and NCBI lists are split.
+    """
+    use_cache(monkeypatch, tmp_path)
+    hits = pd.DataFrame(
+        {
+            "hit": [
+                "@phgb|JN248564|0-825|ARO:3001669|OXA-223 [Acinetobacter baumannii]",
+                "AEL88491.1 JN248564.1:1-825",
+                "gi|941350200|gb|KT345946.1|25800-26600",
+            ]
+        }
+    )
+    hits = megares.annotate_hits(hits)
+
+    assert list(hits["header"][:2]) == [HEADER, HEADER]
+    assert hits["group"][2] == "VIM"
+
+
+def test_resistance_matrix(monkeypatch, tmp_path):
+    """
+    :return: asserts that hits of many genomes roll up into a genome by class matrix.
+    """
+    use_cache(monkeypatch, tmp_path)
+    for i in range(3):
+        with open(tmp_path / f"genome_{i}.fna", "w") as f:
+            f.write(f">genome_{i}_contig\nACGT\n")
+        with open(tmp_path / f"genome_{i}_megares.hits", "w") as f:
+            for j in range(i + 1):
+                f.write(f"genome_{i}_contig_{j + 1} {HEADER}\n")
+    collection = abacat.from_directory(str(tmp_path))
+    matrix = abacat.resistance_matrix(collection)
+
+    assert list(matrix["betalactams"]) == [1, 2, 3]
+
+
+def test_genome_resistance_summary(monkeypatch, tmp_path):
+    """
+    :return: asserts that the summary of a genome is written when asked for, next to its hits.
+    """
+    use_cache(monkeypatch, tmp_path)
+    write_genome(str(tmp_path), "genome_0")
+    genome = abacat.from_directory(str(tmp_path))["genome_0"]
+    hits = tmp_path / "genome_0_megares.hits"
+    hits.write_text(f"genome_0_contig_1 {HEADER}\n")
+    genome.files["megares"] = {"hits": str(hits)}
+
+    summary = genome.resistance_summary()
+    assert list(summary["class"]) == ["betalactams"]
+    assert genome.files["megares"]["summary"] == str(
+        tmp_path / "genome_0_megares_summary.tsv"
+    )
+    assert path.isfile(genome.files["megares"]["summary"])
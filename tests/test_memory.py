@@ -0,0 +1,68 @@
+import pickle
+import abacat
+from abacat.config import CONFIG
+from abacat.memory import budget, records_size
+
+"""
+Module for testing the memory budget of gene and protein sets.
+"""
+
+
+def genes_file(directory, name, n=20):
+    file = directory / f"{name}_prodigal_genes.fna"
+    file.write_text(
+        "".join(
+            f">{name}_{i + 1} # 1 # 300 # 1 # ID=1_{i + 1}\n{'ATG' * 100}\n"
+            for i in range(n)
+        )
+    )
+    return str(file)
+
+
+def load_genomes(directory, n=4):
+    genomes = []
+    for i in range(n):
+        genome = abacat.Genome(name=f"genome_{i}")
+        genome.files["prodigal"] = {"genes": genes_file(directory, genome.name)}
+        genome.load_geneset()
+        genomes.append(genome)
+    return genomes
+
+
+def test_memory_budget(tmp_path, monkeypatch):
+    """
+    :return: asserts that least recently used sets are evicted past the budget, and reload on access.
+    """
+    monkeypatch.setitem(CONFIG["memory"], "budget", None)
+    budget.reset_stats()
+    genomes = load_genomes(tmp_path)
+    size = records_size(genomes[0].geneset["prodigal"]["records"])
+    assert abacat.memory_stats()["resident_bytes"] >= 4 * size
+
+    monkeypatch.setitem(CONFIG["memory"], "budget", 2 * size)
+    genomes[0].geneset["prodigal"]["records"]  # Most recently used
+    budget.enforce()
+    stats = abacat.memory_stats()
+    assert stats["evictions"] == 2 and stats["resident_bytes"] <= 2 * size
+    assert genomes[1].geneset["prodigal"].evicted
+    assert not genomes[0].geneset["prodigal"].evicted
+
+    records = genomes[1].geneset["prodigal"]["records"]
+    assert len(records) == 20 and str(records["genome_1_3"].seq) == "ATG" * 100
+    stats = abacat.memory_stats()
+    assert stats["reloads"] == 1 and stats["resident_bytes"] <= 2 * size
+    budget.reset_stats()
+
+
+def test_pickle_evicted_set(tmp_path, monkeypatch):
+    """
+    :return: asserts that pickled Genomes read their evicted sets again on first access.
+    """
+    monkeypatch.setitem(CONFIG["memory"], "budget", None)
+    genome = load_genomes(tmp_path, n=1)[0]
+    genome.geneset["prodigal"].evict()
+
+    copy = pickle.loads(pickle.dumps(genome))
+    assert copy.geneset["prodigal"].evicted and "records" in copy.geneset["prodigal"]
+    assert list(copy.geneset["prodigal"]["records"])[0] == "genome_0_1"
+    budget.reset_stats()
@@ -0,0 +1,76 @@
+import abacat
+import random
+from abacat.shared import SharedSeqSet
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from tests.test_collection import write_genome
+
+"""
+Module for testing protein clustering into gene families.
+"""
+
+rng = random.Random(0)
+families = [
+    "".join(
+        rng.choice(abacat.pangenome.AMINO_ACIDS) for _ in range(rng.randint(150, 400))
+    )
+    for _ in range(30)
+]
+
+
+def mutate(seq, rate=0.05):
+    return "".join(
+        rng.choice(abacat.pangenome.AMINO_ACIDS) if rng.random() < rate else aa
+        for aa in seq
+    )
+
+
+def test_protein_clusters():
+    """
+    :return: asserts that mutated copies of the same protein end up in the same family.
+    """
+    clusters = abacat.ProteinClusters()
+    for genome in range(4):
+        # Each genome lacks one family, so every family is found in 3 or 4 genomes.
+        records = [
+            SeqRecord(Seq(mutate(seq) + "*"), id=f"genome_{genome}_{ix}")
+            for ix, seq in enumerate(families)
+            if ix % 4 != genome
+        ]
+        clusters.add(f"genome_{genome}", records)
+
+    df = clusters.cluster()
+    assert df["family"].nunique() == len(families)
+    assert (
+        df.groupby("family")["protein"].agg(
+            lambda x: len({i.rsplit("_", 1)[1] for i in x})
+        )
+        == 1
+    ).all()
+
+    matrix = clusters.matrix()
+    assert matrix.shape == (4, len(families))
+    assert set(matrix.sum(axis=0)) == {3}
+
+
+def test_add_collection_shared(tmp_path):
+    """
+    :return: asserts that the proteins of a genome with a shared protein set are added.
+    """
+    genome = abacat.Genome(write_genome(str(tmp_path), "genome_0"))
+    records = [
+        SeqRecord(
+            Seq(seq + "*"),
+            id=f"genome_0_contig_{ix + 1}",
+            description=f"genome_0_contig_{ix + 1} # {ix * 1000 + 1} # {ix * 1000 + 3 * len(seq) + 3} "
+            f"# 1 # ID=1_{ix + 1};partial=00;start_type=ATG;gc_cont=0.500",
+        )
+        for ix, seq in enumerate(families)
+    ]
+    with SharedSeqSet.from_records(records) as proteins:
+        genome.protset["prodigal"] = {"records": proteins}
+        clusters = abacat.ProteinClusters()
+        clusters.add_collection(abacat.GenomeCollection([genome]))
+
+    assert len(clusters) == len(families)
+    assert set(clusters.genomes) == {"genome_0"}
@@ -0,0 +1,69 @@
+import abacat
+from abacat.config import pathways
+from abacat.phenotypes import pathway_completeness, pathway_incidence
+
+"""
+Module for testing the pathway completeness of many genomes.
+"""
+
+PATHWAYS = {
+    "pathway_a": ["gene_1", "gene_2", "gene_3", "gene_4"],
+    "pathway_b": ["gene_4", "gene_5"],
+}
+
+
+def test_pathway_incidence():
+    """
+    :return: asserts that shared genes are one column, in every pathway they belong to.
+    """
+    incidence, names, genes = pathway_incidence(PATHWAYS)
+    assert names == ["pathway_a", "pathway_b"] and len(genes) == 5
+    assert incidence[:, genes.index("gene_4")].sum() == 2
+    incidence, names, genes = pathway_incidence(pathways)
+    assert incidence.shape == (len(pathways), len(genes))
+
+
+def test_pathway_completeness():
+    """
+    :return: asserts the fraction of genes found, counting genes with several hits once.
+    """
+    genomes = ["g1", "g1", "g1", "g2", "g2"]
+    hits = [
+        "a.gene_1.1",
+        "a.gene_1.2",
+        "b.gene_4.1",
+        "b.gene_5.3",
+        "c.not_in_a_pathway.1",
+    ]
+    table = pathway_completeness(
+        genomes, hits, PATHWAYS, all_genomes=["g1", "g2", "g3"]
+    )
+    assert list(table.index) == ["g1", "g2", "g3"]
+    assert table.loc["g1"].tolist() == [0.5, 0.5]
+    assert table.loc["g2"].tolist() == [0.0, 0.5]
+    assert table.loc["g3"].tolist() == [0.0, 0.0]
+    counts = pathway_completeness(genomes, hits, PATHWAYS, fraction=False)
+    assert counts.loc["g1", "pathway_a"] == 2
+
+
+def test_collection_pathways(tmp_path):
+    """
+    :return: asserts that the collection reads the phenotyping hits of its genomes into the table.
+    """
+    pathway, genes = next(iter(pathways.items()))
+    files = []
+    for name, found in (("genome_1", genes), ("genome_2", genes[:1]), ("genome_3", [])):
+        files.append(str(tmp_path / f"{name}.fna"))
+        with open(tmp_path / f"{name}_prodigal_genes.fna", "w") as f:
+            for ix in range(len(genes)):
+                f.write(f">contig_1_{ix + 1} # 1 # 9 # 1 # ID=1_{ix + 1}\nATGAAATAA\n")
+        with open(tmp_path / f"{name}_phenotyping.hits", "w") as f:
+            for ix, gene in enumerate(found):
+                f.write(f"contig_1_{ix + 1} {pathway}.{gene}.1\n")
+
+    collection = abacat.GenomeCollection(files)
+    table = collection.pathway_completeness()
+    assert table.shape == (3, len(pathways))
+    assert table.loc["genome_1", pathway] == 1
+    assert table.loc["genome_2", pathway] == 1 / len(genes)
+    assert table.loc["genome_3"].sum() == 0
@@ -0,0 +1,144 @@
+import os
+import random
+import abacat
+from abacat.config import CONFIG
+from abacat.prodigal import (
+    parse_cds,
+    parse_scores,
+    low_confidence,
+    training_file,
+    train,
+)
+
+"""
+Module for testing the parsers of the Prodigal GenBank and start scores outputs.
+"""
+
+CDS = """DEFINITION  seqnum=1;seqlen=3000;seqhdr="contig_1 Staphylococcus aureus";version=Prodigal.v2.6.3;run_type=Single;model="Ab initio";gc_cont=32.87;transl_table=11;uses_sd=1
+FEATURES             Location/Qualifiers
+     CDS             <2..400
+                     /note="ID=1_1;partial=10;start_type=Edge;rbs_motif=None;rbs_spacer=None;gc_cont=0.301;conf=62.10;score=2.15;cscore=1.02;sscore=1.13;rscore=0.00;uscore=0.00;tscore=0.00;"
+     CDS             complement(517..1878)
+                     /note="ID=1_2;partial=00;start_type=ATG;rbs_motif=AGGAG;rbs_spacer=5-10bp;gc_cont=0.331;conf=99.99;score=170.32;cscore=153.98;sscore=16.34;rscore=10.65;uscore=1.86;tscore=3.83;"
+//
+DEFINITION  seqnum=2;seqlen=900;seqhdr="contig_2";version=Prodigal.v2.6.3;run_type=Single;model="Ab initio";gc_cont=32.87;transl_table=11;uses_sd=1
+FEATURES             Location/Qualifiers
+     CDS             complement(10..>899)
+                     /note="ID=2_1;partial=01;start_type=GTG;rbs_motif=GGA/GAG/AGG;rbs_spacer=11-12bp;gc_cont=0.287;conf=95.40;score=13.18;cscore=10.02;sscore=3.16;rscore=1.09;uscore=-0.34;tscore=2.41;"
+//
+"""
+
+SCORES = """# Sequence Data: seqnum=1;seqlen=3000;seqhdr="contig_1 Staphylococcus aureus"
+# Run Data: version=Prodigal.v2.6.3;run_type=Single;model="Ab initio";gc_cont=32.87;transl_table=11;uses_sd=1
+Beg	End	Std	Total	CodPot	StrtSc	Codon	RBSMot	Spacer	RBSScr	UpsScr	TypeScr	GCCont
+2	400	+	2.15	1.02	1.13	Edge	None	None	0.00	0.00	0.00	0.301
+517	1878	-	170.32	153.98	16.34	ATG	AGGAG	5-10bp	10.65	1.86	3.83	0.331
+517	1845	-	120.10	140.22	-20.12	TTG	None	None	-5.21	-0.40	-14.51	0.330
+
+# Sequence Data: seqnum=2;seqlen=900;seqhdr="contig_2"
+# Run Data: version=Prodigal.v2.6.3;run_type=Single;model="Ab initio";gc_cont=32.87;transl_table=11;uses_sd=1
+Beg	End	Std	Total	CodPot	StrtSc	Codon	RBSMot	Spacer	RBSScr	UpsScr	TypeScr	GCCont
+10	899	-	13.18	10.02	3.16	GTG	GGA/GAG/AGG	11-12bp	1.09	-0.34	2.41	0.287
+"""
+
+
+def test_parse_cds(tmp_path):
+    """
+    :return: asserts that CDS features are read with the gene ids of the genes file.
+    """
+    cds_file = tmp_path / "genome_prodigal_cds.gbk"
+    cds_file.write_text(CDS)
+    cds = parse_cds(str(cds_file))
+
+    assert list(cds.index) == ["contig_1_1", "contig_1_2", "contig_2_1"]
+    assert list(cds["contig"]) == ["contig_1", "contig_1", "contig_2"]
+    assert list(cds["start"]) == [2, 517, 10] and list(cds["stop"]) == [400, 1878, 899]
+    assert list(cds["strand"]) == [1, -1, -1]
+    assert list(cds["partial_left"]) == [True, False, False]
+    assert list(cds["partial_right"]) == [False, False, True]
+    assert cds.loc["contig_2_1", "rbs_motif"] == "GGA/GAG/AGG"
+    assert abs(cds.loc["contig_1_2", "cscore"] - 153.98) < 10 ** -3
+    assert list(cds.index[low_confidence(cds)]) == ["contig_1_1"]
+    assert list(cds.index[low_confidence(cds, partial=True)]) == [
+        "contig_1_1",
+        "contig_2_1",
+    ]
+
+
+def test_parse_scores(tmp_path):
+    """
+    :return: asserts that all candidate starts are read, also across chunks.
+    """
+    scores_file = tmp_path / "genome_prodigal_scores.txt"
+    scores_file.write_text(SCORES)
+    scores = parse_scores(str(scores_file), chunk_size=2)
+
+    assert len(scores) == 4
+    assert list(scores["contig"]) == ["contig_1", "contig_1", "contig_1", "contig_2"]
+    assert list(scores["strand"]) == [1, -1, -1, -1]
+    assert list(scores["start_type"]) == ["Edge", "ATG", "TTG", "GTG"]
+    assert scores["sscore"].idxmax() == 1
+
+
+def test_genome_low_confidence(tmp_path):
+    """
+    :return: asserts that Genome reads its Prodigal tables and finds low confidence genes.
+    """
+    (tmp_path / "genome_prodigal_cds.gbk").write_text(CDS)
+    (tmp_path / "genome_prodigal_scores.txt").write_text(SCORES)
+    (tmp_path / "genome_prodigal_genes.fna").write_text(">contig_1_1\nATG\n")
+    genome = abacat.Genome(name="genome", directory=str(tmp_path))
+    genome.load_prodigal(load_geneset=False, load_protset=False)
+
+    assert list(genome.low_confidence(min_conf=96)) == ["contig_1_1", "contig_2_1"]
+    genome.load_prodigal_tables()
+    assert len(genome.geneset["prodigal"]["scores"]) == 4
+
+
+def test_training_cache(tmp_path, monkeypatch, shims):
+    """
+    :return: asserts that genomes with the same training key train Prodigal once.
+    """
+    monkeypatch.setitem(CONFIG, "cache_dir", str(tmp_path / "cache"))
+    rng = random.Random(0)
+    contigs = []
+    for i in range(3):
+        contigs.append(tmp_path / f"genome_{i}.fna")
+        contigs[-1].write_text(
+            f">contig_{i}\n" + "".join(rng.choice("ACGT") for _ in range(3000)) + "\n"
+        )
+
+    collection = abacat.GenomeCollection([str(i) for i in contigs])
+    collection.run_prodigal(
+        training={"genome_0": "a", "genome_1": "a", "genome_2": "b"}
+    )
+    assert collection.stats["prodigal"] == {
+        "genomes": 3,
+        "training_keys": 2,
+        "training_hits": 1,
+        "training_misses": 2,
+        "copied": 0,
+    }
+    assert os.path.isfile(training_file("a")) and os.path.isfile(training_file("b"))
+    assert os.path.isfile(collection["genome_1"].files["prodigal"]["genes"])
+
+    collection.run_prodigal(training="a")
+    assert collection.stats["prodigal"]["training_hits"] == 3
+
+
+def test_training_failure(tmp_path, monkeypatch, stand_ins):
+    """
+    :return: asserts that a failed training run is not cached, even if it wrote part of its file.
+    """
+    monkeypatch.setitem(CONFIG, "cache_dir", str(tmp_path / "cache"))
+    # Writes the training file of -t, then exits with an error.
+    stand_ins(
+        "prodigal",
+        '#!/bin/sh\nprev=""\nfor a in "$@"; do\n'
+        '  if [ "$prev" = "-t" ]; then echo partial > "$a"; fi\n  prev="$a"\ndone\nexit 1\n',
+    )
+    contigs = tmp_path / "genome with spaces.fna"
+    contigs.write_text(">contig\nACGT\n")
+
+    assert train(str(contigs), "a") is None
+    assert os.listdir(os.path.dirname(training_file("a"))) == []
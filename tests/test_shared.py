@@ -0,0 +1,89 @@
+import os
+import copy
+import pickle
+import abacat
+from abacat.shared import SharedSeqSet
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+"""
+Module for testing gene sets in shared memory.
+"""
+
+
+def prodigal_records(n=10):
+    return [
+        SeqRecord(
+            Seq("ATG" * (i + 1)),
+            id=f"contig_{i + 1}",
+            description=f"contig_{i + 1} # {i * 100 + 1} # {i * 100 + 3 * (i + 1)} # 1 # "
+            f"ID=1_{i + 1};partial=0{i % 2};start_type=ATG;gc_cont=0.333",
+        )
+        for i in range(n)
+    ]
+
+
+def test_shared_seq_set():
+    """
+    :return: asserts that records and the Prodigal table read back from another view of the block.
+    """
+    with SharedSeqSet.from_records(prodigal_records()) as genes:
+        name = genes.shm.name
+        view = pickle.loads(pickle.dumps(genes))
+        assert view.shm.name == name and not view.owner
+        assert str(view["contig_3"].seq) == "ATGATGATG"
+        assert view.to_frame()["partial_right"].sum() == 5
+        view.close()
+
+    assert genes.closed
+    assert not os.path.exists(os.path.join("/dev/shm", name.lstrip("/")))
+
+
+def test_genome_pickle(tmp_path):
+    """
+    :return: asserts that a shared Genome pickles as handles and keeps its gene set.
+    """
+    genome = abacat.Genome(name="genome", directory=str(tmp_path))
+    genome.geneset["prodigal"] = {
+        "records": dict((i.id, i) for i in prodigal_records(1000)),
+        "origin": str(tmp_path / "genome_prodigal_genes.fna"),
+    }
+    with abacat.shared([genome]):
+        state = pickle.dumps(genome)
+        assert len(state) < 1000
+        copy = pickle.loads(state)
+        assert len(copy.geneset["prodigal"]["records"]) == 1000
+        copy.geneset["prodigal"]["records"].close()
+
+    assert type(genome.geneset["prodigal"]["records"]) is dict
+
+
+def test_genome_pickle_records(tmp_path):
+    """
+    :return: asserts that sets without an origin file keep their records in pickles, and deep copies
+             keep in-memory edits.
+    """
+    genome = abacat.Genome(name="genome", directory=str(tmp_path))
+    genome.geneset["phenotyping"] = {
+        "records": prodigal_records(3),
+        "origin": "Search of genes.fna to phenotyping.fasta.",
+    }
+    unpickled = pickle.loads(pickle.dumps(genome))
+    assert [i.id for i in unpickled.geneset["phenotyping"]["records"]] == [
+        "contig_1",
+        "contig_2",
+        "contig_3",
+    ]
+
+    genes = tmp_path / "genome_prodigal_genes.fna"
+    genes.write_text(">contig_1\nATG\n")
+    genome.geneset["prodigal"] = {
+        "records": dict((i.id, i) for i in prodigal_records(2)),
+        "origin": str(genes),
+    }
+    deep = copy.deepcopy(genome)
+    assert len(deep.geneset["prodigal"]["records"]) == 2
+    assert (
+        deep.geneset["phenotyping"]["records"]
+        is not genome.geneset["phenotyping"]["records"]
+    )
@@ -0,0 +1,80 @@
+import os
+import random
+import numpy as np
+from abacat.config import CONFIG
+from abacat.sketch import SketchIndex, genome_sketch, mash_ani
+
+"""
+Module for testing the MinHash sketch index of genomes.
+"""
+
+
+def mutate(seq, rate, rng):
+    return "".join(rng.choice("ACGT") if rng.random() < rate else c for c in seq)
+
+
+def write_genomes(directory, n=6, length=20000):
+    """
+    :return: List of genome files. Genome i differs from genome 0 at about 2 * i% of its bases.
+    """
+    rng = random.Random(0)
+    base = "".join(rng.choice("ACGT") for _ in range(length))
+    files = []
+    for i in range(n):
+        seq = mutate(base, 0.02 * i, rng)
+        files.append(str(directory / f"genome_{i}.fna"))
+        with open(files[-1], "w") as f:
+            f.write(
+                f">contig_1\n{seq[: length // 2]}\n>contig_2\n{seq[length // 2 :]}\n"
+            )
+
+    return files
+
+
+def test_sketch(tmp_path):
+    """
+    :return: asserts that sketches are the sorted smallest hashes, and the ANI estimate of its bounds.
+    """
+    files = write_genomes(tmp_path, n=2)
+    sketch = genome_sketch(files[0], size=500)
+    assert len(sketch) == 500 and (np.diff(sketch.astype(float)) > 0).all()
+    assert mash_ani(1.0) == 100 and mash_ani(0.0) == 0
+
+
+def test_sketch_index(tmp_path):
+    """
+    :return: asserts that queries return the closest references first, also from a saved index.
+    """
+    files = write_genomes(tmp_path)
+    index = SketchIndex.build(files[:4])
+    index.add(files[2:])
+    assert len(index) == 6 and index.names[-1] == "genome_5"
+
+    # Genomes differ from genome 0, so genome 0 is the next closest to any of them.
+    seq = "".join(open(files[3]).read().split()[1::2])
+    query = tmp_path / "query.fna"
+    query.write_text(f">query\n{mutate(seq, 0.002, random.Random(1))}\n")
+    closest = index.query(str(query), top_k=3)
+    assert list(closest.index[:2]) == ["genome_3", "genome_0"]
+    assert closest["ani"].iloc[0] > 99 and closest["ani"].is_monotonic_decreasing
+
+    index.save(str(tmp_path / "index" / "sketches"))
+    loaded = SketchIndex.load(str(tmp_path / "index" / "sketches"))
+    assert loaded.query(str(query), top_k=3).equals(closest)
+
+
+def test_place(tmp_path, monkeypatch, shims):
+    """
+    :return: asserts that fastANI only runs against the top references of the query.
+    """
+    monkeypatch.setitem(
+        CONFIG["third_party"], "fastANI", os.path.join(shims, "fastANI")
+    )
+    files = write_genomes(tmp_path)
+    index = SketchIndex.build(files[1:])
+    placed = index.place(files[0], top_k=2, output_dir=str(tmp_path / "placement"))
+
+    assert list(placed.index) == ["genome_1", "genome_2"]
+    assert placed["ani_fastani"].iloc[0] > placed["ani_fastani"].iloc[1]
+    with open(tmp_path / "placement" / "genome_0_fastani_out") as f:
+        assert len(f.readlines()) == 2
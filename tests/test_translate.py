@@ -0,0 +1,80 @@
+import random
+import abacat
+from Bio.Seq import Seq
+from abacat.translate import translate, translate_fasta
+from tests.test_collection import write_genome
+
+"""
+Module for testing the in-process translation of genes, and blastp searches of proteins.
+"""
+
+# Stand-in for blastp: keeps its query, and every first gene of a contig hits a Ribulokinase.
+BLASTP = """#!/usr/bin/env python
+import sys
+import shutil
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+shutil.copyfile(args["-query"], args["-out"] + ".query")
+queries = [i[1:].split()[0] for i in open(args["-query"]) if i.startswith(">")]
+with open(args["-out"], "w") as f:
+    for query in queries:
+        if query.endswith("_1"):
+            f.write(f"{query}\\tref\\t99.0\\t99\\t1\\t0\\t1\\t99\\t1\\t99\\t1e-60\\t200\\tarabinose.Ribulokinase.1\\n")
+"""
+
+
+def test_translate():
+    """
+    :return: asserts that translations match Biopython's, with start codons as 'M'.
+    """
+    rng = random.Random(0)
+    seqs = [
+        "".join(rng.choice("ACGT") for _ in range(rng.randint(0, 400)))
+        for _ in range(200)
+    ]
+    for seq, protein in zip(seqs, translate(seqs)):
+        assert protein == str(Seq(seq[: len(seq) // 3 * 3]).translate(table=11))
+
+    assert translate(["GTGAAATAA", "GTGAAATAA"], starts=[True, False]) == [
+        "MK*",
+        "VK*",
+    ]
+    assert translate(["ATGNNNTAA"]) == ["MX*"] and translate([]) == []
+
+
+def test_translate_fasta(tmp_path):
+    """
+    :return: asserts that proteins keep the gene headers, and edge genes keep their first residue.
+    """
+    genes = tmp_path / "genes.fna"
+    genes.write_text(
+        ">c_1 # 1 # 9 # 1 # ID=1_1;partial=00;start_type=TTG\nTTGAAATAA\n"
+        ">c_2 # 10 # 18 # 1 # ID=1_2;partial=10;start_type=Edge\nTTGAAATAA\n"
+    )
+    assert translate_fasta(str(genes), str(tmp_path / "proteins.faa")) == 2
+    assert (tmp_path / "proteins.faa").read_text() == (
+        ">c_1 # 1 # 9 # 1 # ID=1_1;partial=00;start_type=TTG\nMK*\n"
+        ">c_2 # 10 # 18 # 1 # ID=1_2;partial=10;start_type=Edge\nLK*\n"
+    )
+
+
+def test_run_pathways_blastp(tmp_path, stand_ins, database):
+    """
+    :return: asserts that blastp searches the translated genes, and hits go back to the gene ids.
+    """
+    stand_ins("blastp", BLASTP)
+    database("phenotyping", dbtype="prot")
+
+    genomes = tmp_path / "genomes"
+    genomes.mkdir()
+    write_genome(str(genomes), "genome_0")
+    genome = abacat.from_directory(str(genomes))["genome_0"]
+    genome.run_pathways(info=False)
+
+    assert genome.pathways["L-arabinose"] == [
+        "genome_0_contig_1 arabinose.Ribulokinase.1"
+    ]
+    query = genome.files["phenotyping"]["alignments"] + ".query"
+    with open(query) as f:
+        proteins = f.read().split()
+    assert proteins[0] == ">genome_0_contig_1" and set(proteins[-1]) - set("ACGT")
+    assert not list(genomes.glob("*_translated.faa"))